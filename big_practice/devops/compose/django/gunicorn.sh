@@ -1,3 +1,3 @@
 #!/bin/sh
 python /code/manage.py collectstatic --noinput
-/usr/local/bin/gunicorn config.wsgi -w 4 -b 0.0.0.0:5000 --chdir=/code
+/usr/local/bin/gunicorn config.wsgi -w 4 --worker-class gthread --threads 4 -b 0.0.0.0:5000 --chdir=/code
@@ -0,0 +1,162 @@
+"""Employee ids bucketed by age in Redis."""
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from ..commons.bulk import in_bulk_write
+from .models import Employee
+
+# Ages which have a bucket, employees of other ages are not listed.
+MIN_AGE = 0
+MAX_AGE = 150
+
+# Move an id to the bucket of its new age atomically. Bucket keys are built
+# from the age stored in the hash, so they can not all be passed as KEYS and
+# the cache must be a single Redis node, see CACHES.
+MOVE_SCRIPT = """
+local old = redis.call('HGET', KEYS[1], ARGV[2])
+if old then
+    redis.call('ZREM', ARGV[1] .. old, ARGV[2])
+end
+if ARGV[3] == '' then
+    redis.call('HDEL', KEYS[1], ARGV[2])
+else
+    redis.call('ZADD', ARGV[1] .. ARGV[3], ARGV[2], ARGV[2])
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+end
+"""
+
+# Count the ids of the buckets in KEYS and read one page of them, in age
+# then id order, without merging the buckets.
+PAGE_SCRIPT = """
+local offset = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local total = 0
+local ids = {}
+for _, key in ipairs(KEYS) do
+    local size = redis.call('ZCARD', key)
+    if #ids < limit and total + size > offset then
+        local start = math.max(offset - total, 0)
+        local page = redis.call('ZRANGE', key, start, start + limit - #ids - 1)
+        for _, id in ipairs(page) do
+            ids[#ids + 1] = id
+        end
+    end
+    total = total + size
+end
+return {total, ids}
+"""
+
+
+class AgeBuckets(object):
+    """Sorted sets of employee ids, one per age.
+
+    A hash remembers the bucket of each id so saves move ids between
+    buckets. Reading a page of an age range costs one ``ZCARD`` per age and
+    one ``ZRANGE`` per bucket of the page, whatever the number of employees.
+    """
+
+    def __init__(self, key_prefix='employee_ages'):
+        """Initialize."""
+
+        self.bucket_prefix = key_prefix + ':bucket:'
+        self.ages_key = key_prefix + ':age'
+        self._move_script = None
+        self._page_script = None
+
+    @property
+    def redis(self):
+        return get_redis_connection('default')
+
+    def bucket_key(self, age):
+        return '%s%d' % (self.bucket_prefix, age)
+
+    def update(self, employee_id, age, client=None):
+        """Put an employee in the bucket of its age, None removes it."""
+
+        if self._move_script is None:
+            self._move_script = self.redis.register_script(MOVE_SCRIPT)
+        if age is not None and not MIN_AGE <= age <= MAX_AGE:
+            age = None
+        self._move_script(
+            keys=[self.ages_key],
+            args=[self.bucket_prefix, employee_id, '' if age is None else age],
+            client=client)
+
+    def update_many(self, rows):
+        """Update ``(employee_id, age)`` pairs in one round trip."""
+
+        pipe = self.redis.pipeline(transaction=False)
+        for employee_id, age in rows:
+            self.update(employee_id, age, client=pipe)
+        pipe.execute()
+
+    def remove(self, employee_id):
+        self.update(employee_id, None)
+
+    def page(self, min_age, max_age, offset, limit):
+        """Get the number of employees in an age range and a page of ids."""
+
+        if self._page_script is None:
+            self._page_script = self.redis.register_script(PAGE_SCRIPT)
+        keys = [self.bucket_key(age)
+                for age in range(max(min_age, MIN_AGE), min(max_age, MAX_AGE) + 1)]
+        if not keys:
+            return 0, []
+        total, ids = self._page_script(keys=keys, args=[offset, limit])
+        return total, [int(employee_id) for employee_id in ids]
+
+    def clear(self):
+        keys = list(self.redis.scan_iter(self.bucket_prefix + '*'))
+        self.redis.delete(self.ages_key, *keys)
+
+
+class EmployeeAgeRange(object):
+    """Employees of an age range as sliced by tastypie paginators."""
+
+    def __init__(self, buckets, min_age, max_age):
+        """Initialize."""
+
+        self.buckets = buckets
+        self.min_age = min_age
+        self.max_age = max_age
+
+    def count(self):
+        total, _ = self.buckets.page(self.min_age, self.max_age, 0, 0)
+        return total
+
+    def __getitem__(self, k):
+        start = k.start or 0
+        stop = self.count() if k.stop is None else k.stop
+        _, ids = self.buckets.page(self.min_age, self.max_age, start, stop - start)
+        employees = Employee.objects.select_related('user').in_bulk(ids)
+        return [employees[employee_id] for employee_id in ids if employee_id in employees]
+
+
+age_buckets = AgeBuckets()
+
+
+def update_age_bucket(sender, instance, using=None, **kwargs):
+    """Move a saved employee to the bucket of its age once committed.
+
+    Callbacks of concurrent saves may run in any order, so each one moves
+    the employee to the age committed last rather than the age it saved.
+    """
+
+    if in_bulk_write():
+        return
+    employee_id = instance.pk
+
+    def move():
+        ages = Employee.objects.using(using).filter(pk=employee_id).values_list('age', flat=True)
+        age_buckets.update(employee_id, next(iter(ages), None))
+    transaction.on_commit(move)
+
+
+def remove_age_bucket(sender, instance, **kwargs):
+    """Remove a deleted employee from its bucket once committed."""
+
+    if in_bulk_write():
+        return
+    # The primary key is cleared once the object is deleted
+    employee_id = instance.pk
+    transaction.on_commit(lambda: age_buckets.remove(employee_id))
@@ -1,26 +1,42 @@
 from datetime import datetime, timedelta
+import json
+import uuid
 
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import logout
+from django.contrib.auth.signals import user_logged_in
 from django.conf.urls import url
 from django.db import transaction
 from django.db import IntegrityError
-from django.core.cache import cache
-from django.conf import settings
+from django.http import StreamingHttpResponse
 
-from tastypie.resources import ModelResource
+from tastypie.resources import ModelResource, Resource
 from tastypie.authorization import Authorization
 from tastypie.utils import trailing_slash
 from tastypie.http import HttpUnauthorized
-from tastypie.models import ApiKey
 from tastypie.validation import Validation
 
-from haystack.query import SearchQuerySet
 import jwt
 
 from ..commons.custom_exception import CustomBadRequest
 from ..commons.authentication import AccessTokenAuthentication
+from ..commons.bulk import BulkWriteMixin
+from ..commons.hashing import HashingBusy, hashing_service
+from ..commons.identity_map import identity_map
+from ..commons.revocation import revocation_list
+from ..commons.conditional import ConditionalGetMixin
+from ..commons.fieldsets import SparseFieldsMixin
+from ..commons.pagination import CursorPaginator
+from ..commons.search import StoredFieldsMixin, TypeaheadMixin, contains, search_queryset
+from ..commons.search_cache import normalize_query
+from ..commons.streaming import StreamingListMixin, stream_response
+from ..commons.token_cache import token_cache
+from .age_buckets import MAX_AGE, MIN_AGE, EmployeeAgeRange, age_buckets
+from .export import EXPORT_CONTENT_TYPES, export_directory
+from .importer import EmployeeImporter, read_rows
 from .models import Employee
+from .search_indexes import user_name
+from .summary import apply_changes, employee_values, loaded_values, summary_report
 from .signals import * # noqa
 from ..commons.constants import JWT_AUTH
 
@@ -75,25 +91,34 @@ class FileSizeValidation(Validation):
         return errors
 
 
-class EmployeeResource(ModelResource):
+class EmployeeResource(BulkWriteMixin, StreamingListMixin, ConditionalGetMixin,
+                       SparseFieldsMixin, StoredFieldsMixin, TypeaheadMixin, ModelResource):
     """Employee model resources"""
 
+    typeahead_field = 'name_auto'
+    typeahead_display = 'name'
+    sparse_fields = {'user': ('user__id', 'user__first_name', 'user__last_name')}
+    search_sparse_fields = {'user': ('user_id', 'user_first_name', 'user_last_name'),
+                            'email': ('email',), 'department': ('department',)}
+    bulk_fields = ('first_name', 'last_name', 'age', 'department')
+
     class Meta(object):
         """Employee model resource meta data."""
 
-        queryset = Employee.objects.all()
+        queryset = Employee.objects.select_related('user')
         fields = ['first_name', 'last_name', 'age']
-        allowed_methods = ['get', 'post', 'put', 'delete']
+        allowed_methods = ['get', 'post', 'put', 'patch', 'delete']
         resource_name = 'employee'
         authentication = AccessTokenAuthentication()
         authorization = Authorization()
         always_return_data = True
         include_resource_uri = False
+        paginator_class = CursorPaginator
 
     def hydrate(self, bundle):
         """Tastypie hydrate method."""
 
-        employee = User.objects.filter(id=bundle.request.user.id).first()
+        employee = identity_map.get(User, bundle.request.user.id)
         bundle.data['user'] = {
             'id': bundle.request.user.id,
             'first_name': employee.first_name,
@@ -106,13 +131,48 @@ class EmployeeResource(ModelResource):
     def dehydrate(self, bundle):
         """Tastypie dehydrate method."""
 
-        bundle.data['user'] = {
-            'id': bundle.obj.user.id,
-            'name': str(bundle.obj.user.first_name) + " " + str(bundle.obj.user.last_name)
-        }
+        if self.wants_field(bundle, 'user'):
+            bundle.data['user'] = {
+                'id': bundle.obj.user.id,
+                'name': user_name(bundle.obj.user.first_name, bundle.obj.user.last_name)
+            }
 
         return bundle
 
+    def bulk_applied(self, created, updated, deleted):
+        """Count the written employees in the summary."""
+
+        apply_changes([(None, employee_values(employee)) for employee in created] +
+                      [(loaded_values(employee), employee_values(employee))
+                       for employee in updated] +
+                      [(loaded_values(employee), None) for employee in deleted])
+
+    def bulk_written(self, saved, deleted, removals):
+        """Move the written employees between age buckets in one round trip."""
+
+        super(EmployeeResource, self).bulk_written(saved, deleted, removals)
+        age_buckets.update_many([(employee.pk, employee.age) for employee in saved] +
+                                [(employee.pk, None) for employee in deleted])
+
+    def search_result_data(self, result):
+        """List representation of an employee from its stored fields."""
+
+        # Results of the database backend carry the requested fields only
+        stored = dict((name, getattr(result, name, None)) for name in (
+            'first_name', 'last_name', 'age', 'email', 'department', 'user_id', 'user_name'))
+        return {
+            'id': int(result.pk),
+            'first_name': stored['first_name'],
+            'last_name': stored['last_name'],
+            'age': stored['age'],
+            'email': stored['email'],
+            'department': stored['department'],
+            'user': {
+                'id': stored['user_id'],
+                'name': stored['user_name']
+            }
+        }
+
     def prepend_urls(self):
         """Api urls."""
 
@@ -120,9 +180,19 @@ class EmployeeResource(ModelResource):
             url(r"^(?P<resource_name>%s)/young%s$" %
                 (self._meta.resource_name, trailing_slash()),
                 self.wrap_view('young'), name="api_young_employee"),
+            url(r"^(?P<resource_name>%s)/by_age%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('by_age'), name="api_employee_by_age"),
             url(r"^(?P<resource_name>%s)/search%s$" %
                 (self._meta.resource_name, trailing_slash()),
                 self.wrap_view('search'), name="api_search"),
+            url(r"^(?P<resource_name>%s)/import%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('import_employees'), name="api_import_employee"),
+            url(r"^(?P<resource_name>%s)/export%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('export_employees'), name="api_export_employee"),
+            self.typeahead_url(),
         ]
 
     def young(self, request, **kwargs):
@@ -130,49 +200,150 @@ class EmployeeResource(ModelResource):
 
         self.method_check(request, allowed=['get'])
         self._meta.authentication.is_authenticated(request)
+        return self.age_range(request, 18, 25)
 
-        if 'young_employees' in cache:
-            # Get result from cache
-            sqs_result = cache.get('young_employees')
-        else:
-            sqs_result = SearchQuerySet().filter(
-                age__range=[18, 25]).models(Employee).load_all()
-            cache.set('young_employees', sqs_result, timeout=settings.CACHE_TTL)
-        return self.paginator(request, sqs_result)
+    def by_age(self, request, **kwargs):
+        """Get employees with age from ``min`` to ``max`` ordered by age."""
 
-    def search(self, request, **kwargs):
         self.method_check(request, allowed=['get'])
         self._meta.authentication.is_authenticated(request)
         self.throttle_check(request)
 
-        q = str(request.GET.get('q', ''))
-        sqs = SearchQuerySet().filter(email__contains=q).models(Employee).load_all()
+        try:
+            min_age = int(request.GET.get('min', MIN_AGE))
+            max_age = int(request.GET.get('max', MAX_AGE))
+        except ValueError:
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='min and max must be integers.')
 
         self.log_throttled_access(request)
-        return self.paginator(request, sqs)
+        return self.age_range(request, min_age, max_age)
+
+    def age_range(self, request, min_age, max_age):
+        """Helper function to paginate employees from the age buckets."""
 
-    def paginator(self, request, objects, **kwargs):
-        """Helper function to paginator result list."""
+        if 'stream' in request.GET:
+            return stream_response(
+                self, request, EmployeeAgeRange(age_buckets, min_age, max_age),
+                lambda obj: self.full_dehydrate(
+                    self.build_bundle(obj=obj, request=request), for_list=True))
 
         paginator = self._meta.paginator_class(
             request.GET,
-            objects,
-            resource_uri=self.get_resource_uri(),
+            EmployeeAgeRange(age_buckets, min_age, max_age),
+            resource_uri=request.path,
             limit=self._meta.limit,
             max_limit=self._meta.max_limit,
             collection_name=self._meta.collection_name)
         to_be_serialized = paginator.page()
 
-        # Dehydrate the bundles in preparation for serialization.
-        bundles = [self.full_dehydrate(
-            self.build_bundle(obj=obj.object, request=request))
-            for obj in to_be_serialized[self._meta.collection_name]]
-
         to_be_serialized[self._meta.collection_name] = [
-            self.full_dehydrate(bundle) for bundle in bundles]
+            self.full_dehydrate(self.build_bundle(obj=obj, request=request), for_list=True)
+            for obj in to_be_serialized[self._meta.collection_name]]
         to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
         return self.create_response(request, to_be_serialized)
 
+    def search(self, request, **kwargs):
+        self.method_check(request, allowed=['get'])
+        self._meta.authentication.is_authenticated(request)
+        self.throttle_check(request)
+
+        q = normalize_query(request.GET.get('q', ''))
+        sqs = contains(search_queryset(Employee), 'email', q)
+
+        self.log_throttled_access(request)
+        return self.cached_search(request, q, sqs)
+
+    def import_employees(self, request, **kwargs):
+        """Import employee accounts from an uploaded NDJSON or CSV file.
+
+        Progress and per row errors are streamed back as NDJSON lines.
+        """
+
+        self.method_check(request, allowed=['post'])
+        self._meta.authentication.is_authenticated(request)
+        if not request.user.is_staff:
+            raise CustomBadRequest(error_type='PERMISSION_ERROR')
+
+        content_type = request.META.get('CONTENT_TYPE', '')
+        if content_type.startswith('multipart'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                raise CustomBadRequest(error_type='MISSING_FIELD', field='file', obj='import')
+            lines = upload
+            format = 'csv' if upload.name.endswith('.csv') else 'ndjson'
+        else:
+            lines = request
+            format = 'csv' if content_type.startswith('text/csv') else 'ndjson'
+
+        events = EmployeeImporter().run(read_rows(lines, format))
+        return StreamingHttpResponse(
+            (json.dumps(event) + '\n' for event in events),
+            content_type='application/x-ndjson')
+
+    def export_employees(self, request, **kwargs):
+        """Export the employee directory as NDJSON or CSV.
+
+        ``stream`` picks the format, ``compress=gzip`` compresses it on the
+        fly. Rows are streamed from a server side cursor in constant memory.
+        """
+
+        self.method_check(request, allowed=['get'])
+        self._meta.authentication.is_authenticated(request)
+        if not request.user.is_staff:
+            raise CustomBadRequest(error_type='PERMISSION_ERROR')
+
+        kind = request.GET.get('stream', 'ndjson')
+        compress = request.GET.get('compress', '')
+        if kind not in EXPORT_CONTENT_TYPES or compress not in ('', 'gzip'):
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='stream must be one of %s and compress gzip.' %
+                ', '.join(sorted(EXPORT_CONTENT_TYPES)))
+
+        filename = 'employees.' + kind
+        if compress:
+            response = StreamingHttpResponse(
+                export_directory(kind, compress=True), content_type='application/gzip')
+            filename += '.gz'
+        else:
+            response = StreamingHttpResponse(
+                export_directory(kind), content_type=EXPORT_CONTENT_TYPES[kind])
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
+
+
+class EmployeeAnalyticsResource(Resource):
+    """Employee headcounts and ages for dashboards.
+
+    Served from the ``EmployeeSummary`` rows, one per department, age and
+    status code, so a read never scans the employee table.
+    """
+
+    class Meta(object):
+        """Employee analytics resource meta data."""
+
+        resource_name = 'employee_analytics'
+        list_allowed_methods = ['get']
+        detail_allowed_methods = []
+        authentication = AccessTokenAuthentication()
+        authorization = Authorization()
+        include_resource_uri = False
+
+    def get_list(self, request, **kwargs):
+        """Get the summary, ``age_bucket`` groups ages by that many years."""
+
+        try:
+            age_bucket = int(request.GET.get('age_bucket', 1))
+        except ValueError:
+            age_bucket = 0
+        if age_bucket < 1:
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='age_bucket must be a positive integer.')
+        return self.create_response(request, summary_report(age_bucket))
+
 
 class AuthenticationResource(MultipartResource, ModelResource):
     """Authentication resource."""
@@ -225,65 +396,62 @@ class AuthenticationResource(MultipartResource, ModelResource):
             format=request.META.get('CONTENT_TYPE', 'application/join'))
         retype_password = data.get('retype_password', None)
         if retype_password is not None:
-            return self.sign_up_by_email(request, **kwargs)
+            return self.sign_up_by_email(request, data=data, **kwargs)
         elif 'email' in data and 'password' in data:
-            return self.sign_in_by_email(request, **kwargs)
+            return self.sign_in_by_email(request, data=data, **kwargs)
         else:
             raise CustomBadRequest(error_type='UNAUTHORIZED')
 
-    def sign_in_by_email(self, request, **kwargs):
+    def sign_in_by_email(self, request, data=None, **kwargs):
         """Sign in by email api handler."""
 
-        data = self.deserialize(
-            request,
-            request.body,
-            format=request.META.get('CONTENT_TYPE', 'application/join'))
+        if data is None:
+            data = self.deserialize(
+                request,
+                request.body,
+                format=request.META.get('CONTENT_TYPE', 'application/join'))
         email = data.get('email', '')
         password = data.get('password', '')
         try:
-            user = User.objects.get(email=email)
-            if user.check_password(password):
-                if user.is_active:
-                    user = authenticate(username=email, password=password)
-                    login(request, user)
-                    access_token = None
-                    # access_token, created = Token.objects.get_or_create(user=user)
-                    payload = {
-                        'user_id': user.id,
-                        'exp': datetime.utcnow() + timedelta(
-                            seconds=JWT_AUTH.get('JWT_EXP_DELTA_SECONDS'))
-                    }
-                    access_token = jwt.encode(
-                        payload,
-                        JWT_AUTH.get('JWT_SECRET'),
-                        JWT_AUTH.get('JWT_ALGORITHM'))
-                    apikey = ApiKey.objects.filter(user=user).first()
-                    return self.create_auth_response(
-                        request=request,
-                        user=user,
-                        api_key=apikey.key,
-                        access_token=access_token)
-                else:
-                    raise CustomBadRequest(
-                        error_type='UNAUTHORIZED',
-                        error_message='Your email is not verified')
-            else:
-                raise CustomBadRequest(
-                    error_type='UNAUTHORIZED',
-                    error_message='Your password is not correct')
+            # Load user, api key and employee profile with one query
+            user = User.objects.select_related(
+                'api_key', 'employee').get(email=email)
         except User.DoesNotExist:
             raise CustomBadRequest(
                 error_type='UNAUTHORIZED',
                 error_message='Your email address is not registered. Please register')
 
-    def sign_up_by_email(self, request, **kwargs):
+        # The only password hash of the request, done off the request thread
+        try:
+            valid = hashing_service.check_password(user, password)
+        except HashingBusy:
+            raise CustomBadRequest(error_type='SERVER_BUSY')
+        if not valid:
+            raise CustomBadRequest(
+                error_type='UNAUTHORIZED',
+                error_message='Your password is not correct')
+        if not user.is_active:
+            raise CustomBadRequest(
+                error_type='UNAUTHORIZED',
+                error_message='Your email is not verified')
+
+        # Access tokens replace the session, only record the login
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
+        return self.create_auth_response(
+            request=request,
+            user=user,
+            api_key=user.api_key.key,
+            access_token=self.create_access_token(user))
+
+    def sign_up_by_email(self, request, data=None, **kwargs):
         """Sign up by email handler."""
 
         self.method_check(request, allowed=['post'])
-        data = self.deserialize(
-            request,
-            request.body,
-            format=request.META.get('CONTENT_TYPE', 'application/join'))
+        if data is None:
+            data = self.deserialize(
+                request,
+                request.body,
+                format=request.META.get('CONTENT_TYPE', 'application/join'))
         return self.create_user(request, data)
 
     def create_user(self, request, data):
@@ -293,7 +461,7 @@ class AuthenticationResource(MultipartResource, ModelResource):
         password = data.get('password', '')
         first_name = data.get('first_name', '')
         last_name = data.get('last_name', '')
-        age = data.get('age', '')
+        age = data.get('age', None)
 
         # Remove space letters in last_name and first_name
         if last_name:
@@ -307,70 +475,55 @@ class AuthenticationResource(MultipartResource, ModelResource):
                 error_type='DUPLICATE_VALUE',
                 field='email',
                 obj='email')
-        else:
-            try:
-                with transaction.atomic():
-
-                    # Create user with paramaters
-                    User.objects.create_user(
-                        username=email,
-                        email=email,
-                        password=password,
-                        first_name=first_name,
-                        last_name=last_name)
-
-                    user = authenticate(username=email, password=password)
-
-                    login(request, user)
-
-                    if user is not None:
-                        # Create employee
-                        self.create_employee(user.id, age=age)
-
-                        apikey = ApiKey.objects.filter(user=user).first()
-                        access_token = None
-
-                        # Will create access_token when user has is_active = True
-                        # Else is_active = False will send notifi to user
-                        if not user.is_active:
-                            self.create_response(
-                                request,
-                                {'success': False},
-                                HttpUnauthorized)
-                        else:
-                            # access_token, created = Token.objects.get_or_create(user=user)
-                            payload = {
-                                'user_id': user.id,
-                                'exp': datetime.utcnow() + timedelta(
-                                    seconds=JWT_AUTH.get('JWT_EXP_DELTA_SECONDS'))
-                            }
-                            access_token = jwt.encode(
-                                payload,
-                                JWT_AUTH.get('JWT_SECRET'),
-                                JWT_AUTH.get('JWT_ALGORITHM'))
-
-                        Employee.objects.filter(user__id=user.id).update(
-                            first_name=first_name,
-                            last_name=last_name)
-
-                        if access_token is not None:
-                            return self.create_auth_response(
-                                request=request,
-                                user=user,
-                                api_key=apikey.key,
-                                access_token=access_token)
-                        else:
-                            return self.create_auth_response(
-                                request=request,
-                                user=user,
-                                api_key=apikey.key,
-                                access_token=access_token)
-                    else:
-                        raise CustomBadRequest(
-                            error_type='UNKNOWN_ERROR',
-                            error_message='Cant sign up by this email.')
-            except ValueError as e:
-                raise CustomBadRequest(error_type='UNKNOWN_ERROR', error_message=str(e))
+
+        # The only password hash of the request, done off the request thread
+        try:
+            encoded_password = hashing_service.make_password(password)
+        except HashingBusy:
+            raise CustomBadRequest(error_type='SERVER_BUSY')
+
+        try:
+            with transaction.atomic():
+
+                # Create user with paramaters
+                user = User(
+                    username=email,
+                    email=email,
+                    password=encoded_password,
+                    first_name=first_name,
+                    last_name=last_name)
+                user.save()
+
+                # Create employee
+                self.create_employee(
+                    user,
+                    first_name=first_name,
+                    last_name=last_name,
+                    age=age)
+        except (ValueError, IntegrityError) as e:
+            raise CustomBadRequest(error_type='UNKNOWN_ERROR', error_message=str(e))
+
+        # Access tokens replace the session, only record the login
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
+        return self.create_auth_response(
+            request=request,
+            user=user,
+            api_key=user.api_key.key,
+            access_token=self.create_access_token(user))
+
+    def create_access_token(self, user):
+        """Provide helper function to create the access token of user."""
+
+        payload = {
+            'user_id': user.id,
+            'jti': uuid.uuid4().hex,
+            'exp': datetime.utcnow() + timedelta(
+                seconds=JWT_AUTH.get('JWT_EXP_DELTA_SECONDS'))
+        }
+        return jwt.encode(
+            payload,
+            JWT_AUTH.get('JWT_SECRET'),
+            JWT_AUTH.get('JWT_ALGORITHM'))
 
     def sign_out(self, request, **kwargs):
         """Sign out handler."""
@@ -386,19 +539,16 @@ class AuthenticationResource(MultipartResource, ModelResource):
         else:
             return self.create_response(request, {'success': False}, HttpUnauthorized)
 
-    def create_employee(self, user_id, **kwargs):
-        """Create blank employee profile base on user_id."""
+    def create_employee(self, user, **kwargs):
+        """Create employee profile of a new user."""
 
-        # Add the user_id to kwargs
-        kwargs['user_id'] = user_id
-
-        # Create employee
-        employee, _ = Employee.objects.get_or_create(user__id=user_id, defaults=kwargs)
+        employee = Employee.objects.create(user=user, **kwargs)
 
         if employee is None:
             raise CustomBadRequest(
                 error_type='UNKNOWNERROR',
                 error_message="Can't create employee")
+        return employee
 
     def logout(self, request, access_token, **kwargs):
         """Support api to get user."""
@@ -418,9 +568,12 @@ class AuthenticationResource(MultipartResource, ModelResource):
                 raise CustomBadRequest(
                     error_type='UNAUTHORIZED',
                     error_message='The token is expired')
+            # Reject the token for the rest of its lifetime
+            revocation_list.revoke(token_cache.digest(access_token), payload['exp'])
+
             # Try get user by access token in request
             try:
-                user = User.objects.get(id=payload['user_id'])
+                user = identity_map.get(User, payload['user_id'])
                 return user
             except User.DoesNotExist:
                 raise CustomBadRequest(
@@ -434,12 +587,15 @@ class AuthenticationResource(MultipartResource, ModelResource):
     def create_auth_response(self, request, user, api_key, access_token=None):
         """Genetate response data for authentication process."""
 
-        employee = Employee.objects.get(id=user.employee.id)
-
         resource_instance = EmployeeResource()
-        bundle = resource_instance.full_hydrate(
-            resource_instance.build_bundle(obj=employee, request=request))
-        bundle.data['user']['api_key'] = api_key
+        bundle = resource_instance.build_bundle(obj=user.employee, request=request)
+        bundle.data['user'] = {
+            'id': user.id,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'email': user.email,
+            'api_key': api_key
+        }
 
         if access_token:
             bundle.data['user']['access_token'] = access_token
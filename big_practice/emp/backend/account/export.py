@@ -0,0 +1,101 @@
+"""Export of the employee directory."""
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .models import Employee
+
+# Exported columns and the lookups they read
+COLUMNS = (
+    ('id', 'pk'),
+    ('first_name', 'first_name'),
+    ('last_name', 'last_name'),
+    ('email', 'user__email'),
+    ('age', 'age'),
+    ('status_code', 'status_code'),
+    ('department', 'department__name'),
+    ('created_date', 'created_date'),
+    ('modified_date', 'modified_date'),
+)
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def directory_rows(fetch_size=None, using='default'):
+    """Yield the employee directory as tuples of ``COLUMNS`` values.
+
+    On PostgreSQL the rows are read from a named server side cursor,
+    ``fetch_size`` at a time. The cursor is read inside a transaction, out
+    of one PostgreSQL would materialize it ``WITH HOLD``.
+    """
+
+    fetch_size = fetch_size or settings.EMPLOYEE_EXPORT_FETCH_SIZE
+    rows = Employee.objects.using(using).order_by('pk').values_list(
+        *[lookup for _, lookup in COLUMNS])
+    with transaction.atomic(using=using):
+        yield from rows.iterator(chunk_size=fetch_size)
+
+
+def export_lines(rows, kind='ndjson'):
+    """Write rows as NDJSON or CSV, yields one line at a time."""
+
+    names = [name for name, _ in COLUMNS]
+    if kind == 'ndjson':
+        for row in rows:
+            yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header of an empty export
+        yield buffer.getvalue()
+
+
+def export_chunks(lines, compress=False, chunk_size=None):
+    """Encode lines into chunks of about ``chunk_size`` bytes.
+
+    With ``compress`` the chunks are a gzip stream compressed on the fly.
+    """
+
+    chunk_size = chunk_size or settings.EMPLOYEE_EXPORT_CHUNK_SIZE
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            chunk = b''.join(pending)
+            pending = []
+            size = 0
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(pending)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def export_directory(kind='ndjson', compress=False, fetch_size=None):
+    """Chunks of the whole employee directory, in constant memory."""
+
+    return export_chunks(export_lines(directory_rows(fetch_size), kind), compress)
@@ -0,0 +1,248 @@
+"""Bulk import of employee accounts."""
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, connections, transaction
+from django.db.models import AutoField
+from django.db.models.functions import Upper
+
+from tastypie.models import ApiKey
+
+from ..commons.hashing import HashingService
+from ..commons.indexing import update_objects
+from .age_buckets import age_buckets
+from .models import Employee
+from .summary import apply_changes, employee_values
+
+
+def read_rows(lines, format='ndjson'):
+    """Parse uploaded lines, yields ``(row_number, data)`` pairs.
+
+    ``data`` is a dict of the row or a string describing why it can not be
+    parsed.
+    """
+
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line
+             for line in lines)
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), 1):
+            yield number, row
+        return
+
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            yield number, 'Invalid JSON'
+            continue
+        if not isinstance(data, dict):
+            yield number, 'Row must be an object'
+        else:
+            yield number, data
+
+
+def bulk_insert(model, objs, using='default'):
+    """Insert rows which no one reads back, with COPY on PostgreSQL."""
+
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        model.objects.using(using).bulk_create(objs)
+        return
+
+    fields = [field for field in model._meta.concrete_fields
+              if not isinstance(field, AutoField)]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objs:
+        values = [field.get_db_prep_save(field.pre_save(obj, True), connection)
+                  for field in fields]
+        writer.writerow(['\\N' if value is None else value for value in values])
+    buffer.seek(0)
+
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '\\N')" % (
+                quote_name(model._meta.db_table),
+                ', '.join(quote_name(field.column) for field in fields)),
+            buffer)
+
+
+class EmployeeImporter(object):
+    """Create users, api keys and employees from rows in chunks.
+
+    Each chunk is validated with one query, its passwords are hashed in
+    parallel and its rows are inserted in bulk inside one transaction. No
+    per row signal runs, api keys and summary counts are written here and
+    the search index and age buckets are updated once per chunk. ``run``
+    yields progress and error events.
+    """
+
+    def __init__(self, chunk_size=None, hashing_service=None):
+        """Initialize."""
+
+        self.chunk_size = chunk_size or settings.EMPLOYEE_IMPORT_CHUNK_SIZE
+        # A pool of its own is shut down once the import is done
+        self.owns_hashing_service = hashing_service is None
+        self.hashing_service = hashing_service or HashingService(
+            workers=settings.EMPLOYEE_IMPORT_HASHING_WORKERS)
+        self.seen_emails = set()
+        self.created = 0
+        self.processed = 0
+        self.failed = 0
+
+    def progress(self, type='progress'):
+        return {
+            'type': type,
+            'processed': self.processed,
+            'created': self.created,
+            'failed': self.failed
+        }
+
+    def error(self, number, errors):
+        self.failed += 1
+        return {'type': 'error', 'row': number, 'errors': errors}
+
+    def run(self, rows):
+        """Import ``(row_number, data)`` pairs given by ``read_rows``."""
+
+        try:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    for event in self.import_chunk(chunk):
+                        yield event
+                    chunk = []
+            if chunk:
+                for event in self.import_chunk(chunk):
+                    yield event
+            yield self.progress('done')
+        finally:
+            if self.owns_hashing_service:
+                self.hashing_service.shutdown()
+
+    def clean(self, data):
+        """Validate one row, returns the cleaned row and the errors."""
+
+        errors = {}
+        email = str(data.get('email') or '').strip()
+        try:
+            validate_email(email)
+        except ValidationError:
+            errors['email'] = 'Enter a valid email address.'
+
+        password = data.get('password') or ''
+        if not password:
+            errors['password'] = 'This field is required.'
+
+        age = data.get('age')
+        if age in ('', None):
+            age = None
+        else:
+            try:
+                age = int(age)
+                if not 0 < age < 150:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors['age'] = 'Enter a valid age.'
+
+        return {
+            'email': email,
+            'password': password,
+            'first_name': str(data.get('first_name') or '').strip(),
+            'last_name': str(data.get('last_name') or '').strip(),
+            'age': age
+        }, errors
+
+    def import_chunk(self, chunk):
+        """Validate and insert one chunk of rows."""
+
+        valid = []
+        for number, data in chunk:
+            self.processed += 1
+            if not isinstance(data, dict):
+                yield self.error(number, {'row': data})
+                continue
+            row, errors = self.clean(data)
+            if not errors and row['email'].lower() in self.seen_emails:
+                errors['email'] = 'Duplicated in the import.'
+            if errors:
+                yield self.error(number, errors)
+                continue
+            self.seen_emails.add(row['email'].lower())
+            valid.append((number, row))
+
+        # Check emails already registered with one query, answered by the
+        # UPPER(email) index of auth_user
+        registered = set(email.lower() for email in User.objects.annotate(
+            email_upper=Upper('email')).filter(
+            email_upper__in=[row['email'].upper() for _, row in valid]
+        ).values_list('email', flat=True))
+        rows = []
+        for number, row in valid:
+            if row['email'].lower() in registered:
+                yield self.error(number, {'email': 'This email is already exits.'})
+            else:
+                rows.append((number, row))
+
+        if rows:
+            passwords = self.hashing_service.make_passwords(
+                [row['password'] for _, row in rows])
+            try:
+                user_ids = self.insert(
+                    [row for _, row in rows], passwords)
+            except DatabaseError as e:
+                for number, _ in rows:
+                    yield self.error(number, {'database': str(e)})
+            else:
+                self.created += len(user_ids)
+                # One batched index and age buckets update instead of one per row
+                employees = list(
+                    Employee.objects.select_related('user').filter(user_id__in=user_ids))
+                update_objects(Employee, employees)
+                age_buckets.update_many((employee.pk, employee.age) for employee in employees)
+
+        yield self.progress()
+
+    def insert(self, rows, passwords):
+        """Insert users, api keys and employees of valid rows."""
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=row['email'],
+                    email=row['email'],
+                    password=password,
+                    first_name=row['first_name'],
+                    last_name=row['last_name'])
+                for row, password in zip(rows, passwords)])
+
+            if users[0].pk is None:
+                # Only PostgreSQL returns the ids of bulk inserted rows
+                ids = dict(User.objects.filter(
+                    username__in=[user.username for user in users]
+                ).values_list('username', 'id'))
+                for user in users:
+                    user.pk = ids[user.username]
+
+            bulk_insert(ApiKey, [ApiKey(user=user, key=ApiKey().generate_key())
+                                 for user in users])
+            employees = [
+                Employee(
+                    user=user,
+                    first_name=row['first_name'],
+                    last_name=row['last_name'],
+                    age=row['age'])
+                for row, user in zip(rows, users)]
+            bulk_insert(Employee, employees)
+            apply_changes([(None, employee_values(employee)) for employee in employees])
+        return [user.pk for user in users]
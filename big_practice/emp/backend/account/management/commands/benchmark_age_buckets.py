@@ -0,0 +1,49 @@
+"""Benchmark age range pages read from the age buckets."""
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.account.age_buckets import AgeBuckets
+
+
+class Command(BaseCommand):
+    help = ('Measure the time to read a page of an age range while the '
+            'number of bucketed employees grows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000,100000,500000',
+            help='Comma separated numbers of employees.')
+        parser.add_argument('--pages', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        buckets = AgeBuckets(key_prefix='benchmark:employee_ages')
+        buckets.clear()
+        rng = random.Random(0)
+        employees = 0
+
+        self.stdout.write('employees  p50_us  p95_us  mean_us')
+        try:
+            for size in [int(size) for size in options['sizes'].split(',')]:
+                while employees < size:
+                    chunk = range(employees, min(size, employees + 10000))
+                    buckets.update_many((number, rng.randint(18, 65)) for number in chunk)
+                    employees += len(chunk)
+
+                timings = []
+                for _ in range(options['pages']):
+                    min_age = rng.randint(18, 65)
+                    max_age = rng.randint(min_age, 65)
+                    started = time.time()
+                    total, _ = buckets.page(min_age, max_age, 0, 0)
+                    buckets.page(min_age, max_age, rng.randint(0, max(total - 1, 0)),
+                                 options['page_size'])
+                    timings.append((time.time() - started) * 1000000)
+                timings.sort()
+                self.stdout.write('%9d  %6d  %6d  %7d' % (
+                    size, timings[len(timings) // 2],
+                    timings[int(len(timings) * 0.95)], sum(timings) / len(timings)))
+        finally:
+            buckets.clear()
@@ -0,0 +1,48 @@
+"""Benchmark the access token revocation check."""
+import hashlib
+import time
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from backend.commons.revocation import RevocationList
+
+
+class Command(BaseCommand):
+    help = ('Measure the per-request cost of the revocation check while the '
+            'number of revoked tokens grows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='0,1000,10000,50000',
+            help='Comma separated numbers of revoked tokens.')
+        parser.add_argument('--checks', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        revocations = RevocationList(key_prefix='benchmark:revoked_tokens')
+        revocations.clear()
+        exp = time.time() + 3600
+        valid = hashlib.sha256(b'valid token').hexdigest()
+        revoked = 0
+
+        self.stdout.write('revoked_tokens  valid_check_us  revoked_check_us')
+        try:
+            for size in [int(size) for size in options['sizes'].split(',')]:
+                while revoked < size:
+                    revocations.revoke(
+                        hashlib.sha256(str(revoked).encode('utf-8')).hexdigest(), exp)
+                    revoked += 1
+                revocations.sync()
+                last = hashlib.sha256(str(max(revoked - 1, 0)).encode('utf-8')).hexdigest()
+
+                valid_us = self.measure(revocations, valid, options['checks'])
+                revoked_us = self.measure(revocations, last, options['checks'])
+                self.stdout.write('%14d  %14.2f  %16.2f' % (size, valid_us, revoked_us))
+        finally:
+            revocations.clear()
+
+    def measure(self, revocations, digest, checks):
+        """Helper function to get the mean check time in microseconds."""
+
+        seconds = timeit.timeit(lambda: revocations.is_revoked(digest), number=checks)
+        return seconds / checks * 1000000
@@ -0,0 +1,88 @@
+"""Compare search latency of the Whoosh index and PostgreSQL."""
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from haystack.query import SearchQuerySet
+from haystack.utils import get_identifier
+
+from backend.account.models import Employee
+from backend.commons.database_search import DatabaseSearchQuerySet, get_database_index
+from backend.commons.indexing import update_objects, write_batch
+from backend.commons.search import contains
+
+PREFIX = 'benchmark-search-'
+NAMES = ['an', 'binh', 'chau', 'dung', 'giang', 'hoa', 'khanh', 'linh', 'minh',
+         'nam', 'phuong', 'quang', 'son', 'thao', 'trang', 'tuan', 'uyen', 'vu']
+
+
+class Command(BaseCommand):
+    help = ('Create synthetic employees and measure the search, young and '
+            'typeahead queries on the Whoosh index and on PostgreSQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        self.create_rows(rng, options['rows'])
+        try:
+            backends = [
+                ('whoosh', lambda: SearchQuerySet().models(Employee)),
+                ('postgres', lambda: DatabaseSearchQuerySet(get_database_index(Employee))),
+            ]
+            queries = [
+                ('search', lambda sqs, word: contains(sqs, 'email', word[1:5])),
+                ('young', lambda sqs, word: sqs.filter(age__range=[18, 25])),
+                ('typeahead', lambda sqs, word: sqs.autocomplete(name_auto=word[:3])),
+            ]
+            words = [rng.choice(NAMES) + 'x' for _ in range(options['queries'])]
+
+            self.stdout.write('query      backend   p50_ms   p95_ms  mean_ms')
+            for query_name, query in queries:
+                for backend_name, make_sqs in backends:
+                    timings = []
+                    for word in words:
+                        started = time.time()
+                        sqs = query(make_sqs(), word)
+                        sqs.count()
+                        list(sqs[:options['page_size']])
+                        timings.append((time.time() - started) * 1000)
+                    timings.sort()
+                    self.stdout.write('%-10s %-8s %8.2f %8.2f %8.2f' % (
+                        query_name, backend_name,
+                        timings[len(timings) // 2],
+                        timings[int(len(timings) * 0.95)],
+                        sum(timings) / len(timings)))
+        finally:
+            self.delete_rows()
+
+    def create_rows(self, rng, rows):
+        """Insert and index synthetic employees."""
+
+        self.delete_rows()
+        User.objects.bulk_create([
+            User(username='%s%d' % (PREFIX, number),
+                 email='%s.%s%d@example.com' % (rng.choice(NAMES), rng.choice(NAMES), number),
+                 first_name=rng.choice(NAMES).title(),
+                 last_name=rng.choice(NAMES).title())
+            for number in range(rows)])
+        users = User.objects.filter(username__startswith=PREFIX)
+        Employee.objects.bulk_create([
+            Employee(user=user, first_name=user.first_name, last_name=user.last_name,
+                     age=rng.randint(18, 65))
+            for user in users.only('first_name', 'last_name')])
+
+        employees = Employee.objects.filter(user__username__startswith=PREFIX)
+        update_objects(Employee, employees.select_related('user', 'department'))
+        self.stdout.write('%d synthetic employees indexed' % employees.count())
+
+    def delete_rows(self):
+        employees = Employee.objects.filter(user__username__startswith=PREFIX)
+        write_batch({}, [get_identifier(employee) for employee in employees.only('pk')])
+        employees.delete()
+        User.objects.filter(username__startswith=PREFIX).delete()
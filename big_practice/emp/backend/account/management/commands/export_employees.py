@@ -0,0 +1,38 @@
+"""Export the employee directory to a NDJSON or CSV file."""
+import sys
+
+from django.core.management.base import BaseCommand
+
+from backend.account.export import export_directory
+
+
+class Command(BaseCommand):
+    help = 'Export the employee directory to a NDJSON or CSV file, "-" writes stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=['ndjson', 'csv'],
+            help='Defaults to csv for .csv and .csv.gz files and ndjson otherwise.')
+        parser.add_argument(
+            '--gzip', action='store_true',
+            help='Compress the export, the default for .gz files.')
+        parser.add_argument('--fetch-size', type=int)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        name = path[:-len('.gz')] if path.endswith('.gz') else path
+        kind = options['format'] or ('csv' if name.endswith('.csv') else 'ndjson')
+        compress = options['gzip'] or path.endswith('.gz')
+        output = sys.stdout.buffer if path == '-' else open(path, 'wb')
+
+        size = 0
+        try:
+            for chunk in export_directory(kind, compress, options['fetch_size']):
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+        if output is not sys.stdout.buffer:
+            self.stdout.write('%d bytes written to %s' % (size, path))
@@ -0,0 +1,36 @@
+"""Import employee accounts from a NDJSON or CSV file."""
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from backend.account.importer import EmployeeImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import employee accounts from a NDJSON or CSV file, "-" reads stdin.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=['ndjson', 'csv'],
+            help='Defaults to csv for .csv files and ndjson otherwise.')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        lines = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+
+        importer = EmployeeImporter(chunk_size=options['chunk_size'])
+        try:
+            for event in importer.run(read_rows(lines, format)):
+                if event['type'] == 'error':
+                    self.stderr.write(json.dumps(event))
+                else:
+                    self.stdout.write(
+                        '%(type)s: %(processed)d rows processed, '
+                        '%(created)d created, %(failed)d failed' % event)
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
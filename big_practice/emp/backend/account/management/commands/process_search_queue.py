@@ -0,0 +1,30 @@
+"""Write queued search index updates in batches."""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.commons.search_queue import search_queue
+
+
+class Command(BaseCommand):
+    help = 'Drain the search queue filled by QueuedSignalProcessor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty instead of polling it.')
+
+    def handle(self, *args, **options):
+        while True:
+            # Batches of stopped workers, checked whenever the queue is drained
+            search_queue.requeue_dead()
+            processed = search_queue.process(options['batch_size'])
+            while processed:
+                self.stdout.write('%d queued updates indexed, %d waiting' % (
+                    processed, len(search_queue)))
+                processed = search_queue.process(options['batch_size'])
+            if options['once']:
+                return
+            time.sleep(settings.SEARCH_QUEUE_POLL_INTERVAL)
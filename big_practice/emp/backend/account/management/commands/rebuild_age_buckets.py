@@ -0,0 +1,26 @@
+"""Fill the employee age buckets from the database."""
+from django.core.management.base import BaseCommand
+
+from backend.account.age_buckets import age_buckets
+from backend.account.models import Employee
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis age buckets served by /employee/by_age/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        age_buckets.clear()
+        rows = []
+        count = 0
+        for row in Employee.objects.order_by().values_list('pk', 'age').iterator():
+            rows.append(row)
+            if len(rows) >= options['chunk_size']:
+                age_buckets.update_many(rows)
+                count += len(rows)
+                rows = []
+        age_buckets.update_many(rows)
+        count += len(rows)
+        self.stdout.write('%d employees bucketed' % count)
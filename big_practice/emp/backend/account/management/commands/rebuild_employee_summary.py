@@ -0,0 +1,11 @@
+"""Recount the employee summary from the database."""
+from django.core.management.base import BaseCommand
+
+from backend.account.summary import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the employee summary served by /employee_analytics/.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('%d employees summarized' % rebuild_summary())
@@ -0,0 +1,65 @@
+"""Rebuild search indexes from primary key ranges prepared in parallel."""
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from haystack import connections as haystack_connections
+
+from backend.commons.generations import GenerationError, build_generation
+from backend.commons.indexing import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Reindex every row of the indexed models with a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', dest='models',
+            help='Only rebuild this model, e.g. account.employee.')
+        parser.add_argument('--chunk-size', type=int)
+        parser.add_argument(
+            '--workers', type=int,
+            help='Processes preparing documents, 0 prepares them inline.')
+        parser.add_argument(
+            '--swap', action='store_true',
+            help='Build every index into a new generation and activate it.')
+        parser.add_argument(
+            '--keep', type=int,
+            help='Generations kept after the swap, the active one included.')
+
+    def handle(self, *args, **options):
+        if options['swap']:
+            if options['models']:
+                raise CommandError('--swap rebuilds every model')
+            self.started = time.time()
+            try:
+                generation = build_generation(
+                    options['chunk_size'], options['workers'],
+                    keep=options['keep'], report=self.report)
+            except GenerationError as e:
+                raise CommandError(str(e))
+            self.stdout.write('Generation %s is active' % generation)
+            return
+
+        indexed = haystack_connections['default'].get_unified_index().get_indexed_models()
+        if options['models']:
+            try:
+                models = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as e:
+                raise CommandError(str(e))
+            for model in models:
+                if model not in indexed:
+                    raise CommandError('%s is not indexed' % model._meta.label_lower)
+        else:
+            models = indexed
+
+        for model in models:
+            self.started = time.time()
+            self.report(model, rebuild(model, options['chunk_size'], options['workers']))
+
+    def report(self, model, count):
+        elapsed = time.time() - self.started
+        self.stdout.write('%s: %d rows indexed in %.1fs (%d rows/sec)' % (
+            model._meta.label_lower, count, elapsed, count / elapsed if elapsed else 0))
+        self.started = time.time()
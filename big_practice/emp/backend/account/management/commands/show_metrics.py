@@ -0,0 +1,22 @@
+"""Print the shared metrics counters."""
+from django.core.management.base import BaseCommand
+
+from backend.commons import metrics
+
+
+class Command(BaseCommand):
+    help = 'Print the metrics counters collected by all workers and hit ratios.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('prefix', nargs='?', default='')
+
+    def handle(self, *args, **options):
+        counters = metrics.snapshot(options['prefix'])
+        # Hit ratio of every pair of <name>.hit and <name>.miss counters
+        for name in list(counters):
+            if name.endswith('.hit'):
+                base = name[:-len('.hit')]
+                counters[base + '.hit_ratio'] = '%.3f' % metrics.ratio(
+                    counters[name], counters.get(base + '.miss', 0))
+        for name, value in sorted(counters.items()):
+            self.stdout.write('%s %s' % (name, value))
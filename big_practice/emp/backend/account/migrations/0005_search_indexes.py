@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import migrations
+
+from backend.commons.migration_sql import vendor_sql
+
+# GIN indexes answering search queries when SEARCH_BACKEND is postgres. The
+# expressions are the ones Django generates for icontains, istartswith and
+# DatabaseIndex.autocomplete lookups.
+FORWARDS = {'postgresql': [
+    'CREATE INDEX auth_user_email_trgm '
+    'ON auth_user USING gin (UPPER(email::text) gin_trgm_ops)',
+    'CREATE INDEX auth_user_username_trgm '
+    'ON auth_user USING gin (UPPER(username::text) gin_trgm_ops)',
+    'CREATE INDEX account_employee_name_tsv ON account_employee USING gin ('
+    "to_tsvector('simple'::regconfig, COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')))",
+]}
+BACKWARDS = {'postgresql': [
+    'DROP INDEX IF EXISTS auth_user_email_trgm',
+    'DROP INDEX IF EXISTS auth_user_username_trgm',
+    'DROP INDEX IF EXISTS account_employee_name_tsv',
+]}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_employee_avatar_original'),
+        ('department', '0002_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(vendor_sql(FORWARDS), vendor_sql(BACKWARDS)),
+    ]
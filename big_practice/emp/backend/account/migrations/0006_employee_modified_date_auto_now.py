@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 15:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_modified_date(apps, schema_editor):
+    """Employees never saved since creation were modified when created."""
+
+    Employee = apps.get_model('account', 'Employee')
+    Employee.objects.filter(modified_date__isnull=True).update(modified_date=F('created_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='employee',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.RunPython(fill_modified_date, migrations.RunPython.noop),
+    ]
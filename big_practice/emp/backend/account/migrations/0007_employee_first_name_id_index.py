@@ -0,0 +1,17 @@
+# Generated by Django 2.0 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0006_employee_modified_date_auto_now'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['first_name', 'id'], name='account_emp_first_n_cc6fb3_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.0 on 2026-10-18 15:38
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_summary(apps, schema_editor):
+    """Count the existing employees, later saves keep the rows up to date."""
+
+    Employee = apps.get_model('account', 'Employee')
+    EmployeeSummary = apps.get_model('account', 'EmployeeSummary')
+    rows = []
+    for dimension, field in (('department', 'department_id'), ('age', 'age'),
+                             ('status_code', 'status_code')):
+        for row in Employee.objects.order_by().values(field).annotate(
+                headcount=Count('pk'), age_count=Count('age'), age_total=Sum('age')):
+            rows.append(EmployeeSummary(
+                dimension=dimension, value='' if row[field] is None else str(row[field]),
+                headcount=row['headcount'], age_count=row['age_count'],
+                age_total=row['age_total'] or 0))
+    EmployeeSummary.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0007_employee_first_name_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('department', 'department'), ('age', 'age'), ('status_code', 'status code')], max_length=20)),
+                ('value', models.CharField(blank=True, max_length=20)),
+                ('headcount', models.IntegerField(default=0)),
+                ('age_count', models.IntegerField(default=0)),
+                ('age_total', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='employeesummary',
+            unique_together={('dimension', 'value')},
+        ),
+        migrations.RunPython(fill_summary, migrations.RunPython.noop),
+    ]
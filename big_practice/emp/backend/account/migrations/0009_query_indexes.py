@@ -0,0 +1,54 @@
+# Generated by Django 2.0 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+from backend.commons.migration_sql import vendor_sql
+
+# Indexes Django models can not declare: auth_user belongs to Django, and
+# the case insensitive email lookup of sign up runs UPPER(email) = UPPER(%s)
+# on PostgreSQL and email LIKE %s on SQLite, which needs a NOCASE index.
+ACTIVE_EMPLOYEES = (
+    'CREATE INDEX account_employee_active_idx '
+    'ON account_employee (first_name, id) WHERE status_code = 1')
+FORWARDS = {
+    'postgresql': [
+        'CREATE INDEX auth_user_email_idx ON auth_user (email)',
+        'CREATE INDEX auth_user_email_upper_idx ON auth_user (UPPER(email::text))',
+        ACTIVE_EMPLOYEES,
+    ],
+    'sqlite': [
+        'CREATE INDEX auth_user_email_idx ON auth_user (email)',
+        'CREATE INDEX auth_user_email_nocase_idx ON auth_user (email COLLATE NOCASE)',
+        ACTIVE_EMPLOYEES,
+    ],
+}
+BACKWARDS = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS auth_user_email_idx',
+        'DROP INDEX IF EXISTS auth_user_email_upper_idx',
+        'DROP INDEX IF EXISTS account_employee_active_idx',
+    ],
+    'sqlite': [
+        'DROP INDEX IF EXISTS auth_user_email_idx',
+        'DROP INDEX IF EXISTS auth_user_email_nocase_idx',
+        'DROP INDEX IF EXISTS account_employee_active_idx',
+    ],
+}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0008_employeesummary'),
+        # After every auth_user change, SQLite would drop the indexes when it
+        # rebuilds the table
+        ('auth', '0009_alter_user_last_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['age', 'id'], name='account_emp_age_75190a_idx'),
+        ),
+        migrations.RunPython(vendor_sql(FORWARDS), vendor_sql(BACKWARDS)),
+    ]
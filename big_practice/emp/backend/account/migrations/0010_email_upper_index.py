@@ -0,0 +1,25 @@
+# Generated by Django 2.0 on 2026-10-18 16:40
+
+from django.db import migrations
+
+from backend.commons.migration_sql import vendor_sql
+
+# The import checks registered emails with UPPER(email) IN (...), indexed
+# on PostgreSQL by 0009_query_indexes.
+FORWARDS = {'sqlite': [
+    'CREATE INDEX auth_user_email_upper_idx ON auth_user (UPPER(email))',
+]}
+BACKWARDS = {'sqlite': [
+    'DROP INDEX IF EXISTS auth_user_email_upper_idx',
+]}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(vendor_sql(FORWARDS), vendor_sql(BACKWARDS)),
+    ]
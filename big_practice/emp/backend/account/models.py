@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.db.models import Avg
 from django.conf import settings
 
@@ -43,6 +43,12 @@ class EmployeeManager(models.Manager):
 class Employee(models.Model):
     class Meta():
         ordering = ['first_name']
+        indexes = [
+            # Keyset pages of CursorPaginator
+            models.Index(fields=['first_name', 'id']),
+            # Age filters and ranges
+            models.Index(fields=['age', 'id']),
+        ]
 
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -84,10 +90,25 @@ class Employee(models.Model):
         format='JPEG',
         options={'quality': 70})
     created_date = models.DateTimeField(auto_now_add=True)
-    modified_date = models.DateTimeField(null=True, blank=True)
+    modified_date = models.DateTimeField(auto_now=True, null=True)
 
     objects = EmployeeManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded values, the summary counts the changes of bulk writes."""
+
+        instance = super(Employee, cls).from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save in a transaction, the summary locks the row from pre_save on."""
+
+        using = kwargs.get('using') or router.db_for_write(Employee, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super(Employee, self).save(*args, **kwargs)
+
     def full_name(self):
         """Custom full name method as a property."""
         return str(self.first_name) + ' ' + str(self.last_name)
@@ -95,3 +116,31 @@ class Employee(models.Model):
     def __str__(self):
         """Default string."""
         return self.user.email if self.user else ''
+
+
+class EmployeeSummary(models.Model):
+    """Headcount and ages of employees by department, age or status code.
+
+    ``value`` is the department id, age or status code of the row, empty
+    for employees without one. Rows are kept up to date by
+    ``account.summary`` so dashboards never scan the employee table.
+    """
+
+    class Meta:
+        unique_together = ('dimension', 'value')
+
+    DEPARTMENT = 'department'
+    AGE = 'age'
+    STATUS_CODE = 'status_code'
+    DIMENSIONS = (
+        (DEPARTMENT, 'department'),
+        (AGE, 'age'),
+        (STATUS_CODE, 'status code'),
+    )
+
+    dimension = models.CharField(max_length=20, choices=DIMENSIONS)
+    value = models.CharField(max_length=20, blank=True)
+    headcount = models.IntegerField(default=0)
+    # Employees with an age and the sum of their ages
+    age_count = models.IntegerField(default=0)
+    age_total = models.BigIntegerField(default=0)
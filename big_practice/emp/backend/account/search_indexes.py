@@ -1,17 +1,76 @@
 from haystack import indexes
+
+from ..commons.database_search import DatabaseIndex, register
 from .models import Employee
 
 
+def user_name(first_name, last_name):
+    """Name of the user of an employee as the employee resource shows it."""
+
+    return str(first_name) + " " + str(last_name)
+
+
 class EmployeeIndex(indexes.SearchIndex, indexes.Indexable):
     """EmployeeIndex haystack."""
 
     text = indexes.CharField(document=True)
     email = indexes.CharField(model_attr='user__email')
     age = indexes.IntegerField(model_attr='age', null=True)
+    # Stored only, search result pages are built from them
+    name = indexes.CharField(indexed=False)
+    first_name = indexes.CharField(model_attr='first_name', null=True, indexed=False)
+    last_name = indexes.CharField(model_attr='last_name', null=True, indexed=False)
+    user_id = indexes.IntegerField(model_attr='user_id', null=True, indexed=False)
+    user_name = indexes.CharField(null=True, indexed=False)
+    department = indexes.CharField(model_attr='department__name', null=True, indexed=False)
+    # Edge n-grams of name and email words answer typeahead prefixes
+    name_auto = indexes.EdgeNgramField()
+    # N-grams of the email answer substring searches
+    email_ngram = indexes.NgramField(model_attr='user__email')
 
     def get_model(self):
         return Employee
 
+    def prepare_name(self, obj):
+        return ' '.join(name for name in (obj.first_name, obj.last_name) if name)
+
+    def prepare_user_name(self, obj):
+        if obj.user is None:
+            return None
+        return user_name(obj.user.first_name, obj.user.last_name)
+
+    def prepare_name_auto(self, obj):
+        return ' '.join(value for value in (
+            obj.first_name, obj.last_name, obj.user.email if obj.user else None) if value)
+
     def index_queryset(self, using=None):
         """Used when the entire index for model is updated."""
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('user', 'department').only(
+            'first_name', 'last_name', 'age', 'user', 'user__email',
+            'user__first_name', 'user__last_name',
+            'department', 'department__name')
+
+
+@register
+class EmployeeDatabaseIndex(DatabaseIndex):
+    """EmployeeIndex served by PostgreSQL."""
+
+    model = Employee
+    fields = {
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'age': 'age',
+        'email': 'user__email',
+        'user_id': 'user_id',
+        'user_first_name': 'user__first_name',
+        'user_last_name': 'user__last_name',
+        'department': 'department__name'
+    }
+    vector_fields = ('first_name', 'last_name')
+    prefix_fields = ('user__email',)
+
+    def prepare(self, result):
+        result.name = ' '.join(name for name in (
+            getattr(result, 'first_name', None), getattr(result, 'last_name', None)) if name)
+        if getattr(result, 'user_first_name', None) is not None:
+            result.user_name = user_name(result.user_first_name, result.user_last_name)
@@ -1,5 +1,40 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from tastypie.models import create_api_key
 
+from ..commons.token_cache import invalidate_user_tokens
+from .age_buckets import remove_age_bucket, update_age_bucket
+from .models import Employee
+from .summary import remember_values, remove_department, remove_from_summary, update_summary
+from ..department.models import Department
+
+# Fields of the user EmployeeResource serializes
+EMPLOYEE_USER_FIELDS = ('first_name', 'last_name')
+
+
+def touch_employee(sender, instance, created, update_fields=None, **kwargs):
+    """Mark the employee of a renamed user modified.
+
+    The ETag and Last-Modified of employees come from their modified_date,
+    clients would keep their copy showing the former name.
+    """
+
+    if created or kwargs.get('raw'):
+        return
+    if update_fields is not None and not set(EMPLOYEE_USER_FIELDS) & set(update_fields):
+        return
+    Employee.objects.filter(user=instance).update(modified_date=timezone.now())
+
+
 models.signals.post_save.connect(create_api_key, sender=User)
+models.signals.post_save.connect(invalidate_user_tokens, sender=User)
+models.signals.post_delete.connect(invalidate_user_tokens, sender=User)
+models.signals.post_save.connect(touch_employee, sender=User)
+models.signals.post_save.connect(update_age_bucket, sender=Employee)
+models.signals.post_delete.connect(remove_age_bucket, sender=Employee)
+models.signals.pre_save.connect(remember_values, sender=Employee)
+models.signals.pre_delete.connect(remember_values, sender=Employee)
+models.signals.post_save.connect(update_summary, sender=Employee)
+models.signals.post_delete.connect(remove_from_summary, sender=Employee)
+models.signals.post_delete.connect(remove_department, sender=Department)
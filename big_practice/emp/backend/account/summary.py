@@ -0,0 +1,221 @@
+"""Employee counters by department, age and status code."""
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Count, F, Sum
+
+from ..commons.bulk import in_bulk_write
+from ..department.models import Department
+from .models import Employee, EmployeeSummary
+
+# Summary dimension of each employee field
+DIMENSIONS = (
+    (EmployeeSummary.DEPARTMENT, 'department_id'),
+    (EmployeeSummary.AGE, 'age'),
+    (EmployeeSummary.STATUS_CODE, 'status_code'),
+)
+FIELDS = [attname for _, attname in DIMENSIONS]
+
+
+def employee_values(employee):
+    """Current summarized values of an employee."""
+
+    return dict((attname, getattr(employee, attname)) for attname in FIELDS)
+
+
+def loaded_values(employee):
+    """Summarized values of an employee when it was loaded, None if unknown.
+
+    Deferred fields were not saved either, so they are read as they are.
+    """
+
+    loaded = getattr(employee, '_loaded_values', None)
+    if loaded is None:
+        return None
+    return dict((attname, loaded[attname] if attname in loaded else getattr(employee, attname))
+                for attname in FIELDS)
+
+
+def summary_value(value):
+    return '' if value is None else str(value)
+
+
+def summary_deltas(changes):
+    """Sum ``(old, new)`` values of employees into changes of summary rows.
+
+    Rows map ``(dimension, value)`` to headcount, age count and age total
+    deltas, rows the changes cancel out are left out.
+    """
+
+    deltas = {}
+    for old, new in changes:
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            age = values['age']
+            for dimension, attname in DIMENSIONS:
+                delta = deltas.setdefault((dimension, summary_value(values[attname])), [0, 0, 0])
+                delta[0] += sign
+                if age is not None:
+                    delta[1] += sign
+                    delta[2] += sign * age
+    return dict((key, delta) for key, delta in deltas.items() if any(delta))
+
+
+def apply_changes(changes, using='default'):
+    """Count ``(old, new)`` employee values in the summary.
+
+    ``old`` is None for created employees and ``new`` for deleted ones.
+    Each touched row costs one ``UPDATE``, rows are updated in a fixed
+    order so concurrent transactions do not deadlock.
+    """
+
+    deltas = summary_deltas(changes)
+    if not deltas:
+        return
+    with transaction.atomic(using=using, savepoint=False):
+        for (dimension, value), delta in sorted(deltas.items()):
+            add_to_row(dimension, value, *delta, using=using)
+
+
+def add_to_row(dimension, value, headcount, age_count, age_total, using='default'):
+    """Add deltas to a summary row, created when missing."""
+
+    rows = EmployeeSummary.objects.using(using).filter(dimension=dimension, value=value)
+    updates = {'headcount': F('headcount') + headcount,
+               'age_count': F('age_count') + age_count,
+               'age_total': F('age_total') + age_total}
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic(using=using):
+            EmployeeSummary.objects.using(using).create(
+                dimension=dimension, value=value, headcount=headcount,
+                age_count=age_count, age_total=age_total)
+    except IntegrityError:
+        # Created meanwhile by another transaction
+        rows.update(**updates)
+
+
+def rebuild_summary(using='default'):
+    """Recount the summary from the employee table, returns the headcount.
+
+    On PostgreSQL the summary is locked meanwhile, saves wait and count
+    their changes on top of the new rows.
+    """
+
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('LOCK TABLE %s IN EXCLUSIVE MODE' % connection.ops.quote_name(
+                    EmployeeSummary._meta.db_table))
+        EmployeeSummary.objects.using(using).all().delete()
+        rows = []
+        for dimension, attname in DIMENSIONS:
+            for row in Employee.objects.using(using).order_by().values(attname).annotate(
+                    headcount=Count('pk'), age_count=Count('age'), age_total=Sum('age')):
+                rows.append(EmployeeSummary(
+                    dimension=dimension, value=summary_value(row[attname]),
+                    headcount=row['headcount'], age_count=row['age_count'],
+                    age_total=row['age_total'] or 0))
+        EmployeeSummary.objects.using(using).bulk_create(rows)
+    return sum(row.headcount for row in rows if row.dimension == EmployeeSummary.STATUS_CODE)
+
+
+def average(age_total, age_count):
+    return round(float(age_total) / age_count, 2) if age_count else None
+
+
+def summary_report(age_bucket=1):
+    """Headcounts and ages of employees read from the summary rows.
+
+    Ages are grouped by ``age_bucket`` years, the lowest age of a bucket
+    names it.
+    """
+
+    rows = dict((dimension, []) for dimension, _ in DIMENSIONS)
+    for row in EmployeeSummary.objects.filter(headcount__gt=0).order_by('dimension', 'value'):
+        rows[row.dimension].append(row)
+
+    def key(row):
+        # Integer order, rows without a value last
+        return (row.value == '', int(row.value) if row.value else 0)
+
+    department_names = dict(Department.objects.filter(
+        pk__in=[int(row.value) for row in rows[EmployeeSummary.DEPARTMENT] if row.value]
+    ).values_list('pk', 'name'))
+    departments = [{
+        'id': int(row.value) if row.value else None,
+        'name': department_names.get(int(row.value)) if row.value else None,
+        'headcount': row.headcount,
+        'average_age': average(row.age_total, row.age_count),
+    } for row in sorted(rows[EmployeeSummary.DEPARTMENT], key=key)]
+
+    ages = []
+    for row in sorted(rows[EmployeeSummary.AGE], key=key):
+        age = int(row.value) // age_bucket * age_bucket if row.value else None
+        if ages and ages[-1]['age'] == age:
+            ages[-1]['headcount'] += row.headcount
+        else:
+            ages.append({'age': age, 'headcount': row.headcount})
+
+    statuses = rows[EmployeeSummary.STATUS_CODE]
+    return {
+        'headcount': sum(row.headcount for row in statuses),
+        'average_age': average(sum(row.age_total for row in statuses),
+                               sum(row.age_count for row in statuses)),
+        'departments': departments,
+        'ages': ages,
+        'status_codes': [{'status_code': int(row.value), 'headcount': row.headcount}
+                         for row in sorted(statuses, key=key)],
+    }
+
+
+def remember_values(sender, instance, raw=False, **kwargs):
+    """Read the stored values of an employee about to be saved or deleted.
+
+    The row is locked until the end of the transaction of the save, so the
+    values loaded with the instance, which a concurrent save may have
+    changed since, are not counted. None when there is no such row.
+    """
+
+    if raw or in_bulk_write() or instance.pk is None:
+        return
+    instance._stored_values = Employee.objects.select_for_update().filter(
+        pk=instance.pk).values(*FIELDS).first()
+
+
+def update_summary(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Count the changes of a saved employee in its transaction."""
+
+    if raw or in_bulk_write():
+        return
+    old = None if created else getattr(instance, '_stored_values', None)
+    values = employee_values(instance)
+    if old is not None and update_fields is not None:
+        # Fields left out of the save keep their stored values
+        saved = set(field.attname for field in instance._meta.concrete_fields
+                    if field.name in update_fields or field.attname in update_fields)
+        values = dict((attname, values[attname] if attname in saved else old[attname])
+                      for attname in FIELDS)
+    apply_changes([(old, values)])
+    instance._loaded_values = dict(getattr(instance, '_loaded_values', None) or {}, **values)
+
+
+def remove_from_summary(sender, instance, **kwargs):
+    if in_bulk_write():
+        return
+    old = getattr(instance, '_stored_values', None)
+    if old is not None:
+        # A row deleted meanwhile by another transaction was counted there
+        apply_changes([(old, None)])
+
+
+def remove_department(sender, instance, **kwargs):
+    """Count the employees of a deleted department as without department."""
+
+    row = EmployeeSummary.objects.filter(
+        dimension=EmployeeSummary.DEPARTMENT, value=str(instance.pk)).first()
+    if row is None:
+        return
+    row.delete()
+    add_to_row(EmployeeSummary.DEPARTMENT, '', row.headcount, row.age_count, row.age_total)
@@ -0,0 +1,31 @@
+"""Test helpers of the account app."""
+import uuid
+from unittest import mock
+
+from .age_buckets import AgeBuckets
+
+
+class TemporaryAgeBucketsMixin(object):
+    """Keep the age buckets of each test under keys of its own.
+
+    The tests share Redis with the buckets of running servers, clearing
+    ``age_buckets`` would empty theirs. ``self.age_buckets`` replaces it
+    in every module using it.
+    """
+
+    age_buckets_modules = (
+        'backend.account.age_buckets',
+        'backend.account.api',
+        'backend.account.importer',
+        'backend.account.management.commands.rebuild_age_buckets',
+    )
+
+    def setUp(self):
+        super(TemporaryAgeBucketsMixin, self).setUp()
+
+        self.age_buckets = AgeBuckets(key_prefix='test_employee_ages_' + uuid.uuid4().hex)
+        self.addCleanup(self.age_buckets.clear)
+        for module in self.age_buckets_modules:
+            patcher = mock.patch(module + '.age_buckets', self.age_buckets)
+            patcher.start()
+            self.addCleanup(patcher.stop)
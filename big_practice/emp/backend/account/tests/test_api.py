@@ -1,16 +1,48 @@
 from datetime import datetime, timedelta
-
-from django.test import TestCase
+import gzip
+import json
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.db import DatabaseError, connection, router
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.hashers import check_password, make_password
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
 from tastypie.test import ResourceTestCaseMixin
 
+from haystack import connections as haystack_connections
 import jwt
+from redis.exceptions import RedisError
 
-from ..models import Employee
+from ..models import Employee, EmployeeSummary
+from ..testing import TemporaryAgeBucketsMixin
+from backend.department.models import Department
+from backend.commons.authentication import AccessTokenAuthentication
 from backend.commons.constants import JWT_AUTH
+from backend.commons.custom_exception import CustomBadRequest
+from backend.commons.hashing import HashingBusy, HashingService, hashing_service
+from backend.commons.identity_map import identity_map
+from backend.commons.indexing import update_objects
+from backend.commons.replicas import (
+    LAG_QUERY, ReplicaLag, ReplicaRoutingMiddleware, is_pinned, pin_key, replica_lag)
+from backend.commons.revocation import RevocationList, revocation_list
+from backend.commons.search_queue import search_queue
+from backend.commons.testing import QueryBudgetMixin, QueryPlanMixin
+from backend.commons.token_cache import token_cache
+
+
+def slow_hash(seconds):
+    """Hashing operation of the pool tests."""
 
+    time.sleep(seconds)
+    return 'hash', seconds
 
-class AuthenticationResourceTestCase(ResourceTestCaseMixin, TestCase):
+
+class AuthenticationResourceTestCase(QueryPlanMixin, ResourceTestCaseMixin, TestCase):
     """Test suite for the api Authentication."""
 
     def setUp(self):
@@ -68,6 +100,12 @@ class AuthenticationResourceTestCase(ResourceTestCaseMixin, TestCase):
             'password': 'incorrect_password'
         }
 
+    def tearDown(self):
+        """Forget the tokens revoked by the test."""
+
+        revocation_list.clear()
+        super(AuthenticationResourceTestCase, self).tearDown()
+
     def get_credentials(self):
         return self.access_token
 
@@ -92,6 +130,22 @@ class AuthenticationResourceTestCase(ResourceTestCaseMixin, TestCase):
             data=self.request_body_sign_in
         ))
 
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_api_sign_up_and_sign_in_pin_user_to_primary(self):
+        """Test users signing up or in read their own writes next."""
+
+        self.assertHttpOK(self.api_client.post(
+            '/api/v1/authentication/sign_up/', format='json', data=self.post_data))
+        user = User.objects.get(email=self.post_data['email'])
+        self.addCleanup(cache.delete, pin_key(user.id))
+        self.assertTrue(is_pinned(user.id))
+
+        self.addCleanup(cache.delete, pin_key(self.user.id))
+        self.assertFalse(is_pinned(self.user.id))
+        self.assertHttpOK(self.api_client.post(
+            '/api/v1/authentication/sign_in/', format='json', data=self.request_body_sign_in))
+        self.assertTrue(is_pinned(self.user.id))
+
     def test_api_can_sign_out_with_access_token(self):
         """Test the api sign out with access token of user."""
 
@@ -101,6 +155,102 @@ class AuthenticationResourceTestCase(ResourceTestCaseMixin, TestCase):
             authentication=self.get_credentials()
         ))
 
+    def test_api_sign_in_and_sign_up_use_indexes(self):
+        """Test the api sign in and sign up look users up by email with indexes."""
+
+        for number in range(30):
+            User.objects.create_user('seed%d' % number, 'seed%d@unittest.com' % number)
+
+        def run():
+            self.assertHttpOK(self.api_client.post(
+                '/api/v1/authentication/sign_in/', format='json',
+                data=self.request_body_sign_in))
+            self.assertHttpOK(self.api_client.post(
+                '/api/v1/authentication/sign_up/', format='json', data=self.post_data))
+
+        self.assertNoSequentialScans(run)
+
+    def test_api_sign_up_query_budget(self):
+        """Test the api sign up hash the password once with a fixed number of queries."""
+
+        with mock.patch.object(hashing_service, 'workers', 0), \
+                mock.patch('backend.commons.hashing.make_password',
+                           wraps=make_password) as hasher:
+            # Exists check, user, api key, employee, last login, a savepoint pair
+            # and the department, age and status code summary rows.
+            with self.assertNumQueries(10):
+                self.assertHttpOK(self.api_client.post(
+                    '/api/v1/authentication/sign_up/',
+                    format='json',
+                    data=self.post_data))
+        self.assertEqual(hasher.call_count, 1)
+
+    def test_api_sign_in_query_budget(self):
+        """Test the api sign in hash the password once with a fixed number of queries."""
+
+        with mock.patch.object(hashing_service, 'workers', 0), \
+                mock.patch('backend.commons.hashing.check_password',
+                           wraps=check_password) as hasher:
+            # User with api key and employee, then last login.
+            with self.assertNumQueries(2):
+                self.assertHttpOK(self.api_client.post(
+                    '/api/v1/authentication/sign_in/',
+                    format='json',
+                    data=self.request_body_sign_in
+                ))
+        self.assertEqual(hasher.call_count, 1)
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            'backend.commons.hashers.ScryptPasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher'],
+        PASSWORD_SCRYPT_N=16)
+    def test_api_sign_in_upgrade_password_hasher(self):
+        """Test the api sign in rehash the password with the preferred hasher."""
+
+        self.user.password = make_password(self.password, hasher='md5')
+        self.user.save()
+
+        # Pool processes keep the settings they were forked with.
+        with mock.patch.object(hashing_service, 'workers', 0):
+            self.test_api_can_sign_in_with_email_and_password()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$16$'))
+        self.assertTrue(self.user.check_password(self.password))
+
+    def test_api_sign_in_rejected_when_hashing_is_saturated(self):
+        """Test the api sign in fail fast when the hashing pool is full."""
+
+        with mock.patch.object(hashing_service, '_slots', None):
+            self.assertHttpBadRequest(self.api_client.post(
+                '/api/v1/authentication/sign_in/',
+                format='json',
+                data=self.request_body_sign_in
+            ))
+
+    def test_timed_out_hashing_keeps_its_slot(self):
+        """Test a timed out hash counts in the queue bound until it finished."""
+
+        service = HashingService(workers=1, max_queue=1, timeout=0.05)
+        self.addCleanup(service.executor.shutdown)
+        self.assertRaises(HashingBusy, service.run, 'hash', slow_hash, 0.5)
+        with mock.patch('backend.commons.hashing.metrics.incr') as incr:
+            self.assertRaises(HashingBusy, service.run, 'hash', slow_hash, 0)
+        incr.assert_called_once_with('password_hashing.rejected')
+
+        time.sleep(1)
+        self.assertEqual(service.run('hash', slow_hash, 0), 'hash')
+
+    def test_api_reject_access_token_after_sign_out(self):
+        """Test the api reject the access token of a signed out user."""
+
+        self.test_api_can_sign_out_with_access_token()
+        self.assertHttpBadRequest(self.api_client.get(
+            '/api/v1/authentication/sign_out/',
+            format='json',
+            authentication=self.get_credentials()
+        ))
+
     def test_api_sign_in_with_incorrect_email(self):
         """Test the api sign in with incorrect email."""
 
@@ -131,7 +281,8 @@ class AuthenticationResourceTestCase(ResourceTestCaseMixin, TestCase):
             data=self.post_data))
 
 
-class EmployeeResourceTestCase(ResourceTestCaseMixin, TestCase):
+class EmployeeResourceTestCase(TemporaryAgeBucketsMixin, QueryPlanMixin, QueryBudgetMixin,
+                               ResourceTestCaseMixin, TestCase):
     """The test suite for the api Empoloyee."""
 
     def setUp(self):
@@ -191,6 +342,343 @@ class EmployeeResourceTestCase(ResourceTestCaseMixin, TestCase):
             authentication=self.get_credentials()
         ))
 
+    def test_api_get_employees_by_age_range(self):
+        """Test the api by age page employees of a range in age order."""
+
+        employees = [self.employee] + [
+            Employee.objects.create(
+                user=User.objects.create_user('age%d' % number, 'age%d@example.com' % number),
+                age=age)
+            for number, age in enumerate((30, 19, 25, 19, 60))]
+        self.age_buckets.update_many((employee.pk, employee.age) for employee in employees)
+
+        response = self.api_client.get(
+            '/api/v1/employee/by_age/?min=19&max=30&limit=2&offset=1',
+            format='json',
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        data = self.deserialize(response)
+        self.assertEqual(data['meta']['total_count'], 5)
+        self.assertEqual([obj['age'] for obj in data['objects']], [19, 23])
+        self.assertIn('/api/v1/employee/by_age/', data['meta']['next'])
+
+        self.assertHttpBadRequest(self.api_client.get(
+            '/api/v1/employee/by_age/?min=young',
+            format='json',
+            authentication=self.get_credentials()))
+
+    def create_employees(self, count):
+        for number in range(Employee.objects.count(), count):
+            employee = Employee.objects.create(
+                user=User.objects.create_user('budget%d' % number, 'budget%d@example.com' % number),
+                first_name='Budget',
+                age=20)
+            self.age_buckets.update(employee.pk, employee.age)
+
+    def test_api_employee_query_budget(self):
+        """Test the api employee lists and details cost the same queries at any size."""
+
+        for uri in ['/api/v1/employee/?limit=100',
+                    '/api/v1/employee/%d/' % self.employee.pk,
+                    '/api/v1/employee/young/?limit=100',
+                    '/api/v1/employee/by_age/?min=18&max=30&limit=100']:
+            self.assertQueryCountConstant(self.create_employees, lambda: self.api_client.get(
+                uri, format='json', authentication=self.get_credentials()))
+
+    def test_api_bulk_write_employees(self):
+        """Test the api employee move, create and delete employees with one request."""
+
+        self.create_employees(4)
+        department = Department.objects.create(name='Reorg')
+        moved = list(Employee.objects.exclude(pk=self.employee.pk).order_by('pk'))
+        search_queue.redis.delete(search_queue.key)
+        self.addCleanup(search_queue.redis.delete, search_queue.key)
+
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            response = self.api_client.patch(
+                '/api/v1/employee/', format='json', authentication=self.get_credentials(),
+                data={'objects': [{'id': employee.pk, 'department': department.pk}
+                                  for employee in moved] + [{'first_name': 'New', 'age': 30}],
+                      'deleted_objects': [self.employee.pk]})
+        self.assertHttpOK(response)
+        data = self.deserialize(response)
+        created = Employee.objects.get(first_name='New')
+        self.assertEqual(data['objects'], [{'id': employee.pk, 'status': 'updated'}
+                                           for employee in moved] +
+                         [{'id': created.pk, 'status': 'created'}])
+        self.assertEqual(data['deleted_objects'], [{'id': self.employee.pk, 'status': 'deleted'}])
+        self.assertEqual(Employee.objects.filter(department=department).count(), len(moved))
+        self.assertFalse(Employee.objects.filter(pk=self.employee.pk).exists())
+
+        # One queued batch instead of a per row update, and the age buckets
+        self.assertEqual(len(search_queue), len(moved) + 2)
+        self.assertEqual(self.age_buckets.page(30, 30, 0, 10), (1, [created.pk]))
+        self.assertEqual(self.age_buckets.page(20, 20, 0, 10)[0], len(moved))
+        self.assertEqual(EmployeeSummary.objects.get(
+            dimension='department', value=str(department.pk)).headcount, len(moved))
+        self.assertEqual(EmployeeSummary.objects.get(dimension='department', value='').headcount, 1)
+        self.assertHttpBadRequest(self.api_client.patch(
+            '/api/v1/employee/', format='json', authentication=self.get_credentials(),
+            data={'objects': [{'id': created.pk, 'department': department.pk + 1}]}))
+
+    def test_api_employee_analytics(self):
+        """Test the api employee analytics read the summary, not the employees."""
+
+        department = Department.objects.create(name='Sales')
+        Employee.objects.create(department=department, age=31, status_code=1)
+        Employee.objects.create(department=department, age=38)
+        response = self.api_client.get(
+            '/api/v1/employee_analytics/?age_bucket=10', format='json',
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertEqual(self.deserialize(response), {
+            'headcount': 3,
+            'average_age': 30.67,
+            'departments': [
+                {'id': department.pk, 'name': 'Sales', 'headcount': 2, 'average_age': 34.5},
+                {'id': None, 'name': None, 'headcount': 1, 'average_age': 23.0}],
+            'ages': [{'age': 20, 'headcount': 1}, {'age': 30, 'headcount': 2}],
+            'status_codes': [{'status_code': 0, 'headcount': 2},
+                             {'status_code': 1, 'headcount': 1}],
+        })
+
+        self.assertQueryCountConstant(self.create_employees, lambda: self.api_client.get(
+            '/api/v1/employee_analytics/', format='json', authentication=self.get_credentials()))
+        self.assertHttpBadRequest(self.api_client.get(
+            '/api/v1/employee_analytics/?age_bucket=0', format='json',
+            authentication=self.get_credentials()))
+
+    def test_api_employee_queries_use_indexes(self):
+        """Test the api employee pages and age or status filters use indexes."""
+
+        self.create_employees(30)
+
+        def get(uri):
+            response = self.api_client.get(uri, format='json', authentication=self.get_credentials())
+            self.assertHttpOK(response)
+            return self.deserialize(response)
+
+        def run():
+            page = get('/api/v1/employee/?cursor=&limit=10')
+            get(page['meta']['next'])
+            get('/api/v1/employee/%d/' % self.employee.pk)
+            list(Employee.objects.with_age_great_more_than_25())
+            list(Employee.objects.filter(age__range=(18, 25)))
+            Employee.objects.with_raw_sql_get_employees_has_status_code_is_true()
+
+        self.assertNoSequentialScans(run)
+
+    def test_api_employee_sparse_fields(self):
+        """Test the api employee read and serve only the requested fields."""
+
+        def get(uri):
+            response = self.api_client.get(uri, format='json', authentication=self.get_credentials())
+            self.assertEqual(response.status_code, 200, response.content)
+            return self.deserialize(response)
+
+        self.test_api_can_get_young_employees()
+        with CaptureQueriesContext(connection) as context:
+            data = get('/api/v1/employee/?fields=first_name,age')
+        self.assertEqual(data['objects'], [{'first_name': 'Unit', 'age': 23}])
+        query = [query['sql'] for query in context.captured_queries if 'LIMIT' in query['sql']][0]
+        self.assertNotIn('auth_user', query)
+        self.assertNotIn('last_name', query)
+
+        data = get('/api/v1/employee/%d/?fields=user' % self.employee.pk)
+        self.assertEqual(data, {'user': {'id': self.user.id, 'name': '%s %s' % (
+            self.user.first_name, self.user.last_name)}})
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Employee, Employee.objects.all())
+        data = get('/api/v1/employee/search?q=unittest&fields=email')
+        self.assertEqual(data['objects'], [{'id': self.employee.pk, 'email': self.email}])
+        with self.settings(SEARCH_BACKEND='postgres'):
+            data = get('/api/v1/employee/search?q=unittest&fields=user')
+        self.assertEqual(data['objects'], [{'id': self.employee.pk, 'user': {
+            'id': self.user.id, 'name': '%s %s' % (self.user.first_name, self.user.last_name)}}])
+
+        self.assertHttpBadRequest(self.api_client.get(
+            '/api/v1/employee/?fields=password', format='json',
+            authentication=self.get_credentials()))
+
+    def test_api_employee_not_modified_until_user_renamed(self):
+        """Test the api employee validators change when the user is renamed."""
+
+        uris = ['/api/v1/employee/%d/' % self.employee.pk, '/api/v1/employee/']
+        etags = [self.api_client.get(
+            uri, format='json', authentication=self.get_credentials())['ETag'] for uri in uris]
+
+        # Signing in saves last_login only, which no employee shows
+        self.user.save(update_fields=['last_login'])
+        for uri, etag in zip(uris, etags):
+            response = self.api_client.get(
+                uri, format='json', authentication=self.get_credentials(), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        for uri, etag in zip(uris, etags):
+            response = self.api_client.get(
+                uri, format='json', authentication=self.get_credentials(), HTTP_IF_NONE_MATCH=etag)
+            self.assertHttpOK(response)
+            self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Renamed', self.deserialize(response)['objects'][0]['user']['name'])
+
+    def test_api_export_employees(self):
+        """Test the api export employees stream the directory as NDJSON or gzip CSV."""
+
+        def export(query):
+            return self.api_client.get(
+                '/api/v1/employee/export/' + query, authentication=self.get_credentials())
+
+        self.assertHttpBadRequest(export(''))
+        self.user.is_staff = True
+        self.user.save()
+        department = Department.objects.create(name='Sales')
+        Employee.objects.create(first_name='No', last_name='User', department=department)
+
+        response = export('?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(row['email'], row['department']) for row in rows],
+                         [(self.email, None), (None, 'Sales')])
+
+        response = export('?stream=csv&compress=gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="employees.csv.gz"')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], 'id,first_name,last_name,email,age,status_code,department,'
+                                   'created_date,modified_date')
+        self.assertEqual(len(lines), 3)
+        self.assertHttpBadRequest(export('?stream=xml'))
+
+    @override_settings(EMPLOYEE_IMPORT_HASHING_WORKERS=0)
+    def test_api_import_employees(self):
+        """Test the api import employees and report per row errors."""
+
+        self.user.is_staff = True
+        self.user.save()
+        rows = [
+            {'email': 'import1@unittest.com', 'password': 'password', 'age': 30},
+            {'email': 'invalid email', 'password': 'password'},
+            {'email': self.email, 'password': 'password'},
+            {'email': 'import2@unittest.com', 'password': 'password', 'first_name': 'Bulk'},
+        ]
+        response = self.api_client.client.post(
+            '/api/v1/employee/import/',
+            data='\n'.join(json.dumps(row) for row in rows),
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=self.get_credentials())
+        self.assertHttpOK(response)
+
+        events = [json.loads(line) for line in
+                  b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([event['row'] for event in events if event['type'] == 'error'], [2, 3])
+        self.assertEqual(events[-1], {
+            'type': 'done', 'processed': 4, 'created': 2, 'failed': 2})
+        employee = Employee.objects.select_related('user__api_key').get(
+            user__email='import2@unittest.com')
+        self.assertEqual(employee.first_name, 'Bulk')
+        self.assertTrue(employee.user.api_key.key)
+        self.assertTrue(employee.user.check_password('password'))
+
+    def test_api_import_employees_requires_staff(self):
+        """Test the api import employees reject users who are not staff."""
+
+        self.assertHttpBadRequest(self.api_client.client.post(
+            '/api/v1/employee/import/',
+            data='{}',
+            content_type='application/x-ndjson',
+            HTTP_AUTHORIZATION=self.get_credentials()))
+
+    def test_api_typeahead_employee_by_name_or_email(self):
+        """Test the api typeahead match prefixes of names and emails."""
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Employee, Employee.objects.all())
+        for q in ('uni', 'te', 'unittest'):
+            response = self.api_client.get(
+                '/api/v1/employee/typeahead/?q=%s' % q,
+                format='json',
+                authentication=self.get_credentials())
+            self.assertHttpOK(response)
+            self.assertEqual(self.deserialize(response)['objects'], [
+                {'id': self.employee.id, 'name': 'Unit Test'}])
+
+    def test_api_search_employee_from_stored_fields(self):
+        """Test the api search employee build pages from the index only."""
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Employee, Employee.objects.all())
+
+        # Warm the access token cache, the page itself never hits the database
+        self.test_api_can_search_employee_by_name()
+        with self.assertNumQueries(0):
+            response = self.api_client.get(
+                '/api/v1/employee/search?q=unittest',
+                format='json',
+                authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertEqual(self.deserialize(response)['objects'], [{
+            'id': self.employee.id,
+            'first_name': 'Unit',
+            'last_name': 'Test',
+            'age': 23,
+            'email': self.email,
+            'department': None,
+            'user': {'id': self.user.id, 'name': '%s %s' % (self.user.first_name, self.user.last_name)}
+        }])
+
+        response = self.api_client.get(
+            '/api/v1/employee/search?q=unittest&detail=full',
+            format='json',
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        employee = self.deserialize(response)['objects'][0]
+        self.assertEqual(employee['user']['id'], self.user.id)
+        self.assertNotIn('email', employee)
+
+    def test_api_search_employee_page_same_as_list_page(self):
+        """Test the api search employee show an employee as the list does."""
+
+        self.user.first_name, self.user.last_name = 'Account', 'Owner'
+        self.user.save()
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Employee, Employee.objects.all())
+
+        pages = []
+        for backend in ('haystack', 'postgres'):
+            with self.settings(SEARCH_BACKEND=backend):
+                for uri in ('/api/v1/employee/', '/api/v1/employee/search?q=unittest'):
+                    response = self.api_client.get(
+                        uri, format='json', authentication=self.get_credentials())
+                    self.assertHttpOK(response)
+                    pages.append(self.deserialize(response)['objects'][0])
+        # Search pages add stored fields the list does not show
+        shown = set(pages[0]) & set(pages[1])
+        self.assertIn('user', shown)
+        for employee in pages:
+            self.assertEqual(dict((key, employee[key]) for key in shown),
+                             dict((key, pages[0][key]) for key in shown))
+        self.assertEqual(pages[0]['user']['name'], 'Account Owner')
+
+    def test_api_search_employee_same_on_database_backend(self):
+        """Test the api search employee answer the same from the database."""
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Employee, Employee.objects.all())
+
+        responses = []
+        for backend in ('haystack', 'postgres'):
+            with self.settings(SEARCH_BACKEND=backend):
+                for url in ('/api/v1/employee/search?q=ttest@unit',
+                            '/api/v1/employee/typeahead/?q=unit te'):
+                    response = self.api_client.get(
+                        url, format='json', authentication=self.get_credentials())
+                    self.assertHttpOK(response)
+                    responses.append(self.deserialize(response)['objects'])
+        self.assertEqual(len(responses[0]), 1)
+        self.assertEqual(responses[:2], responses[2:])
+
     def test_api_can_search_employee_by_name(self):
         """Test the api search employee by name."""
 
@@ -199,3 +687,249 @@ class EmployeeResourceTestCase(ResourceTestCaseMixin, TestCase):
             format='json',
             authentication=self.get_credentials()
         ))
+
+
+class AccessTokenAuthenticationTestCase(ResourceTestCaseMixin, TestCase):
+    """Test suite for the verified access token cache."""
+
+    def setUp(self):
+        """Define the test client and other test variables."""
+
+        super(AccessTokenAuthenticationTestCase, self).setUp()
+
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            'unittest@unittest.com',
+            'unittest@unittest.com',
+            'password')
+        Employee.objects.create(user=self.user, first_name='Unit', age=23)
+        self.access_token = jwt.encode(
+            {
+                'user_id': self.user.id,
+                'exp': datetime.utcnow() + timedelta(
+                    seconds=JWT_AUTH.get('JWT_EXP_DELTA_SECONDS'))
+            },
+            JWT_AUTH.get('JWT_SECRET'),
+            JWT_AUTH.get('JWT_ALGORITHM'))
+
+    def authenticate(self):
+        request = HttpRequest()
+        request.META['HTTP_AUTHORIZATION'] = self.access_token
+        self.assertTrue(AccessTokenAuthentication().is_authenticated(request))
+        return request.user
+
+    def test_verified_token_is_served_without_query(self):
+        """Test the second request with a token does not query the user."""
+
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual(user.id, self.user.id)
+
+    def test_shared_tier_is_used_by_other_workers(self):
+        """Test a worker with an empty local tier reuses the shared entry."""
+
+        self.authenticate()
+        token_cache.clear()
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_saving_user_invalidates_token(self):
+        """Test the cached user is reloaded after the user is saved."""
+
+        self.authenticate()
+        self.user.first_name = 'Changed'
+        self.user.save()
+        with self.assertNumQueries(1):
+            user = self.authenticate()
+        self.assertEqual(user.first_name, 'Changed')
+
+    def test_user_saved_while_loading_is_not_cached(self):
+        """Test a save between loading the user and caching it is not lost."""
+
+        def load(model, pk):
+            user = model.objects.get(pk=pk)
+            # Saved by another request meanwhile
+            token_cache.invalidate_user(pk)
+            return user
+
+        with mock.patch.object(identity_map, 'get', side_effect=load):
+            self.authenticate()
+        token_cache.clear()
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    def test_revocations_are_checked_with_redis_until_synced(self):
+        """Test tokens are checked before the bloom filter of a worker is built."""
+
+        revocations = RevocationList(key_prefix='test_revoked_tokens')
+        self.addCleanup(revocations.clear)
+        revoked, other = token_cache.digest('revoked'), token_cache.digest('other')
+        revocations.revoke(revoked, time.time() + 60)
+
+        with mock.patch.object(RevocationList, 'sync', side_effect=RedisError):
+            self.assertTrue(revocations.is_revoked(revoked))
+            self.assertFalse(revocations.is_revoked(other))
+        self.assertTrue(revocations.is_revoked(revoked))
+        self.assertIsNotNone(revocations._bloom)
+        self.assertFalse(revocations.is_revoked(other))
+
+    def test_revocations_fail_as_configured_while_redis_is_down(self):
+        """Test an unreachable Redis does not fail the check of a token."""
+
+        revocations = RevocationList(key_prefix='test_revoked_tokens')
+        self.addCleanup(revocations.clear)
+        revoked, other = token_cache.digest('revoked'), token_cache.digest('other')
+
+        with mock.patch.object(RevocationList, 'redis', new_callable=mock.PropertyMock) as redis:
+            redis.return_value.get.side_effect = RedisError
+            redis.return_value.zscore.side_effect = RedisError
+            # Without a bloom filter
+            self.assertFalse(revocations.is_revoked(revoked))
+            with self.settings(TOKEN_REVOCATION_FAIL_CLOSED=True):
+                self.assertTrue(revocations.is_revoked(revoked))
+
+        revocations.revoke(revoked, time.time() + 60)
+        self.assertFalse(revocations.is_revoked(other))
+        with mock.patch.object(RevocationList, 'redis', new_callable=mock.PropertyMock) as redis:
+            redis.return_value.get.side_effect = RedisError
+            redis.return_value.zscore.side_effect = RedisError
+            # Bloom filter hits count as revoked, misses need no Redis
+            self.assertTrue(revocations.is_revoked(revoked))
+            self.assertFalse(revocations.is_revoked(other))
+
+        # Authentication answers instead of failing
+        with mock.patch.object(RevocationList, 'redis', new_callable=mock.PropertyMock) as redis, \
+                mock.patch.object(revocation_list, '_bloom', None):
+            redis.return_value.get.side_effect = RedisError
+            redis.return_value.zscore.side_effect = RedisError
+            self.assertEqual(self.authenticate().id, self.user.id)
+
+    def test_deleted_user_can_not_authenticate(self):
+        """Test the token of a deleted user is rejected."""
+
+        self.authenticate()
+        self.user.delete()
+        self.assertRaises(CustomBadRequest, self.authenticate)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'], DATABASE_REPLICA_MAX_LAG=5)
+class ReplicaRoutingTestCase(SimpleTestCase):
+    """Test suite for the routing of reads to replicas."""
+
+    def setUp(self):
+        """Define the test client and other test variables."""
+
+        super(ReplicaRoutingTestCase, self).setUp()
+
+        self.factory = RequestFactory()
+        self.lags = {'replica1': 0.5, 'replica2': 0.5}
+        patcher = mock.patch.object(replica_lag, 'measure', side_effect=lambda alias: self.lags[alias])
+        self.measure = patcher.start()
+        self.addCleanup(patcher.stop)
+        replica_lag.reset()
+        self.addCleanup(replica_lag.reset)
+        for user_id in (1, 2):
+            self.addCleanup(cache.delete, pin_key(user_id))
+
+    def token(self, user_id):
+        return jwt.encode({'user_id': user_id}, 'any secret').decode('ascii')
+
+    def route(self, method='get', user_id=None, write=False):
+        """Get the databases a request reads from before and after ``write``."""
+
+        aliases = []
+
+        def view(request):
+            aliases.append(router.db_for_read(Employee))
+            if write:
+                router.db_for_write(Employee)
+                aliases.append(router.db_for_read(Employee))
+            return HttpResponse()
+
+        extra = {'HTTP_AUTHORIZATION': self.token(user_id)} if user_id else {}
+        ReplicaRoutingMiddleware(view)(getattr(self.factory, method)('/api/v1/employee/', **extra))
+        return aliases
+
+    def test_reads_of_safe_requests_go_to_replicas(self):
+        """Test the reads of GET requests only go to replicas."""
+
+        self.assertIn(self.route()[0], ['replica1', 'replica2'])
+        self.assertEqual(self.route('post'), ['default'])
+        self.assertEqual(router.db_for_read(Employee), 'default')
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.route(), ['default'])
+
+    def test_writes_send_later_reads_to_primary(self):
+        """Test reads after a write of the request and of the user go to the primary."""
+
+        self.assertEqual(self.route('get', user_id=1, write=True)[1], 'default')
+        self.assertTrue(is_pinned(1))
+        self.assertEqual(self.route(user_id=1), ['default'])
+        self.assertNotEqual(self.route(user_id=2), ['default'])
+        self.assertNotEqual(self.route(), ['default'])
+
+        cache.delete(pin_key(1))
+        self.assertNotEqual(self.route(user_id=1), ['default'])
+
+    def test_forged_token_only_pins_to_primary(self):
+        """Test requests with an invalid token are routed without failing."""
+
+        request = self.factory.get('/api/v1/employee/', HTTP_AUTHORIZATION='not a token')
+        response = ReplicaRoutingMiddleware(
+            lambda request: HttpResponse(router.db_for_read(Employee)))(request)
+        self.assertIn(response.content.decode(), ['replica1', 'replica2'])
+
+    def test_lagging_replicas_are_skipped(self):
+        """Test replicas over the allowed lag or unreachable are skipped."""
+
+        self.lags['replica1'] = 30
+        self.assertEqual(set(self.route()[0] for _ in range(10)), set(['replica2']))
+
+        with self.settings(DATABASE_REPLICA_LAG_CHECK_INTERVAL=0):
+            self.lags['replica2'] = None
+            self.assertEqual(self.route(), ['default'])
+            self.lags['replica1'] = 1
+            self.assertEqual(self.route(), ['replica1'])
+
+    def test_lag_is_measured_once_per_interval(self):
+        """Test each replica is measured at most once per check interval."""
+
+        with self.settings(DATABASE_REPLICA_LAG_CHECK_INTERVAL=60):
+            for _ in range(5):
+                self.route()
+        self.assertEqual(sorted(call[0][0] for call in self.measure.call_args_list),
+                         ['replica1', 'replica2'])
+
+    def replica_connection(self, vendor, lag=None, error=None):
+        """Mock connection of a replica, its cursor answers LAG_QUERY."""
+
+        connection = mock.MagicMock(vendor=vendor)
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = error
+        cursor.fetchone.return_value = (lag,)
+        return connection
+
+    def test_sqlite_database_has_no_lag(self):
+        """Test a second local database is read without measuring a lag."""
+
+        connection = self.replica_connection('sqlite')
+        with mock.patch('backend.commons.replicas.connections', {'replica1': connection}):
+            self.assertEqual(ReplicaLag().measure('replica1'), 0)
+        connection.cursor.assert_not_called()
+
+    def test_postgresql_lag_is_queried(self):
+        """Test the lag of a PostgreSQL standby is read with LAG_QUERY."""
+
+        connection = self.replica_connection('postgresql', lag=Decimal('2.5'))
+        with mock.patch('backend.commons.replicas.connections', {'replica1': connection}):
+            self.assertEqual(ReplicaLag().measure('replica1'), 2.5)
+            cursor = connection.cursor.return_value.__enter__.return_value
+            cursor.execute.assert_called_once_with(LAG_QUERY)
+
+            # A caught up standby or a primary
+            cursor.fetchone.return_value = (None,)
+            self.assertEqual(ReplicaLag().measure('replica1'), 0)
+
+            cursor.execute.side_effect = DatabaseError('the database system is starting up')
+            self.assertIsNone(ReplicaLag().measure('replica1'))
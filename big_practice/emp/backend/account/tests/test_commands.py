@@ -0,0 +1,302 @@
+import csv
+import gzip
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from haystack import connections as haystack_connections
+from haystack.query import SearchQuerySet
+
+from ..models import Employee, EmployeeSummary
+from ..testing import TemporaryAgeBucketsMixin
+from backend.commons.generations import GenerationError, build_generation
+from backend.commons.hashing import HashingService
+from backend.commons.search_queue import SearchQueue, search_queue
+from backend.commons.testing import QueryPlanMixin, TemporarySearchIndexMixin
+from backend.commons.whoosh_backend import GENERATION_PREFIX, active_generation
+
+
+class ImportEmployeesCommandTestCase(TemporaryAgeBucketsMixin, QueryPlanMixin, TestCase):
+    """Test suite for the import_employees command."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as csv_file:
+            csv_file.write('email,password,first_name,last_name,age\n')
+            for index in range(5):
+                csv_file.write('user%d@unittest.com,password,User,%d,2%d\n' % (index, index, index))
+            csv_file.write('user0@unittest.com,password,Duplicated,,\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    @override_settings(EMPLOYEE_IMPORT_HASHING_WORKERS=0)
+    def test_import_employees_from_csv_in_chunks(self):
+        out, err = StringIO(), StringIO()
+        with mock.patch('backend.account.importer.update_objects') as update_objects, \
+                mock.patch.object(HashingService, 'shutdown') as shutdown:
+            call_command('import_employees', self.path, chunk_size=2, stdout=out, stderr=err)
+
+        # Indexed chunk by chunk, the pool of the import is stopped
+        self.assertEqual([len(call[0][1]) for call in update_objects.call_args_list], [2, 2, 1])
+        shutdown.assert_called_once_with()
+        self.assertEqual(Employee.objects.count(), 5)
+        self.assertEqual(Employee.objects.get(last_name='3').age, 23)
+        self.assertIn('"row": 6', err.getvalue())
+        self.assertIn('done: 6 rows processed, 5 created, 1 failed', out.getvalue())
+
+    @override_settings(EMPLOYEE_IMPORT_HASHING_WORKERS=0)
+    def test_import_checks_registered_emails_with_index(self):
+        for index in range(50):
+            User.objects.create_user('seed%d' % index, 'Seed%d@unittest.com' % index)
+        User.objects.create_user('registered', 'USER1@unittest.com')
+
+        out, err = StringIO(), StringIO()
+        with mock.patch('backend.account.importer.update_objects'):
+            self.assertNoSequentialScans(lambda: call_command(
+                'import_employees', self.path, stdout=out, stderr=err))
+        self.assertIn('This email is already exits.', err.getvalue())
+        self.assertIn('4 created', out.getvalue())
+
+
+class ExportEmployeesCommandTestCase(TestCase):
+    """Test suite for the export_employees command."""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.csv.gz')
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_export_employees_to_gzip_csv(self):
+        for age in range(5):
+            Employee.objects.create(first_name='Export', age=age)
+
+        out = StringIO()
+        call_command('export_employees', self.path, fetch_size=2, stdout=out)
+        self.assertIn('bytes written to %s' % self.path, out.getvalue())
+        with gzip.open(self.path, 'rt', newline='') as export:
+            rows = list(csv.DictReader(export))
+        self.assertEqual([row['age'] for row in rows], ['0', '1', '2', '3', '4'])
+        self.assertEqual(rows[0]['email'], '')
+
+
+class ProcessSearchQueueCommandTestCase(TemporarySearchIndexMixin, TransactionTestCase):
+    """Test suite for the queued search index updates."""
+
+    def setUp(self):
+        super(ProcessSearchQueueCommandTestCase, self).setUp()
+        search_queue.redis.delete(search_queue.key, search_queue.processing_key, search_queue.consumers_key)
+
+    def search(self, **filters):
+        return SearchQuerySet().models(Employee).filter(**filters)
+
+    def test_saves_are_indexed_in_one_batch(self):
+        users = [User.objects.create_user('queue%d' % index, 'queue%d@unittest.com' % index)
+                 for index in range(3)]
+        employees = [Employee.objects.create(user=user, age=30) for user in users]
+        employees[0].age = 31
+        employees[0].save()
+        employees[0].save()
+        employees[2].delete()
+
+        # Nothing is written to the index before the queue is processed
+        self.assertEqual(self.search(email='queue0').count(), 0)
+
+        out = StringIO()
+        call_command('process_search_queue', once=True, stdout=out)
+        self.assertIn('6 queued updates indexed, 0 waiting', out.getvalue())
+        self.assertEqual(self.search(email='queue0')[0].age, 31)
+        self.assertEqual(self.search(email='queue1').count(), 1)
+        self.assertEqual(self.search(email='queue2').count(), 0)
+        self.assertEqual(len(search_queue), 0)
+
+    @override_settings(SEARCH_INDEX_WRITER_TIMEOUT=0)
+    def test_batch_is_kept_while_index_is_locked(self):
+        user = User.objects.create_user('locked', 'locked@unittest.com')
+        Employee.objects.create(user=user, age=30)
+        backend = haystack_connections['default'].get_backend()
+        if not backend.setup_complete:
+            backend.setup()
+
+        # Another process writing the index holds its lock
+        writer = backend.index.writer()
+        try:
+            self.assertEqual(search_queue.process(), 0)
+        finally:
+            writer.cancel()
+        self.assertEqual(len(search_queue), 1)
+        self.assertEqual(search_queue.redis.llen(search_queue.processing_key), 0)
+
+        self.assertEqual(search_queue.process(), 1)
+        self.assertEqual(self.search(email='locked').count(), 1)
+
+    def test_workers_only_ack_and_requeue_their_own_batch(self):
+        search_queue.push({'pk': 1}, {'pk': 2})
+        with mock.patch.object(SearchQueue, 'consumer', 'host:1'):
+            self.assertEqual(len(search_queue.pop(1)), 1)
+        with mock.patch.object(SearchQueue, 'consumer', 'host:2'):
+            self.assertEqual(len(search_queue.pop(1)), 1)
+            search_queue.ack()
+            search_queue.requeue()
+        self.assertEqual(search_queue.redis.llen(search_queue.processing_key_of('host:1')), 1)
+        self.assertEqual(len(search_queue), 0)
+
+        # The batch of a worker is requeued only once it stopped polling
+        self.assertEqual(search_queue.requeue_dead(), 0)
+        search_queue.redis.delete(search_queue.alive_key('host:1'))
+        self.assertEqual(search_queue.requeue_dead(), 1)
+        self.assertEqual(len(search_queue), 1)
+        self.assertEqual(search_queue.redis.smembers(search_queue.consumers_key), {b'host:2'})
+
+
+class RebuildSearchIndexCommandTestCase(TemporarySearchIndexMixin, TestCase):
+    """Test suite for the rebuild_search_index command."""
+
+    def test_rebuild_replaces_documents_of_model(self):
+        users = [User.objects.create_user('rebuild%d' % index, 'rebuild%d@unittest.com' % index)
+                 for index in range(5)]
+        employees = [Employee.objects.create(user=user, age=40) for user in users]
+        Employee.objects.filter(pk=employees[0].pk).update(age=41)
+        Employee.objects.filter(pk=employees[2].pk).delete()
+
+        # One query for the primary key bounds and one per range
+        out = StringIO()
+        with self.assertNumQueries(4):
+            call_command('rebuild_search_index', models=['account.employee'],
+                         chunk_size=2, workers=0, stdout=out)
+        self.assertIn('account.employee: 4 rows indexed', out.getvalue())
+
+        # Documents of rows deleted before the rebuild are gone
+        results = SearchQuerySet().models(Employee)
+        self.assertEqual(sorted(result.email for result in results), [
+            'rebuild0@unittest.com', 'rebuild1@unittest.com',
+            'rebuild3@unittest.com', 'rebuild4@unittest.com'])
+        self.assertEqual(results.filter(email='rebuild0')[0].age, 41)
+
+    def test_swap_builds_and_activates_new_generation(self):
+        backend = haystack_connections['default'].get_backend()
+        user = User.objects.create_user('swap0', 'swap0@unittest.com')
+        Employee.objects.create(user=user, age=40)
+
+        out = StringIO()
+        call_command('rebuild_search_index', swap=True, workers=0, keep=1, stdout=out)
+        first = active_generation(backend.root)
+        self.assertIn('Generation %s is active' % first, out.getvalue())
+        self.assertEqual(SearchQuerySet().models(Employee).filter(email='swap0').count(), 1)
+
+        # Updates indexed while building are replayed on the new generation
+        def report(model, count):
+            if model is Employee:
+                user = User.objects.create_user('swap1', 'swap1@unittest.com')
+                search_queue.push(search_queue.item(
+                    'update', Employee.objects.create(user=user, age=41)))
+                search_queue.process()
+
+        second = build_generation(workers=0, keep=1, report=report)
+        self.assertEqual(active_generation(backend.root), second)
+        self.assertEqual(SearchQuerySet().models(Employee).filter(email='swap1').count(), 1)
+        self.assertFalse(os.path.exists(os.path.join(backend.root, first)))
+
+    def test_swap_tolerates_writes_during_build(self):
+        backend = haystack_connections['default'].get_backend()
+        legacy = os.path.join(backend.root, 'MAIN_legacy.seg')
+        open(legacy, 'w').close()
+        user = User.objects.create_user('busy0', 'busy0@unittest.com')
+        Employee.objects.create(user=user, age=40)
+        search_queue.redis.delete(search_queue.key)
+        self.addCleanup(search_queue.redis.delete, search_queue.key)
+
+        # Saved after the rows were counted and not indexed yet
+        def report(model, count):
+            if model is Employee:
+                user = User.objects.create_user('busy1', 'busy1@unittest.com')
+                search_queue.push(search_queue.item(
+                    'update', Employee.objects.create(user=user, age=41)))
+
+        generation = build_generation(workers=0, keep=1, report=report)
+        self.assertEqual(active_generation(backend.root), generation)
+        self.assertEqual(len(search_queue), 1)
+        search_queue.process()
+        self.assertEqual(SearchQuerySet().models(Employee).filter(email='busy1').count(), 1)
+        # Only generations are collected
+        self.assertTrue(os.path.exists(legacy))
+
+    def test_swap_refuses_generation_not_matching_rows(self):
+        backend = haystack_connections['default'].get_backend()
+        Employee.objects.create(age=40)
+        with mock.patch('backend.commons.generations.count_documents', return_value=2):
+            self.assertRaises(GenerationError, build_generation, workers=0)
+        self.assertIsNone(active_generation(backend.root))
+        self.assertEqual([name for name in os.listdir(backend.root)
+                          if name.startswith(GENERATION_PREFIX)], [])
+
+    def test_batch_written_to_swapped_out_generation_is_queued_again(self):
+        search_queue.redis.delete(search_queue.key, search_queue.processing_key)
+        self.addCleanup(search_queue.redis.delete, search_queue.key)
+        employee = Employee.objects.create(age=40)
+        search_queue.redis.delete(search_queue.key)
+        search_queue.push(search_queue.item('update', employee))
+
+        with mock.patch('backend.commons.search_queue.active_generation',
+                        return_value=GENERATION_PREFIX + 'newer'):
+            self.assertEqual(search_queue.process(), 1)
+        self.assertEqual(len(search_queue), 1)
+
+
+class AgeBucketsTestCase(TemporaryAgeBucketsMixin, TransactionTestCase):
+    """Test suite for the employee age buckets."""
+
+    def test_saves_and_deletes_move_employees_between_buckets(self):
+        young = Employee.objects.create(age=20)
+        old = Employee.objects.create(age=40)
+        self.assertEqual(self.age_buckets.page(18, 25, 0, 10), (1, [young.pk]))
+
+        old.age = 21
+        old.save()
+        young.delete()
+        self.assertEqual(self.age_buckets.page(18, 25, 0, 10), (1, [old.pk]))
+        self.assertEqual(self.age_buckets.page(40, 40, 0, 10), (0, []))
+
+    def test_callbacks_run_out_of_order_keep_committed_age(self):
+        employee = Employee.objects.create(age=20)
+        callbacks = []
+        with mock.patch('django.db.transaction.on_commit', side_effect=callbacks.append):
+            for age in (30, 40):
+                employee.age = age
+                employee.save()
+        for callback in reversed(callbacks):
+            callback()
+        self.assertEqual(self.age_buckets.page(40, 40, 0, 10), (1, [employee.pk]))
+        self.assertEqual(self.age_buckets.page(30, 30, 0, 10), (0, []))
+
+    def test_rebuild_age_buckets(self):
+        employees = [Employee.objects.create(age=age) for age in (20, 20, None)]
+        self.age_buckets.clear()
+
+        out = StringIO()
+        call_command('rebuild_age_buckets', stdout=out)
+        self.assertIn('3 employees bucketed', out.getvalue())
+        self.assertEqual(self.age_buckets.page(0, 150, 0, 10),
+                         (2, [employees[0].pk, employees[1].pk]))
+
+
+class RebuildEmployeeSummaryCommandTestCase(TestCase):
+    """Test suite for the rebuild_employee_summary command."""
+
+    def test_rebuild_employee_summary(self):
+        for age in (20, 20, None):
+            Employee.objects.create(age=age)
+        EmployeeSummary.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_employee_summary', stdout=out)
+        self.assertIn('3 employees summarized', out.getvalue())
+        self.assertEqual(
+            sorted(EmployeeSummary.objects.values_list('dimension', 'value', 'headcount')),
+            [('age', '', 1), ('age', '20', 2), ('department', '', 3), ('status_code', '0', 3)])
@@ -1,7 +1,8 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
 
-from ..models import Employee
+from ..models import Employee, EmployeeSummary
+from ..summary import rebuild_summary
 from backend.department.models import Department
 
 
@@ -48,3 +49,59 @@ class AccountModelsTestCase(TestCase):
         self.test_create_new_employee()
         employee = Employee.objects.get(user=self.user)
         self.assertTrue('test@gmail.com', employee.__str__())
+
+
+class EmployeeSummaryTestCase(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='department')
+
+    def summary(self):
+        return sorted(EmployeeSummary.objects.filter(headcount__gt=0).values_list(
+            'dimension', 'value', 'headcount', 'age_count', 'age_total'))
+
+    def assertSummaryRebuilt(self):
+        summary = self.summary()
+        rebuild_summary()
+        self.assertEqual(summary, self.summary())
+
+    def test_saves_and_deletes_update_the_summary(self):
+        first = Employee.objects.create(department=self.department, age=30)
+        second = Employee.objects.create(age=40, status_code=1)
+        self.assertSummaryRebuilt()
+
+        first = Employee.objects.get(pk=first.pk)
+        first.age = 31
+        first.save()
+        first.department = None
+        first.save()
+        Employee(pk=second.pk, age=None).save(update_fields=['age'])
+        self.assertSummaryRebuilt()
+        self.assertIn(('department', '', 2, 1, 31), self.summary())
+
+        Employee.objects.get(pk=second.pk).delete()
+        self.assertSummaryRebuilt()
+        self.assertNotIn('1', [value for dimension, value, _, _, _ in self.summary()
+                               if dimension == 'status_code'])
+
+    def test_saves_count_the_stored_values(self):
+        employee = Employee.objects.create(age=30)
+        stale = Employee.objects.get(pk=employee.pk)
+        other = Employee.objects.get(pk=employee.pk)
+
+        # Saved by another request since ``stale`` was loaded
+        other.age = 40
+        other.save()
+        stale.age = 31
+        stale.save()
+        self.assertSummaryRebuilt()
+
+        other.delete()
+        stale.delete()
+        self.assertSummaryRebuilt()
+
+    def test_deleted_department_employees_have_no_department(self):
+        Employee.objects.create(department=self.department, age=30)
+        Employee.objects.create(age=20)
+        self.department.delete()
+        self.assertSummaryRebuilt()
+        self.assertIn(('department', '', 2, 2, 50), self.summary())
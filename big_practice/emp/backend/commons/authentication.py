@@ -6,6 +6,9 @@ import jwt
 
 from ..commons.custom_exception import CustomBadRequest
 from ..commons.constants import JWT_AUTH
+from ..commons.identity_map import identity_map
+from ..commons.revocation import revocation_list
+from ..commons.token_cache import token_cache
 
 
 class AccessTokenAuthentication(Authentication):
@@ -31,33 +34,31 @@ class AccessTokenAuthentication(Authentication):
 
         # Get access_token from exact_credentials method
         access_token = self.extract_credentials(request)
+        digest = token_cache.digest(access_token)
+        if revocation_list.is_revoked(digest):
+            raise CustomBadRequest(
+                error_type='UNAUTHORIZED',
+                error_message='The token is revoked')
 
-        # Decode jwt to get user_id
-        if access_token:
+        # Reuse the user verified for this token by an earlier request
+        user = token_cache.get_local(digest)
+        if user is None:
+            payload = self.decode(access_token)
+            user = token_cache.get_shared(digest, payload)
+
+        if user is None:
+            version = token_cache.version(payload['user_id'])
+            # Try get user by access token in request
             try:
-                payload = jwt.decode(
-                    access_token,
-                    JWT_AUTH.get('JWT_SECRET'),
-                    algorithms=[JWT_AUTH.get('JWT_ALGORITHM')])
-            except jwt.DecodeError:
-                raise CustomBadRequest(
-                    error_type='UNAUTHORIZED',
-                    error_message='The token is invalid')
-            except jwt.ExpiredSignatureError:
+                user = identity_map.get(User, payload['user_id'])
+            except User.DoesNotExist:
                 raise CustomBadRequest(
-                    error_type='UNAUTHORIZED',
-                    error_message='The token is expired')
-
-        # Try get user by access token in request
-        try:
-            user = User.objects.get(id=payload['user_id'])
-            print('exp: ', payload['exp'])
-        except User.DoesNotExist:
-            raise CustomBadRequest(
-                error_type='INVALID_DATA',
-                error_message='Can not get user with access token')
+                    error_type='INVALID_DATA',
+                    error_message='Can not get user with access token')
+            token_cache.set(digest, payload, user, version)
 
-        request.user = user
+        # Resources reuse the verified user for the rest of the request
+        request.user = identity_map.add(user)
 
         if user.is_authenticated:
             return True
@@ -65,3 +66,20 @@ class AccessTokenAuthentication(Authentication):
             raise CustomBadRequest(
                 error_type='UNAUTHORIZED',
                 error_message='Authentication was problem')
+
+    def decode(self, access_token):
+        """Decode jwt to get user_id."""
+
+        try:
+            return jwt.decode(
+                access_token,
+                JWT_AUTH.get('JWT_SECRET'),
+                algorithms=[JWT_AUTH.get('JWT_ALGORITHM')])
+        except jwt.DecodeError:
+            raise CustomBadRequest(
+                error_type='UNAUTHORIZED',
+                error_message='The token is invalid')
+        except jwt.ExpiredSignatureError:
+            raise CustomBadRequest(
+                error_type='UNAUTHORIZED',
+                error_message='The token is expired')
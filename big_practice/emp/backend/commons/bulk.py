@@ -0,0 +1,295 @@
+"""Bulk writes of list endpoints."""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, transaction
+from django.db.models import Case, Value, When
+
+from .custom_exception import CustomBadRequest
+from .indexing import get_index
+from .search_cache import search_cache
+from .search_queue import search_queue
+
+_local = threading.local()
+
+
+@contextmanager
+def bulk_write():
+    """Mark the writes of the block as bulk ones, see ``in_bulk_write``."""
+
+    _local.active = True
+    try:
+        yield
+    finally:
+        _local.active = False
+
+
+def in_bulk_write():
+    """Check if per row signal handlers must leave the work to the bulk write."""
+
+    return getattr(_local, 'active', False)
+
+
+def is_id(value):
+    """Check if a payload value can be a primary key."""
+
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def bulk_update(model, objs, fields, batch_size=None, using='default'):
+    """Write ``fields`` of saved objects with one ``UPDATE`` per batch.
+
+    Values are picked by primary key with ``CASE WHEN``, a field set to the
+    same value on every object of a batch is written as is. Returns the
+    number of updated rows.
+    """
+
+    batch_size = batch_size or settings.BULK_WRITE_BATCH_SIZE
+    fields = [model._meta.get_field(name) for name in fields]
+    count = 0
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        values = {}
+        for field in fields:
+            column = [getattr(obj, field.attname) for obj in batch]
+            if all(value == column[0] for value in column):
+                values[field.attname] = Value(column[0], output_field=field)
+            else:
+                values[field.attname] = Case(*[
+                    When(pk=obj.pk, then=Value(value, output_field=field))
+                    for obj, value in zip(batch, column)], output_field=field)
+        count += model._default_manager.using(using).filter(
+            pk__in=[obj.pk for obj in batch]).update(**values)
+    return count
+
+
+class BulkWriteMixin(object):
+    """Create, update and delete many objects with one request.
+
+    ``PATCH`` and ``PUT`` on a list take ``{"objects": [...],
+    "deleted_objects": [ids]}``, ``DELETE`` takes ``deleted_objects`` only.
+    Objects with an ``id`` update that row with the ``bulk_fields`` they
+    hold, foreign keys given as ids, the others are created. The whole
+    payload is validated first, then written without per row signals in the
+    transaction which locked its rows, and the search index is updated with
+    one queued batch. Neither replaces the collection as tastypie would.
+    """
+
+    bulk_fields = ()
+
+    def patch_list(self, request, **kwargs):
+        return self.bulk_write(request, ('objects', 'deleted_objects'))
+
+    def put_list(self, request, **kwargs):
+        return self.bulk_write(request, ('objects', 'deleted_objects'))
+
+    def delete_list(self, request, **kwargs):
+        return self.bulk_write(request, ('deleted_objects',))
+
+    def bulk_payload(self, request, keys):
+        """Get the lists of a bulk payload which may hold ``keys``."""
+
+        data = self.deserialize(
+            request, request.body,
+            format=request.META.get('CONTENT_TYPE', 'application/json'))
+        if not isinstance(data, dict) or not data or set(data) - set(keys):
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='Payload must be an object of %s.' % ', '.join(keys))
+        payload = dict((key, data.get(key) or []) for key in keys)
+        if not all(isinstance(items, list) for items in payload.values()):
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='%s must be lists.' % ', '.join(keys))
+        if sum(len(items) for items in payload.values()) > settings.BULK_WRITE_MAX_OBJECTS:
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='At most %d objects can be written at once.' %
+                settings.BULK_WRITE_MAX_OBJECTS)
+        return payload.get('objects', []), payload['deleted_objects']
+
+    def bulk_hydrate(self, request, obj, created):
+        """Set fields the client does not send, returns their names.
+
+        Records the user creating or modifying rows of models which have
+        ``created_by`` and ``modified_by`` fields.
+        """
+
+        names = [field.name for field in obj._meta.concrete_fields]
+        field = 'created_by' if created else 'modified_by'
+        if field not in names:
+            return []
+        setattr(obj, field, request.user)
+        return [field]
+
+    def bulk_clean(self, request, items, deleted_ids):
+        """Validate a payload, returns the objects to write and the errors.
+
+        Rows and related rows are read with one query per model, fields are
+        checked with ``clean_fields``. Errors are lists of ``(index, errors)``.
+        Rows are locked until the end of the transaction it runs in.
+        """
+
+        model = self._meta.object_class
+        relations = dict((name, model._meta.get_field(name)) for name in self.bulk_fields
+                         if model._meta.get_field(name).is_relation)
+        errors = []
+        deleted_errors = []
+
+        ids = [item['id'] for item in items if isinstance(item, dict) and 'id' in item]
+        existing = self.get_object_list(request).select_related(None).select_for_update().in_bulk(
+            [pk for pk in ids + deleted_ids if is_id(pk)])
+        related = {}
+        for name, field in relations.items():
+            values = [item[name] for item in items if isinstance(item, dict) and item.get(name)]
+            related[name] = set(field.related_model._default_manager.filter(
+                pk__in=[value for value in values if is_id(value)]
+            ).values_list('pk', flat=True))
+
+        seen = set()
+        for index, pk in enumerate(deleted_ids):
+            if not is_id(pk) or pk not in existing:
+                deleted_errors.append((index, {'id': 'Does not exist.'}))
+            else:
+                seen.add(pk)
+
+        created, updated = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append((index, {'object': 'Must be an object.'}))
+                continue
+            item_errors = dict((name, 'Unknown field.') for name in item
+                               if name != 'id' and name not in self.bulk_fields)
+            if 'id' in item:
+                if not is_id(item['id']) or item['id'] not in existing:
+                    item_errors['id'] = 'Does not exist.'
+                elif item['id'] in seen:
+                    item_errors['id'] = 'Duplicated in the payload.'
+                else:
+                    seen.add(item['id'])
+            if item_errors:
+                errors.append((index, item_errors))
+                continue
+
+            obj = existing[item['id']] if 'id' in item else model()
+            fields = [name for name in item if name != 'id']
+            for name in fields:
+                field = model._meta.get_field(name)
+                if name in relations and item[name] is not None and (
+                        not is_id(item[name]) or item[name] not in related[name]):
+                    item_errors[name] = 'Does not exist.'
+                else:
+                    setattr(obj, field.attname, item[name])
+            try:
+                # Relations were checked above with one query each
+                obj.clean_fields(exclude=[field.name for field in model._meta.fields
+                                          if field.name not in fields or field.name in relations])
+            except ValidationError as e:
+                item_errors.update(e.message_dict)
+            if item_errors:
+                errors.append((index, item_errors))
+                continue
+
+            fields += self.bulk_hydrate(request, obj, 'id' not in item)
+            (updated if 'id' in item else created).append((index, obj, fields))
+        deleted = [existing[pk] for pk in deleted_ids if is_id(pk) and pk in existing]
+        return created, updated, deleted, errors, deleted_errors
+
+    def bulk_write(self, request, keys):
+        """Validate and apply a bulk payload, returns the result of each item."""
+
+        items, deleted_ids = self.bulk_payload(request, keys)
+        with transaction.atomic(), bulk_write():
+            created, updated, deleted, removals = self.bulk_apply(request, items, deleted_ids)
+
+        saved = [obj for _, obj, _ in created + updated]
+        transaction.on_commit(lambda: self.bulk_written(saved, deleted, removals))
+
+        results = dict((index, {'id': obj.pk, 'status': 'created'}) for index, obj, _ in created)
+        results.update((index, {'id': obj.pk, 'status': 'updated'}) for index, obj, _ in updated)
+        return self.create_response(request, {
+            'objects': [results[index] for index in range(len(items))],
+            'deleted_objects': [{'id': pk, 'status': 'deleted'} for pk in deleted_ids],
+        })
+
+    def bulk_apply(self, request, items, deleted_ids):
+        """Validate and write a payload in the current transaction.
+
+        Returns the created, updated and deleted objects with the queue
+        items removing the deleted ones from the index. Nothing is written
+        when an ``UPDATE`` misses one of its rows.
+        """
+
+        created, updated, deleted, errors, deleted_errors = self.bulk_clean(
+            request, items, deleted_ids)
+        if errors or deleted_errors:
+            error_indexes = dict(errors)
+            deleted_error_indexes = dict(deleted_errors)
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='%d objects are not valid, nothing was written.' % (
+                    len(errors) + len(deleted_errors)),
+                details={
+                    'objects': [{'status': 'invalid', 'errors': error_indexes[index]}
+                                if index in error_indexes else {'status': 'valid'}
+                                for index in range(len(items))],
+                    'deleted_objects': [
+                        {'status': 'invalid', 'errors': deleted_error_indexes[index]}
+                        if index in deleted_error_indexes else {'status': 'valid'}
+                        for index in range(len(deleted_ids))],
+                })
+
+        bundle = self.build_bundle(request=request)
+        if created:
+            self.authorized_create_detail(self.get_object_list(request), bundle)
+        self.authorized_update_list([obj for _, obj, _ in updated], bundle)
+        self.authorized_delete_list(deleted, bundle)
+
+        model = self._meta.object_class
+        # The primary key is cleared once the object is deleted
+        removals = [search_queue.item('delete', obj) for obj in deleted]
+        self.bulk_create([obj for _, obj, _ in created])
+        # Objects changing the same fields are written together
+        auto_now = [field for field in model._meta.concrete_fields
+                    if getattr(field, 'auto_now', False)]
+        groups = {}
+        for _, obj, fields in updated:
+            for field in auto_now:
+                field.pre_save(obj, False)
+            fields = sorted(set(fields) | set(field.name for field in auto_now))
+            groups.setdefault(tuple(fields), []).append(obj)
+        for fields, objs in groups.items():
+            if bulk_update(model, objs, fields) != len(objs):
+                raise CustomBadRequest(
+                    error_type='INVALID_DATA',
+                    error_message='Objects were deleted meanwhile, nothing was written.')
+        if deleted:
+            model._default_manager.filter(pk__in=[obj.pk for obj in deleted]).delete()
+        self.bulk_applied([obj for _, obj, _ in created], [obj for _, obj, _ in updated],
+                          deleted)
+        return created, updated, deleted, removals
+
+    def bulk_create(self, objs):
+        """Insert new rows, their ids are set on ``objs``."""
+
+        model = self._meta.object_class
+        if connections['default'].features.can_return_ids_from_bulk_insert:
+            model._default_manager.bulk_create(objs, batch_size=settings.BULK_WRITE_BATCH_SIZE)
+        else:
+            # Only PostgreSQL returns the ids of bulk inserted rows
+            for obj in objs:
+                obj.save(force_insert=True)
+
+    def bulk_applied(self, created, updated, deleted):
+        """Hook run in the transaction of a bulk write, per row signals did not run."""
+
+    def bulk_written(self, saved, deleted, removals):
+        """Queue one batch of index updates and invalidate search pages."""
+
+        model = self._meta.object_class
+        if get_index(model) is None:
+            return
+        search_queue.push(*[search_queue.item('update', obj) for obj in saved] + removals)
+        search_cache.bump(model._meta.label_lower)
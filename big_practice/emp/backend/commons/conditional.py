@@ -0,0 +1,142 @@
+"""Conditional GET of resources with ETag and Last-Modified."""
+import hashlib
+from calendar import timegm
+
+from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from tastypie import http
+
+from . import metrics
+
+
+def make_etag(*parts):
+    """Quoted ETag of the given representation parts."""
+
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8'))
+    return quote_etag(digest.hexdigest())
+
+
+def timestamp(value):
+    """Seconds since the epoch of a datetime, None stays None."""
+
+    return None if value is None else timegm(value.utctimetuple())
+
+
+class ConditionalGetMixin(object):
+    """Answer GET requests with 304 when the client copy is still fresh.
+
+    Validators are computed before dehydration: a detail comes from the
+    ``modified_date`` of the object, an offset page from the count and
+    latest ``modified_date`` of the filtered queryset plus the page
+    parameters, and a cursor page from its rows. Lists get no Last-Modified:
+    deleting a row leaves their latest ``modified_date`` as it was, so only
+    their ETag tells a client its copy is stale.
+    Bump ``representation_version`` when the serialized shape changes so
+    clients drop their copies.
+    """
+
+    modified_field = 'modified_date'
+    representation_version = 1
+
+    def representation_parts(self, request):
+        return [self._meta.resource_name, self.representation_version,
+                self.determine_format(request)]
+
+    def detail_validators(self, request, obj):
+        """ETag and Last-Modified timestamp of an object."""
+
+        modified = getattr(obj, self.modified_field) or obj.created_date
+        etag = make_etag(obj.pk, modified.isoformat(), *self.representation_parts(request))
+        return etag, timestamp(modified)
+
+    def list_validators(self, request, objects):
+        """ETag of a page of ``objects`` and no Last-Modified timestamp."""
+
+        aggregate = objects.order_by().aggregate(
+            count=Count('pk'), modified=Max(self.modified_field))
+        modified = aggregate['modified']
+        etag = make_etag(aggregate['count'], modified and modified.isoformat(),
+                         sorted(request.GET.lists()), *self.representation_parts(request))
+        return etag, None
+
+    def page_validators(self, request, page):
+        """ETag of a page already read and no Last-Modified timestamp.
+
+        Cursor pages are cheaper to read than to count, so their validators
+        come from their rows and the cursor of the next page.
+        """
+
+        rows = [(obj.pk, getattr(obj, self.modified_field))
+                for obj in page[self._meta.collection_name]]
+        etag = make_etag([(pk, value and value.isoformat()) for pk, value in rows],
+                         page['meta']['next'], sorted(request.GET.lists()),
+                         *self.representation_parts(request))
+        return etag, None
+
+    def conditional_response(self, request, etag, last_modified):
+        """Get a 304 response when the validators match the request."""
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        metrics.incr('conditional_get.%s.%s' % (
+            self._meta.resource_name, 'not_modified' if response is not None else 'full'))
+        return response
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_list(self, request, **kwargs):
+        """Return a list page, or 304 before dehydrating it."""
+
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+
+        paginator = self._meta.paginator_class(
+            request.GET, sorted_objects, resource_uri=self.get_resource_uri(),
+            limit=self._meta.limit, max_limit=self._meta.max_limit,
+            collection_name=self._meta.collection_name)
+        if 'cursor' in request.GET:
+            to_be_serialized = paginator.page()
+            etag, last_modified = self.page_validators(request, to_be_serialized)
+        else:
+            etag, last_modified = self.list_validators(request, sorted_objects)
+        response = self.conditional_response(request, etag, last_modified)
+        if response is not None:
+            return self.set_validators(response, etag, last_modified)
+
+        if 'cursor' not in request.GET:
+            to_be_serialized = paginator.page()
+        to_be_serialized[self._meta.collection_name] = [
+            self.full_dehydrate(self.build_bundle(obj=obj, request=request), for_list=True)
+            for obj in to_be_serialized[self._meta.collection_name]
+        ]
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.set_validators(
+            self.create_response(request, to_be_serialized), etag, last_modified)
+
+    def get_detail(self, request, **kwargs):
+        """Return an object, or 304 before dehydrating it."""
+
+        basic_bundle = self.build_bundle(request=request)
+        try:
+            obj = self.cached_obj_get(bundle=basic_bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return http.HttpNotFound()
+        except MultipleObjectsReturned:
+            return http.HttpMultipleChoices("More than one resource is found at this URI.")
+
+        etag, last_modified = self.detail_validators(request, obj)
+        response = self.conditional_response(request, etag, last_modified)
+        if response is not None:
+            return self.set_validators(response, etag, last_modified)
+
+        bundle = self.build_bundle(obj=obj, request=request)
+        bundle = self.full_dehydrate(bundle)
+        bundle = self.alter_detail_data_to_serialize(request, bundle)
+        return self.set_validators(self.create_response(request, bundle), etag, last_modified)
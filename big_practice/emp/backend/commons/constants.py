@@ -57,6 +57,10 @@ ERRORS_CODE = {
     'PERMISSION_ERROR': {
         'code': 413,
         'message': 'Permission denied!'
+    },
+    'SERVER_BUSY': {
+        'code': 414,
+        'message': 'Server is busy, please try again later.'
     }
 }
 
@@ -13,7 +13,7 @@ class CustomBadRequest(TastypieError):
 
         abstract = True
 
-    def __init__(self, error_type=None, field='', error_message=None, obj='Object'):
+    def __init__(self, error_type=None, field='', error_message=None, obj='Object', details=None):
         """Initialize."""
         error = ERRORS_CODE.get(error_type)
         if error:
@@ -32,6 +32,8 @@ class CustomBadRequest(TastypieError):
                 'message': message
             }
         }
+        if details is not None:
+            self._response.update(details)
 
     @property
     def response(self):
@@ -0,0 +1,185 @@
+"""Search served by PostgreSQL instead of the haystack index."""
+import importlib
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.contrib.postgres.search import SearchQueryField, SearchVector
+from django.db import connections
+from django.db.models import Func, Q, Value
+
+_indexes = {}
+
+
+def register(index_class):
+    """Class decorator making a ``DatabaseIndex`` the one of its model."""
+
+    _indexes[index_class.model] = index_class()
+    return index_class
+
+
+def get_database_index(model):
+    """Get the ``DatabaseIndex`` declared in the search_indexes of an app."""
+
+    if model not in _indexes:
+        importlib.import_module(model._meta.app_config.name + '.search_indexes')
+    return _indexes[model]
+
+
+class PrefixQuery(Func):
+    """``to_tsquery`` matching documents with words starting with each word."""
+
+    function = 'to_tsquery'
+    template = "%(function)s('simple'::regconfig, %(expressions)s)"
+    output_field = SearchQueryField()
+
+    def __init__(self, words):
+        super(PrefixQuery, self).__init__(
+            Value(' & '.join(word + ':*' for word in words)))
+
+
+class DatabaseIndex(object):
+    """Describe how a model is searched in PostgreSQL.
+
+    ``fields`` maps the attributes of results, named like the stored fields
+    of the haystack index, to model lookups. Autocomplete matches words of
+    ``vector_fields`` with their tsvector GIN index and whole values of
+    ``prefix_fields`` with their trigram GIN index.
+    """
+
+    model = None
+    fields = {}
+    vector_fields = ()
+    prefix_fields = ()
+
+    def lookup(self, name):
+        return self.fields.get(name, name)
+
+    def prepare(self, result):
+        """Set attributes of a result computed from its fields."""
+
+    def autocomplete(self, queryset, q):
+        """Filter a queryset with rows matching a typeahead prefix."""
+
+        words = re.findall(r'\w+', q)
+        if not words:
+            return queryset.none()
+
+        conditions = [Q(**{field + '__istartswith': q.strip()})
+                      for field in self.prefix_fields]
+        if self.vector_fields:
+            if connections[queryset.db].vendor == 'postgresql':
+                # Same expression as the GIN index of the migrations
+                queryset = queryset.annotate(autocomplete_vector=SearchVector(
+                    *self.vector_fields, config='simple'))
+                conditions.append(Q(autocomplete_vector=PrefixQuery(words)))
+            else:
+                conditions.append(reduce(and_, [
+                    reduce(or_, [Q(**{field + '__istartswith': word})
+                                 for field in self.vector_fields])
+                    for word in words]))
+        return queryset.filter(reduce(or_, conditions))
+
+
+class DatabaseResult(object):
+    """Search result read from the database, shaped like ``SearchResult``."""
+
+    def __init__(self, model, pk, fields):
+        """Initialize."""
+
+        self.model = model
+        self.pk = pk
+        self.object = None
+        self.__dict__.update(fields)
+
+
+class DatabaseSearchQuerySet(object):
+    """The part of ``SearchQuerySet`` used by resources, run in PostgreSQL.
+
+    ``contains`` and n-gram filters become ``icontains`` lookups answered
+    by trigram GIN indexes, results carry the values of ``fields`` only
+    unless ``load_all`` is called.
+    """
+
+    def __init__(self, index, queryset=None, load=False, names=None, load_queryset=None):
+        """Initialize."""
+
+        self.index = index
+        self.queryset = index.model._default_manager.all() if queryset is None else queryset
+        self.load = load
+        self.names = names
+        self.load_queryset = load_queryset
+
+    def _clone(self, queryset=None, load=None, names=None, load_queryset=None):
+        return DatabaseSearchQuerySet(
+            self.index,
+            self.queryset if queryset is None else queryset,
+            self.load if load is None else load,
+            self.names if names is None else names,
+            self.load_queryset if load_queryset is None else load_queryset)
+
+    def models(self, *models):
+        return self
+
+    def load_all(self):
+        return self._clone(load=True)
+
+    def load_all_queryset(self, model, queryset):
+        return self._clone(load_queryset=queryset)
+
+    def only(self, *names):
+        """Read only the given result attributes of ``fields``."""
+
+        return self._clone(names=[name for name in self.index.fields if name in names])
+
+    def filter(self, **filters):
+        conditions = {}
+        for key, value in filters.items():
+            name, _, lookup = key.partition('__')
+            if name.endswith('_ngram'):
+                name, lookup = name[:-len('_ngram')], 'contains'
+            if lookup == 'contains':
+                lookup = 'icontains'
+            conditions['%s__%s' % (self.index.lookup(name), lookup or 'exact')] = value
+        return self._clone(self.queryset.filter(**conditions))
+
+    def autocomplete(self, **kwargs):
+        q = ' '.join(str(value) for value in kwargs.values())
+        return self._clone(self.index.autocomplete(self.queryset, q))
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self.results())
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return self.results(k)
+        return self.results(slice(k, k + 1))[0]
+
+    def results(self, k=None):
+        """Read results with one query, two when loading objects."""
+
+        names = list(self.index.fields) if self.names is None else self.names
+        rows = self.queryset.values('pk', *[self.index.fields[name] for name in names])
+        if k is not None:
+            rows = rows[k]
+        results = []
+        for row in rows:
+            result = DatabaseResult(self.index.model, row['pk'], dict(
+                (name, row[self.index.fields[name]]) for name in names))
+            self.index.prepare(result)
+            results.append(result)
+
+        if self.load:
+            queryset = self.load_queryset
+            if queryset is None:
+                queryset = self.index.model._default_manager.all()
+            objects = queryset.in_bulk([result.pk for result in results])
+            for result in results:
+                result.object = objects.get(result.pk)
+        return results
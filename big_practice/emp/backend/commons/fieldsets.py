@@ -0,0 +1,109 @@
+"""Sparse fieldsets of resources."""
+from .custom_exception import CustomBadRequest
+from .database_search import DatabaseSearchQuerySet
+
+
+class SparseFieldsMixin(object):
+    """Serve only the fields listed by ``?fields=`` and read only their columns.
+
+    ``sparse_fields`` maps representation fields which are not plain model
+    fields, such as the nested ``user``, to the lookups they read, and
+    ``search_sparse_fields`` maps them to the stored fields of search
+    results. Querysets are narrowed with ``only()``, dropping joins of
+    relations nobody asked for, and ``id`` is always served.
+    """
+
+    sparse_fields = {}
+    search_sparse_fields = {}
+
+    def requested_fields(self, request):
+        """Get the requested field names, None when all are requested."""
+
+        if request is None or not request.GET.get('fields'):
+            return None
+        fields = set(name.strip() for name in request.GET['fields'].split(',') if name.strip())
+        unknown = (fields - set(self.fields) - set(self.sparse_fields) -
+                   set(self.search_sparse_fields) - set(['id']))
+        if unknown:
+            raise CustomBadRequest(
+                error_type='INVALID_DATA',
+                error_message='Unknown fields: %s.' % ', '.join(sorted(unknown)))
+        return fields | set(['id'])
+
+    def wants_field(self, bundle, name):
+        fields = self.requested_fields(bundle.request)
+        return fields is None or name in fields
+
+    def field_lookups(self, fields):
+        """Model lookups read by the representation of ``fields``."""
+
+        model = self._meta.object_class
+        lookups = set([model._meta.pk.name])
+        # Validators of conditional GET
+        for name in (getattr(self, 'modified_field', None), 'created_date'):
+            if name in [field.name for field in model._meta.concrete_fields]:
+                lookups.add(name)
+        for name in fields:
+            if name in self.sparse_fields:
+                lookups.update(self.sparse_fields[name])
+            elif name in self.fields and self.fields[name].attribute:
+                lookups.add(self.fields[name].attribute)
+        return sorted(lookups)
+
+    def project(self, queryset, fields):
+        """Narrow a queryset to the columns of ``fields``."""
+
+        lookups = self.field_lookups(fields)
+        relations = set(lookup.split('__')[0] for lookup in lookups if '__' in lookup)
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*sorted(relations))
+        return queryset.only(*lookups)
+
+    def get_object_list(self, request):
+        queryset = super(SparseFieldsMixin, self).get_object_list(request)
+        fields = self.requested_fields(request)
+        if fields is None:
+            return queryset
+        return self.project(queryset, fields)
+
+    def full_dehydrate(self, bundle, for_list=False):
+        """Dehydrate the requested fields only, ``dehydrate`` checks ``wants_field``."""
+
+        fields = self.requested_fields(bundle.request)
+        if fields is None:
+            return super(SparseFieldsMixin, self).full_dehydrate(bundle, for_list=for_list)
+
+        for field_name in fields & set(self.fields):
+            bundle.data[field_name] = self.fields[field_name].dehydrate(bundle, for_list=for_list)
+            method = getattr(self, 'dehydrate_%s' % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
+        return self.dehydrate(bundle)
+
+    def project_search(self, request, objects):
+        """Narrow search results to the stored fields of the requested fields.
+
+        Results loaded for ``?detail=full`` are narrowed like querysets. The
+        Whoosh backend reads whole stored documents, PostgreSQL reads the
+        columns of the requested fields only.
+        """
+
+        fields = self.requested_fields(request)
+        if fields is None:
+            return objects
+        model = self._meta.object_class
+        objects = objects.load_all_queryset(
+            model, self.project(model._default_manager.all(), fields))
+        if isinstance(objects, DatabaseSearchQuerySet):
+            names = set()
+            for name in fields:
+                names.update(self.search_sparse_fields.get(name, (name,)))
+            objects = objects.only(*names)
+        return objects
+
+    def search_data(self, request, data):
+        fields = self.requested_fields(request)
+        if fields is None:
+            return data
+        return dict((name, value) for name, value in data.items() if name in fields)
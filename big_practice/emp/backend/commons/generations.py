@@ -0,0 +1,86 @@
+"""Blue/green rebuild of the search index."""
+import shutil
+from collections import Counter
+
+from django.conf import settings
+
+from haystack import connections as haystack_connections
+from haystack.constants import DJANGO_CT
+from haystack.utils import get_model_ct
+from whoosh.query import Term
+
+from .indexing import get_index, rebuild
+from .search_cache import search_cache
+from .search_queue import search_queue
+from .whoosh_backend import (
+    GenerationalWhooshSearchBackend, activate, collect_garbage, new_generation)
+
+
+class GenerationError(Exception):
+    """Raised when a new generation does not match the database."""
+
+
+def count_documents(backend, model):
+    """Count the documents of a model in the index of ``backend``."""
+
+    with backend.index.refresh().searcher() as searcher:
+        return len(searcher.search(Term(DJANGO_CT, get_model_ct(model)), limit=None))
+
+
+def build_generation(chunk_size=None, workers=None, using='default', keep=None, report=None):
+    """Build every index into a new generation and activate it.
+
+    Updates processed from the search queue meanwhile are replayed on the
+    new generation before and after the swap. The document count of each
+    model is checked against its rows counted when the build started, off
+    by at most its replayed updates, or the generation is thrown away. Old
+    generations but the newest ``keep`` are removed, returns the activated
+    generation. ``report`` is called with the model and its rows.
+    """
+
+    keep = settings.SEARCH_INDEX_GENERATIONS_KEEP if keep is None else keep
+    live = haystack_connections[using].get_backend()
+    if not isinstance(live, GenerationalWhooshSearchBackend):
+        raise GenerationError('The search backend does not support generations')
+
+    generation = new_generation()
+    backend = live.for_generation(generation)
+    backend.setup()
+    models = haystack_connections[using].get_unified_index().get_indexed_models()
+
+    replayed = Counter()
+    search_queue.start_recording()
+    try:
+        try:
+            # Rows changed from now on are recorded and replayed
+            expected = dict((model, get_index(model, using).index_queryset(using=using).count())
+                            for model in models)
+            for model in models:
+                count = rebuild(model, chunk_size, workers, using, backend)
+                if report is not None:
+                    report(model, count)
+            while search_queue.replay.process(using=using, backend=backend, models=replayed):
+                pass
+
+            for model in models:
+                indexed = count_documents(backend, model)
+                tolerance = replayed[model._meta.label_lower]
+                if abs(indexed - expected[model]) > tolerance:
+                    raise GenerationError('%s has %d documents instead of %d rows' % (
+                        model._meta.label_lower, indexed, expected[model]))
+        except Exception:
+            shutil.rmtree(backend.path, ignore_errors=True)
+            raise
+
+        activate(live.root, generation)
+        search_cache.bump(*[model._meta.label_lower for model in models])
+        # Workers record what they wrote until recording stops, later ones
+        # see the swap and queue their batch again
+        search_queue.stop_recording()
+        while search_queue.replay.process(using=using, backend=backend):
+            pass
+    finally:
+        search_queue.stop_recording()
+
+    collect_garbage(live.root, keep)
+    return generation
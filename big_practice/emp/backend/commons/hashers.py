@@ -0,0 +1,67 @@
+"""Custom password hashers."""
+import base64
+import hashlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.hashers import BasePasswordHasher, mask_hash
+from django.utils.crypto import constant_time_compare
+from django.utils.encoding import force_bytes
+from django.utils.translation import gettext_noop as _
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """Secure password hashing using the scrypt algorithm.
+
+    The cost parameters come from ``PASSWORD_SCRYPT_N``, ``PASSWORD_SCRYPT_R``
+    and ``PASSWORD_SCRYPT_P``. Hashes made with other parameters are upgraded
+    the next time the user signs in.
+    """
+
+    algorithm = 'scrypt'
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        """Hash the password."""
+
+        assert password is not None
+        assert salt and '$' not in salt
+        n = n or settings.PASSWORD_SCRYPT_N
+        r = r or settings.PASSWORD_SCRYPT_R
+        p = p or settings.PASSWORD_SCRYPT_P
+        hash = hashlib.scrypt(
+            force_bytes(password),
+            salt=force_bytes(salt),
+            n=n, r=r, p=p,
+            maxmem=256 * n * r,
+            dklen=64)
+        hash = base64.b64encode(hash).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash)
+
+    def verify(self, password, encoded):
+        """Check the password against an encoded hash."""
+
+        algorithm, n, salt, r, p, hash = encoded.split('$', 5)
+        assert algorithm == self.algorithm
+        encoded_2 = self.encode(password, salt, int(n), int(r), int(p))
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        algorithm, n, salt, r, p, hash = encoded.split('$', 5)
+        return OrderedDict([
+            (_('algorithm'), algorithm),
+            (_('work factor'), n),
+            (_('block size'), r),
+            (_('parallelism'), p),
+            (_('salt'), mask_hash(salt)),
+            (_('hash'), mask_hash(hash)),
+        ])
+
+    def must_update(self, encoded):
+        algorithm, n, salt, r, p, hash = encoded.split('$', 5)
+        return (int(n), int(r), int(p)) != (
+            settings.PASSWORD_SCRYPT_N,
+            settings.PASSWORD_SCRYPT_R,
+            settings.PASSWORD_SCRYPT_P)
+
+    def harden_runtime(self, password, encoded):
+        pass
@@ -0,0 +1,149 @@
+"""Password hashing off the request workers."""
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from . import metrics
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool can not take more work."""
+
+
+def verify_password(password, encoded):
+    """Check a password, returns the upgraded hash when the hasher changed."""
+
+    started = time.time()
+    upgraded = []
+    valid = check_password(password, encoded, setter=upgraded.append)
+    new_encoded = make_password(password) if valid and upgraded else None
+    return (valid, new_encoded), time.time() - started
+
+
+def hash_password(password):
+    """Hash a password with the preferred hasher."""
+
+    started = time.time()
+    return make_password(password), time.time() - started
+
+
+class HashingService(object):
+    """Run password hashing in a bounded process pool.
+
+    At most ``max_queue`` operations may wait for or run in the pool, any
+    more are rejected at once with ``HashingBusy`` instead of stalling the
+    request threads. With ``workers`` set to 0 hashing runs inline.
+    """
+
+    def __init__(self, workers=None, max_queue=None, timeout=None):
+        """Initialize."""
+
+        self.workers = settings.PASSWORD_HASHING_WORKERS if workers is None else workers
+        self.max_queue = settings.PASSWORD_HASHING_MAX_QUEUE if max_queue is None else max_queue
+        self.timeout = timeout or settings.PASSWORD_HASHING_TIMEOUT
+        self._slots = threading.BoundedSemaphore(self.max_queue) if self.max_queue else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # Created on first use so each gunicorn worker forks its own pool.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def run(self, name, func, *args):
+        """Run ``func`` in the pool and record its latency under ``name``."""
+
+        if self._slots is None or not self._slots.acquire(blocking=False):
+            metrics.incr('password_hashing.rejected')
+            raise HashingBusy('Too many password hashing operations')
+
+        started = time.time()
+        if not self.workers:
+            try:
+                result, seconds = func(*args)
+            finally:
+                self._slots.release()
+        else:
+            result, seconds = self.submit(func, *args)
+
+        metrics.observe('password_hashing.' + name, seconds)
+        metrics.observe('password_hashing.%s.queue' % name, time.time() - started - seconds)
+        return result
+
+    def submit(self, func, *args):
+        """Run ``func`` in the pool, its slot is released once the pool is done.
+
+        An operation which timed out is cancelled if it still waits, or
+        keeps its slot until it finished running.
+        """
+
+        try:
+            future = self.executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self.discard_executor()
+            raise HashingBusy('Password hashing pool is broken')
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            metrics.incr('password_hashing.timeout')
+            raise HashingBusy('Password hashing timed out')
+        except BrokenProcessPool:
+            self.discard_executor()
+            raise HashingBusy('Password hashing pool is broken')
+
+    def shutdown(self):
+        """Stop the processes of the pool, a new one is started when needed."""
+
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def discard_executor(self):
+        with self._lock:
+            self._executor = None
+
+    def check_password(self, user, password):
+        """Check the password of user and upgrade its hash when needed."""
+
+        valid, new_encoded = self.run(
+            'verify', verify_password, password, user.password)
+        if new_encoded is not None:
+            user.password = new_encoded
+            user.save(update_fields=['password'])
+        return valid
+
+    def make_password(self, password):
+        """Hash a password with the preferred hasher."""
+
+        return self.run('hash', hash_password, password)
+
+    def make_passwords(self, passwords):
+        """Hash many passwords in parallel, used by bulk imports."""
+
+        started = time.time()
+        if not self.workers:
+            results = [hash_password(password) for password in passwords]
+        else:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            results = list(self.executor.map(
+                hash_password, passwords, chunksize=chunksize))
+        metrics.observe('password_hashing.bulk', time.time() - started)
+        return [encoded for encoded, _ in results]
+
+
+hashing_service = HashingService()
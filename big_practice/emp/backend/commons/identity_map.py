@@ -0,0 +1,88 @@
+"""Request scoped identity map of model instances."""
+import logging
+import threading
+
+from django.db.models.signals import post_delete, post_save
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityMap(object):
+    """Instances loaded during the current request by model and primary key.
+
+    The authentication stores the user it verified and resources ``get``
+    instances through the map, so a row is read at most once per request.
+    Saved or deleted instances are dropped from it. Outside a request
+    scope ``get`` always queries.
+    """
+
+    def __init__(self):
+        """Initialize."""
+
+        self._local = threading.local()
+
+    @property
+    def instances(self):
+        return getattr(self._local, 'instances', None)
+
+    def begin(self):
+        self._local.instances = {}
+        self._local.saved = 0
+
+    def end(self):
+        """Forget the instances of the request, returns the queries saved."""
+
+        saved = getattr(self._local, 'saved', 0)
+        self._local.instances = None
+        self._local.saved = 0
+        return saved
+
+    @staticmethod
+    def key(model, pk):
+        return model._meta.concrete_model, model._meta.pk.to_python(pk)
+
+    def add(self, instance):
+        """Remember an instance for the rest of the request."""
+
+        if self.instances is not None and instance.pk is not None:
+            self.instances[self.key(type(instance), instance.pk)] = instance
+        return instance
+
+    def get(self, model, pk):
+        """Get an instance, raises ``model.DoesNotExist`` like ``Manager.get``."""
+
+        instances = self.instances
+        if instances is not None:
+            instance = instances.get(self.key(model, pk))
+            if instance is not None:
+                self._local.saved += 1
+                return instance
+        return self.add(model._default_manager.get(pk=pk))
+
+    def discard(self, sender, instance, **kwargs):
+        """Signal handler drops a saved or deleted instance."""
+
+        if self.instances is not None and instance.pk is not None:
+            self.instances.pop(self.key(sender, instance.pk), None)
+
+
+identity_map = IdentityMap()
+post_save.connect(identity_map.discard, dispatch_uid='identity_map_post_save')
+post_delete.connect(identity_map.discard, dispatch_uid='identity_map_post_delete')
+
+
+class IdentityMapMiddleware(object):
+    """Scope the identity map to each request."""
+
+    def __init__(self, get_response):
+        """Initialize."""
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        identity_map.begin()
+        try:
+            return self.get_response(request)
+        finally:
+            logger.debug('%s %s: %d queries saved by the identity map',
+                         request.method, request.path, identity_map.end())
@@ -0,0 +1,184 @@
+"""Helpers to write haystack indexes in batches."""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
+
+from haystack import connections as haystack_connections
+from haystack.backends.whoosh_backend import WhooshSearchBackend
+from haystack.constants import DJANGO_CT, ID
+from haystack.exceptions import NotHandled, SkipDocument
+from haystack.utils import get_model_ct
+from whoosh.index import create_in, open_dir
+
+from .search_cache import search_cache
+
+
+def get_index(model, using='default'):
+    """Get the search index of a model or None when it is not indexed."""
+
+    try:
+        return haystack_connections[using].get_unified_index().get_index(model)
+    except NotHandled:
+        return None
+
+
+def update_objects(model, objects, using='default'):
+    """Index many objects of a model with one index writer."""
+
+    index = get_index(model, using)
+    objects = list(objects)
+    if index is None or not objects:
+        return
+    haystack_connections[using].get_backend().update(index, objects)
+    search_cache.bump(model._meta.label_lower)
+
+
+def prepare_documents(index, backend, objects):
+    """Yield the Whoosh documents of objects."""
+
+    for obj in objects:
+        try:
+            doc = index.full_prepare(obj)
+        except SkipDocument:
+            continue
+        for key in doc:
+            doc[key] = backend._from_python(doc[key])
+        doc.pop('boost', None)
+        yield doc
+
+
+def write_batch(updates, removals, using='default', backend=None):
+    """Apply ``{model: objects}`` updates and removals of identifiers.
+
+    Whoosh takes a file lock for each writer, so the whole batch is written
+    and committed with a single writer. It waits up to
+    ``SEARCH_INDEX_WRITER_TIMEOUT`` seconds for the lock, raises
+    ``LockError`` after that, and returns once the batch is committed.
+    """
+
+    backend = backend or haystack_connections[using].get_backend()
+    if not isinstance(backend, WhooshSearchBackend):
+        for model, objects in updates.items():
+            update_objects(model, objects, using)
+        for identifier in removals:
+            backend.remove(identifier)
+        search_cache.bump(*[identifier.rsplit('.', 1)[0] for identifier in removals])
+        return
+
+    if not backend.setup_complete:
+        backend.setup()
+    backend.index = backend.index.refresh()
+    writer = backend.index.writer(timeout=settings.SEARCH_INDEX_WRITER_TIMEOUT)
+    try:
+        for model, objects in updates.items():
+            for doc in prepare_documents(get_index(model, using), backend, objects):
+                writer.update_document(**doc)
+
+        for identifier in removals:
+            writer.delete_by_term(ID, identifier)
+    except BaseException:
+        writer.cancel()
+        raise
+    writer.commit()
+    search_cache.bump(*[model._meta.label_lower for model in updates] +
+                      [identifier.rsplit('.', 1)[0] for identifier in removals])
+
+
+def pk_ranges(queryset, chunk_size):
+    """Split a queryset into ``(start, end)`` primary key ranges."""
+
+    bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        return []
+    return [(start, start + chunk_size)
+            for start in range(bounds['low'], bounds['high'] + 1, chunk_size)]
+
+
+def build_segment(label, start, end, path, using='default'):
+    """Index one primary key range of a model, returns the number of rows.
+
+    With Whoosh the documents are written to a new index at ``path`` which
+    is merged into the live index later, other backends are updated in
+    place.
+    """
+
+    model = apps.get_model(label)
+    index = get_index(model, using)
+    connection = haystack_connections[using]
+    backend = connection.get_backend()
+    objects = index.index_queryset(using=using).filter(
+        pk__gte=start, pk__lt=end).order_by()
+
+    if not isinstance(backend, WhooshSearchBackend):
+        objects = list(objects)
+        if objects:
+            backend.update(index, objects)
+        return len(objects)
+
+    # Only the schema is needed, concurrent workers must not open or create
+    # the live index.
+    _, schema = backend.build_schema(connection.get_unified_index().all_searchfields())
+    count = 0
+    writer = create_in(path, schema).writer()
+    for doc in prepare_documents(index, backend, objects.iterator()):
+        writer.add_document(**doc)
+        count += 1
+    writer.commit()
+    return count
+
+
+def rebuild(model, chunk_size=None, workers=None, using='default', backend=None):
+    """Reindex every row of a model, returns the number of indexed rows.
+
+    Primary key ranges are prepared by ``workers`` processes, with Whoosh
+    each range becomes a segment and all segments replace the documents of
+    the model in a single commit.
+    """
+
+    chunk_size = chunk_size or settings.SEARCH_REBUILD_CHUNK_SIZE
+    workers = settings.SEARCH_REBUILD_WORKERS if workers is None else workers
+    label = model._meta.label_lower
+    backend = backend or haystack_connections[using].get_backend()
+    if not backend.setup_complete:
+        backend.setup()
+    whoosh = isinstance(backend, WhooshSearchBackend)
+    if not whoosh:
+        backend.clear(models=[model])
+
+    ranges = pk_ranges(get_index(model, using).index_queryset(using=using), chunk_size)
+    root = tempfile.mkdtemp(prefix='index_rebuild_')
+    paths = [os.path.join(root, str(number)) for number in range(len(ranges))]
+    for path in paths:
+        os.mkdir(path)
+    jobs = [(label, start, end, path, using)
+            for (start, end), path in zip(ranges, paths)]
+
+    try:
+        if workers and len(jobs) > 1:
+            # Forked workers must open their own database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                counts = list(executor.map(build_segment, *zip(*jobs)))
+        else:
+            counts = [build_segment(*job) for job in jobs]
+
+        if whoosh:
+            writer = backend.index.refresh().writer()
+            writer.delete_by_term(DJANGO_CT, get_model_ct(model))
+            for path in paths:
+                reader = open_dir(path).reader()
+                try:
+                    writer.add_reader(reader)
+                finally:
+                    reader.close()
+            writer.commit()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    search_cache.bump(label)
+    return sum(counts)
@@ -0,0 +1,77 @@
+"""Lightweight counters shared across workers through the cache."""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+METRICS_KEY_PREFIX = 'metrics:'
+METRICS_NAMES_KEY = 'metrics:names'
+
+_pending = Counter()
+_lock = threading.Lock()
+_last_flush = [time.time()]
+
+
+def incr(name, amount=1):
+    """Increase counter ``name`` by ``amount``.
+
+    Counters are buffered in process memory and pushed to the cache every
+    ``METRICS_FLUSH_INTERVAL`` seconds so the hot path never waits on Redis.
+    """
+
+    with _lock:
+        _pending[name] += amount
+        due = time.time() - _last_flush[0] >= settings.METRICS_FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def observe(name, seconds):
+    """Record one timing sample of ``name`` in milliseconds."""
+
+    incr(name + '.count')
+    incr(name + '.total_ms', int(round(seconds * 1000)))
+
+
+def flush():
+    """Push buffered counters to the shared cache."""
+
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.time()
+    if not pending:
+        return
+
+    for name, amount in pending.items():
+        key = METRICS_KEY_PREFIX + name
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, timeout=None)
+
+    names = cache.get(METRICS_NAMES_KEY) or set()
+    if not set(pending).issubset(names):
+        cache.set(METRICS_NAMES_KEY, names | set(pending), timeout=None)
+
+
+def snapshot(prefix=''):
+    """Return all counters starting with ``prefix`` summed over workers."""
+
+    flush()
+    names = sorted(
+        name for name in cache.get(METRICS_NAMES_KEY) or set()
+        if name.startswith(prefix))
+    values = cache.get_many([METRICS_KEY_PREFIX + name for name in names])
+    return dict(
+        (name, values.get(METRICS_KEY_PREFIX + name, 0)) for name in names)
+
+
+def ratio(hits, misses):
+    """Helper function to compute a hit ratio."""
+
+    total = hits + misses
+    return float(hits) / total if total else 0.0
@@ -0,0 +1,31 @@
+"""SQL of migrations which Django 2.0 operations can not express."""
+
+
+def vendor_sql(statements):
+    """Function for ``RunPython`` executing ``{vendor: [statements]}``.
+
+    Statements of other database vendors are skipped.
+    """
+
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+def create_extension(name):
+    """Function for ``RunPython`` creating a PostgreSQL extension once.
+
+    Creating an extension needs privileges the application role may not
+    have, an extension already installed by an administrator is left alone.
+    """
+
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+            installed = cursor.fetchone() is not None
+        if not installed:
+            schema_editor.execute('CREATE EXTENSION %s' % schema_editor.quote_name(name))
+    return run
@@ -0,0 +1,169 @@
+"""Offset and cursor pagination of resources."""
+import base64
+import json
+from urllib.parse import urlencode
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, QuerySet
+
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+
+
+def encode_cursor(data):
+    """Opaque token of a cursor position."""
+
+    content = json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+    return base64.urlsafe_b64encode(content).decode('ascii')
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(token, kind):
+    """Get the position of a cursor token made for ``kind`` pages.
+
+    An ``offset`` position is a non negative integer, a ``keyset`` one the
+    scalar value of the ordering field and the integer primary key.
+    """
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        position = data[kind]
+    except (ValueError, TypeError, KeyError):
+        raise BadRequest("Invalid cursor '%s' provided." % token)
+
+    if kind == 'offset':
+        valid = is_integer(position) and position >= 0
+    else:
+        valid = (isinstance(position, list) and len(position) == 2 and
+                 (position[0] is None or isinstance(position[0], (str, int, float))) and
+                 is_integer(position[1]))
+    if not valid:
+        raise BadRequest("Invalid cursor '%s' provided." % token)
+    return position
+
+
+class CursorPaginator(Paginator):
+    """Tastypie offset pages plus opaque cursor pages.
+
+    Requests without a ``cursor`` parameter get the usual offset pages.
+    Given one, empty for the first page, a queryset ordered by one field
+    continues after the ``(field, id)`` of the previous page, so deep pages
+    are range scans of the matching composite index with neither ``OFFSET``
+    nor ``COUNT(*)``. Other objects, such as search results, get cursors
+    holding their offset and a next page whenever a page is full.
+    """
+
+    def page(self):
+        cursor = self.request_data.get('cursor')
+        if cursor is None:
+            return super(CursorPaginator, self).page()
+
+        limit = self.get_limit()
+        field = self.keyset_field()
+        next_uri = None
+        if field is None:
+            # Slices stay aligned on pages of ``limit``, the Whoosh backend
+            # of haystack turns them into page numbers
+            offset = decode_cursor(cursor, 'offset') if cursor else 0
+            objects = list(self.objects[offset:offset + limit])
+            if limit and len(objects) == limit:
+                next_uri = self.cursor_uri(limit, encode_cursor({'offset': offset + limit}))
+        else:
+            objects = self.keyset_objects(field, cursor, limit)
+            if len(objects) > limit:
+                next_uri = self.cursor_uri(limit, encode_cursor({
+                    'keyset': objects[limit - 1].cursor_position}))
+        return {
+            self.collection_name: objects[:limit],
+            'meta': {
+                'limit': limit,
+                'next': next_uri,
+            },
+        }
+
+    def keyset_field(self):
+        """Ordering field of a queryset pageable by keyset, None otherwise."""
+
+        if not isinstance(self.objects, QuerySet):
+            return None
+        ordering = self.objects.query.order_by or self.objects.model._meta.ordering
+        if not ordering:
+            return 'pk'
+        # Positions are compared as columns of the model table
+        if (len(ordering) > 1 or not isinstance(ordering[0], str) or ordering[0] == '?' or
+                '__' in ordering[0]):
+            return None
+        return ordering[0]
+
+    def keyset_objects(self, field, cursor, limit):
+        """Get up to ``limit + 1`` rows after a keyset cursor.
+
+        Rows with a value are read first, after the cursor by a row value
+        comparison ``(field, id) > (value, pk)`` which the composite index
+        answers as a range. Rows without a value come last, ordered by id,
+        and are read only once the others are exhausted.
+        """
+
+        descending = field.startswith('-')
+        name = field.lstrip('-')
+        after = 'lt' if descending else 'gt'
+        position = decode_cursor(cursor, 'keyset') if cursor else None
+        if name == 'pk':
+            objects = self.objects.annotate(cursor_value=F('pk'))
+            if position is not None:
+                objects = objects.filter(**{'pk__' + after: position[1]})
+            return self.with_positions(objects.order_by(field)[:limit + 1])
+
+        objects = []
+        if position is None or position[0] is not None:
+            valued = self.objects.annotate(cursor_value=F(name)).filter(**{name + '__isnull': False})
+            if position is not None:
+                valued = self.after_row(valued, name, '<' if descending else '>', *position)
+            order = ('-' if descending else '') + name
+            objects = list(valued.order_by(order, '-pk' if descending else 'pk')[:limit + 1])
+        if len(objects) <= limit:
+            nulls = self.objects.annotate(cursor_value=F(name)).filter(**{name + '__isnull': True})
+            if position is not None and position[0] is None:
+                nulls = nulls.filter(**{'pk__' + after: position[1]})
+            objects += nulls.order_by('-pk' if descending else 'pk')[:limit + 1 - len(objects)]
+        return self.with_positions(objects)
+
+    @staticmethod
+    def after_row(objects, name, operator, value, pk):
+        """Filter rows whose ``(name, id)`` compares with ``operator`` to a position."""
+
+        model = objects.model
+        field = model._meta.get_field(name)
+        connection = connections[objects.db]
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        # Values are read back like the model field would store them
+        value = field.get_db_prep_value(field.to_python(value), connection)
+        return objects.extra(
+            where=['(%s.%s, %s.%s) %s (%%s, %%s)' % (
+                table, quote(field.column), table, quote(model._meta.pk.column), operator)],
+            params=[value, pk])
+
+    @staticmethod
+    def with_positions(objects):
+        objects = list(objects)
+        for obj in objects:
+            obj.cursor_position = [obj.cursor_value, obj.pk]
+        return objects
+
+    def cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+
+        request_params = self.request_data.copy()
+        for key in ('limit', 'offset', 'cursor'):
+            request_params.pop(key, None)
+        request_params['limit'] = str(limit)
+        request_params['cursor'] = cursor
+        if hasattr(request_params, 'urlencode'):
+            return '%s?%s' % (self.resource_uri, request_params.urlencode())
+        return '%s?%s' % (self.resource_uri, urlencode(request_params))
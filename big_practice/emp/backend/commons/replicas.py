@@ -0,0 +1,224 @@
+"""Routing of reads to replica databases."""
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+import jwt
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY_PREFIX = 'replicas:pinned:'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Seconds a PostgreSQL standby is behind, 0 once it replayed all it received
+# so an idle primary does not look lagging
+LAG_QUERY = (
+    'SELECT CASE WHEN NOT pg_is_in_recovery() '
+    'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')
+
+
+class ReplicaLag(object):
+    """Replication lag of each replica, measured at most every few seconds.
+
+    Each worker measures on its own, every
+    ``DATABASE_REPLICA_LAG_CHECK_INTERVAL`` seconds at most. A replica which
+    can not be measured counts as lagging until the next check.
+    """
+
+    def __init__(self):
+        """Initialize."""
+
+        self._lock = threading.Lock()
+        self._lags = {}
+
+    def measure(self, alias):
+        """Seconds ``alias`` is behind the primary, None when unreachable."""
+
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            # A second local database does not replicate
+            return 0.0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                return float(cursor.fetchone()[0] or 0)
+        except DatabaseError:
+            logger.warning('Can not measure the lag of replica %s', alias, exc_info=True)
+            return None
+
+    def lag(self, alias):
+        now = time.time()
+        with self._lock:
+            checked, lag = self._lags.get(alias, (None, None))
+            due = checked is None or now - checked >= settings.DATABASE_REPLICA_LAG_CHECK_INTERVAL
+            if due:
+                # Other threads keep the last measure meanwhile
+                self._lags[alias] = (now, lag)
+        if due:
+            lag = self.measure(alias)
+            with self._lock:
+                self._lags[alias] = (now, lag)
+        return lag
+
+    def healthy(self, alias):
+        lag = self.lag(alias)
+        return lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+
+    def reset(self):
+        with self._lock:
+            self._lags = {}
+
+
+replica_lag = ReplicaLag()
+
+
+class RequestState(object):
+    """Routing state of the request handled by the current thread."""
+
+    def __init__(self, request):
+        """Initialize."""
+
+        self.safe = request.method in SAFE_METHODS
+        self.user_id = token_user_id(request)
+        self.wrote = False
+        self.pinned = None
+        self.replica = None
+
+
+_local = threading.local()
+
+
+def current_state():
+    return getattr(_local, 'state', None)
+
+
+def token_user_id(request):
+    """User id claimed by the access token of a request, None without one.
+
+    The signature is not verified: the id only decides where reads go, a
+    forged one can only send them to the primary. The resource still
+    authenticates the token.
+    """
+
+    token = request.META.get('HTTP_AUTHORIZATION')
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, verify=False)
+    except jwt.InvalidTokenError:
+        return None
+    user_id = payload.get('user_id') if isinstance(payload, dict) else None
+    return user_id if isinstance(user_id, int) else None
+
+
+def pin_key(user_id):
+    return '%s%s' % (PIN_KEY_PREFIX, user_id)
+
+
+def pin(user_id):
+    """Send the reads of a user to the primary for the next few seconds."""
+
+    cache.set(pin_key(user_id), 1, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return user_id is not None and bool(cache.get(pin_key(user_id)))
+
+
+def remember_login(sender, request, user, **kwargs):
+    """Pin a user signing up or in, their token is not in the request yet."""
+
+    state = current_state()
+    if state is not None and request is not None:
+        state.user_id = user.pk
+
+
+user_logged_in.connect(remember_login, dispatch_uid='replicas_remember_login')
+
+
+class ReplicaRouter(object):
+    """Send reads of safe requests to a replica within the allowed lag.
+
+    Writes, reads out of a request, reads of unsafe requests and reads in a
+    transaction of the primary go to the primary, as do the reads of users
+    who wrote during the last ``DATABASE_REPLICA_PIN_SECONDS``. A request
+    reads from one replica picked at random among the healthy ones, or from
+    the primary when none is.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_state()
+        if state is None or not settings.DATABASE_REPLICAS:
+            return None
+        if (not state.safe or state.wrote or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        if state.pinned is None:
+            state.pinned = is_pinned(state.user_id)
+            if state.pinned:
+                metrics.incr('replicas.pinned')
+        if state.pinned:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_lag.healthy(alias)]
+            if len(replicas) < len(settings.DATABASE_REPLICAS):
+                metrics.incr('replicas.skipped', len(settings.DATABASE_REPLICAS) - len(replicas))
+            state.replica = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = current_state()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = set([DEFAULT_DB_ALIAS] + list(settings.DATABASE_REPLICAS))
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaRoutingMiddleware(object):
+    """Scope the routing state of ``ReplicaRouter`` to each request.
+
+    A user who wrote is pinned to the primary once the response is ready,
+    so their next requests read their own writes. Streamed responses read
+    their rows with the state of their request.
+    """
+
+    def __init__(self, get_response):
+        """Initialize."""
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _local.state = RequestState(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.state = None
+        if (settings.DATABASE_REPLICAS and state.wrote and state.user_id is not None and
+                response.status_code < 400):
+            pin(state.user_id)
+        if response.streaming:
+            response.streaming_content = self.stream(state, response.streaming_content)
+        return response
+
+    @staticmethod
+    def stream(state, content):
+        _local.state = state
+        try:
+            yield from content
+        finally:
+            _local.state = None
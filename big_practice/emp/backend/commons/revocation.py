@@ -0,0 +1,179 @@
+"""Revocation list of signed out access tokens."""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Add a revoked token to the exact set and to the generation log atomically,
+# so a worker never sees a generation before the matching log entry.
+REVOKE_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+local generation = redis.call('INCR', KEYS[2])
+redis.call('ZADD', KEYS[3], generation, ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', generation - tonumber(ARGV[4]))
+return generation
+"""
+
+
+class BloomFilter(object):
+    """Probabilistic set with no false negatives."""
+
+    def __init__(self, capacity, error_rate):
+        """Initialize."""
+
+        self.capacity = capacity
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(
+            self.size / float(capacity) * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, digest):
+        """Helper function to get bit positions of a hex digest."""
+
+        first = int(digest[:16], 16)
+        second = int(digest[16:32], 16) | 1
+        return [(first + i * second) % self.size
+                for i in range(self.hash_count)]
+
+    def add(self, digest):
+        """Add a hex digest."""
+
+        for position in self.positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        for position in self.positions(digest):
+            if not self.bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList(object):
+    """Revoked tokens kept in Redis and mirrored by a local bloom filter.
+
+    Redis keeps the exact set as a sorted set scored by token ``exp`` and a
+    log of recent revocations scored by a generation counter. Workers pull
+    new log entries at most every ``TOKEN_REVOCATION_SYNC_INTERVAL`` seconds,
+    so checking a token which was never revoked costs a few bit tests and
+    only possible hits are confirmed with Redis.
+    """
+
+    def __init__(self, key_prefix='revoked_tokens'):
+        """Initialize."""
+
+        self.tokens_key = key_prefix
+        self.generation_key = key_prefix + ':generation'
+        self.log_key = key_prefix + ':log'
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._generation = 0
+        self._synced_at = 0
+        self._script = None
+
+    @property
+    def redis(self):
+        return get_redis_connection('default')
+
+    def new_bloom(self):
+        return BloomFilter(
+            settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+            settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE)
+
+    def revoke(self, digest, exp):
+        """Revoke a token until its ``exp`` timestamp.
+
+        ``digest`` is the token digest given by ``token_cache.digest``.
+        """
+
+        if exp <= time.time():
+            return
+        if self._script is None:
+            self._script = self.redis.register_script(REVOKE_SCRIPT)
+        self._script(
+            keys=[self.tokens_key, self.generation_key, self.log_key],
+            args=[digest, exp, time.time(),
+                  settings.TOKEN_REVOCATION_LOG_SIZE])
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(digest)
+
+    def is_revoked(self, digest):
+        """Check if a token digest is revoked.
+
+        Until the bloom filter is built, tokens are checked with Redis.
+        While Redis is unreachable a bloom filter hit counts as revoked, and
+        tokens checked without a bloom filter get
+        ``TOKEN_REVOCATION_FAIL_CLOSED``.
+        """
+
+        if time.time() - self._synced_at >= settings.TOKEN_REVOCATION_SYNC_INTERVAL:
+            try:
+                self.sync()
+            except RedisError:
+                logger.warning('Can not sync the revocation list', exc_info=True)
+        bloom = self._bloom
+        if bloom is not None and digest not in bloom:
+            return False
+
+        # The bloom filter may answer yes for a token never revoked.
+        try:
+            exp = self.redis.zscore(self.tokens_key, digest)
+        except RedisError:
+            logger.warning('Can not check a token with the revocation list', exc_info=True)
+            return bloom is not None or settings.TOKEN_REVOCATION_FAIL_CLOSED
+        return exp is not None and exp > time.time()
+
+    def sync(self):
+        """Pull revocations done by other workers into the bloom filter."""
+
+        generation = int(self.redis.get(self.generation_key) or 0)
+        with self._lock:
+            bloom, known = self._bloom, self._generation
+        entries = []
+        if bloom is not None and generation > known:
+            entries = self.redis.zrangebyscore(self.log_key, '(%d' % known, generation)
+
+        with self._lock:
+            # Unless another thread synced meanwhile
+            if self._bloom is bloom and self._generation == known:
+                if bloom is None or len(entries) != generation - known or \
+                        bloom.count + len(entries) > bloom.capacity:
+                    self.rebuild(generation)
+                else:
+                    for digest in entries:
+                        bloom.add(digest.decode('utf-8'))
+                    self._generation = generation
+            # Only a successful sync delays the next one
+            self._synced_at = time.time()
+
+    def rebuild(self, generation):
+        """Rebuild the bloom filter from the tokens not expired yet."""
+
+        bloom = self.new_bloom()
+        for digest in self.redis.zrangebyscore(
+                self.tokens_key, '(%f' % time.time(), '+inf'):
+            bloom.add(digest.decode('utf-8'))
+        self._bloom = bloom
+        self._generation = generation
+
+    def clear(self):
+        """Remove every revocation, used by benchmarks and tests."""
+
+        self.redis.delete(self.tokens_key, self.generation_key, self.log_key)
+        with self._lock:
+            self._bloom = None
+            self._generation = 0
+            self._synced_at = 0
+
+
+revocation_list = RevocationList()
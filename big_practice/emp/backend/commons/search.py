@@ -0,0 +1,182 @@
+"""Search helpers shared by resources."""
+import time
+
+from django.conf import settings
+from django.conf.urls import url
+from django.http import HttpResponse
+
+from tastypie.bundle import Bundle
+from tastypie.utils import trailing_slash
+
+from haystack.query import RelatedSearchQuerySet
+
+from . import metrics
+from .database_search import DatabaseSearchQuerySet, get_database_index
+from .search_cache import search_cache
+from .streaming import stream_response
+
+# Shortest query the n-gram fields (NGRAM minsize=3) can answer.
+NGRAM_MIN_LENGTH = 3
+
+
+def search_queryset(model):
+    """Get a query of a model on the backend chosen by ``SEARCH_BACKEND``."""
+
+    if settings.SEARCH_BACKEND == 'postgres':
+        return DatabaseSearchQuerySet(get_database_index(model))
+    return RelatedSearchQuerySet().models(model)
+
+
+def contains(sqs, field, q):
+    """Filter results whose ``field`` contains ``q``.
+
+    The ``<field>_ngram`` index field answers the query with term lookups
+    instead of a wildcard scan of every term of ``field``.
+    """
+
+    if len(q) >= NGRAM_MIN_LENGTH:
+        return sqs.filter(**{field + '_ngram': q})
+    return sqs.filter(**{field + '__contains': q})
+
+
+class TypeaheadMixin(object):
+    """Add a ``typeahead`` endpoint answered from edge n-gram index fields.
+
+    Resources set ``typeahead_field`` to their edge n-gram field and
+    ``typeahead_display`` to the stored field shown to the user. Results
+    are built from stored fields only, so a keystroke never hits Postgres.
+    """
+
+    typeahead_field = None
+    typeahead_display = None
+
+    def typeahead_url(self):
+        """Api url of typeahead."""
+
+        return url(r"^(?P<resource_name>%s)/typeahead%s$" %
+                   (self._meta.resource_name, trailing_slash()),
+                   self.wrap_view('typeahead'),
+                   name="api_typeahead_%s" % self._meta.resource_name)
+
+    def typeahead(self, request, **kwargs):
+        """Get the first objects matching a prefix."""
+
+        started = time.time()
+        self.method_check(request, allowed=['get'])
+        self._meta.authentication.is_authenticated(request)
+        self.throttle_check(request)
+
+        q = str(request.GET.get('q', '')).strip()
+        try:
+            limit = min(int(request.GET.get('limit', settings.TYPEAHEAD_LIMIT)),
+                        settings.TYPEAHEAD_LIMIT)
+        except ValueError:
+            limit = settings.TYPEAHEAD_LIMIT
+
+        objects = []
+        if len(q) >= settings.TYPEAHEAD_MIN_LENGTH and limit > 0:
+            sqs = search_queryset(self._meta.object_class).autocomplete(
+                **{self.typeahead_field: q})
+            objects = [{'id': int(result.pk),
+                        'name': getattr(result, self.typeahead_display, '')}
+                       for result in sqs[:limit]]
+
+        self.log_throttled_access(request)
+
+        name = 'typeahead.' + self._meta.resource_name
+        elapsed = time.time() - started
+        metrics.observe(name, elapsed)
+        if elapsed * 1000 > settings.TYPEAHEAD_BUDGET_MS:
+            metrics.incr(name + '.over_budget')
+        return self.create_response(request, {'objects': objects})
+
+
+class StoredFieldsMixin(object):
+    """Build search result pages from stored index fields.
+
+    Resources implement ``search_result_data`` to turn a ``SearchResult``
+    into its list representation, so a page costs one index query and no
+    database query. Clients asking ``?detail=full`` get rows loaded from
+    the database and dehydrated as usual.
+    """
+
+    def search_result_data(self, result):
+        """List representation of a search result."""
+
+        raise NotImplementedError()
+
+    def project_search(self, request, objects):
+        """Hook narrowing search results to the fields of the request."""
+
+        return objects
+
+    def search_data(self, request, data):
+        """Hook narrowing a representation to the fields of the request."""
+
+        return data
+
+    def cached_search(self, request, q, objects):
+        """Serve a search page from ``search_cache``, build it on a miss.
+
+        Streamed pages are never cached.
+        """
+
+        if 'stream' in request.GET:
+            return self.paginator(request, objects)
+
+        endpoint = self._meta.resource_name + '.search'
+        params = dict(request.GET.lists())
+        params['q'] = q
+        params['format'] = self.determine_format(request)
+        params['backend'] = settings.SEARCH_BACKEND
+        key = search_cache.key(endpoint, self._meta.object_class._meta.label_lower, params)
+
+        def build():
+            response = self.paginator(request, objects)
+            return response.content, response['Content-Type']
+
+        content, content_type = search_cache.fetch(key, endpoint, build)
+        return HttpResponse(content, content_type=content_type)
+
+    def paginator(self, request, objects, **kwargs):
+        """Helper function to paginator result list."""
+
+        full_detail = request.GET.get('detail') == 'full'
+        objects = self.project_search(request, objects)
+        if full_detail:
+            objects = objects.load_all()
+
+        if 'stream' in request.GET:
+            if full_detail:
+                return stream_response(self, request, objects, lambda result: self.full_dehydrate(
+                    self.build_bundle(obj=result.object, request=request),
+                    for_list=True) if result.object is not None else None)
+            return stream_response(self, request, objects, lambda result: Bundle(
+                obj=result, data=self.search_data(request, self.search_result_data(result)),
+                request=request))
+
+        paginator = self._meta.paginator_class(
+            request.GET,
+            objects,
+            resource_uri=request.path,
+            limit=self._meta.limit,
+            max_limit=self._meta.max_limit,
+            collection_name=self._meta.collection_name)
+        to_be_serialized = paginator.page()
+
+        results = to_be_serialized[self._meta.collection_name]
+        if full_detail:
+            # Dehydrate the bundles in preparation for serialization.
+            bundles = [self.full_dehydrate(
+                self.build_bundle(obj=result.object, request=request),
+                for_list=True)
+                for result in results if result.object is not None]
+        else:
+            bundles = [Bundle(obj=result,
+                              data=self.search_data(request, self.search_result_data(result)),
+                              request=request)
+                       for result in results]
+
+        to_be_serialized[self._meta.collection_name] = bundles
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.create_response(request, to_be_serialized)
@@ -0,0 +1,65 @@
+"""Cache of serialized search pages."""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+
+from . import metrics
+from .tiered_cache import app_cache
+
+
+def normalize_query(q):
+    """Collapse whitespace so equivalent queries share their cache entries."""
+
+    return ' '.join(str(q).split())
+
+
+class SearchResultCache(object):
+    """Serialized search pages keyed by the index generation of their model.
+
+    Each model has a generation token in ``app_cache`` which is replaced
+    whenever its index changes, so entries of older generations are never
+    read again and expire.
+    """
+
+    def __init__(self, prefix='search_cache'):
+        """Initialize."""
+
+        self.prefix = prefix
+
+    def generation_key(self, label):
+        return '%s:generation:%s' % (self.prefix, label)
+
+    def generation(self, label):
+        """Get the index generation of a model label."""
+
+        return app_cache.get_or_set(
+            self.generation_key(label), lambda: uuid.uuid4().hex[:12], timeout=None)
+
+    def bump(self, *labels):
+        """Invalidate every entry of the given model labels."""
+
+        app_cache.invalidate(*[self.generation_key(label) for label in set(labels)])
+
+    def key(self, endpoint, label, params):
+        """Key of a page of ``endpoint`` searching the model ``label``."""
+
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+        return '%s:%s:%s:%s' % (self.prefix, endpoint, self.generation(label), digest)
+
+    def fetch(self, key, endpoint, build):
+        """Get an entry, built by one worker on a miss, and count the hit or miss."""
+
+        built = []
+
+        def compute():
+            built.append(True)
+            return build()
+
+        entry = app_cache.get_or_set(key, compute, timeout=settings.SEARCH_CACHE_TTL)
+        metrics.incr('%s.%s.%s' % (self.prefix, endpoint, 'miss' if built else 'hit'))
+        return entry
+
+
+search_cache = SearchResultCache()
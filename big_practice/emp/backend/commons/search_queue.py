@@ -0,0 +1,239 @@
+"""Queue of search index updates processed in batches."""
+import json
+import os
+import socket
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from haystack import connections as haystack_connections
+from haystack.utils import get_identifier
+from whoosh.index import LockError
+
+from . import metrics
+from .indexing import get_index, write_batch
+from .whoosh_backend import GenerationalWhooshSearchBackend, active_generation
+
+# Move a batch from the queue to the processing list of a worker atomically,
+# so items of a worker which dies before acknowledging them can be requeued.
+POP_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+redis.call('LTRIM', KEYS[1], #items, -1)
+for _, item in ipairs(items) do
+    redis.call('RPUSH', KEYS[2], item)
+end
+return items
+"""
+
+# Copy items to the replay queue only while recording, so no item is pushed
+# after the rebuild stopped recording and drained the replay queue.
+RECORD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    for _, item in ipairs(ARGV) do
+        redis.call('RPUSH', KEYS[2], item)
+    end
+end
+"""
+
+
+class SearchQueue(object):
+    """Durable queue of dirty objects kept in a Redis list.
+
+    Each worker moves its batch to a processing list of its own and marks
+    itself alive for ``SEARCH_QUEUE_CONSUMER_TIMEOUT`` seconds whenever it
+    pops. ``requeue_dead`` puts back the batches of workers which stopped
+    marking themselves alive.
+    """
+
+    def __init__(self, key='search_queue'):
+        """Initialize."""
+
+        self.key = key
+        self.consumers_key = key + ':consumers'
+        self.recording_key = key + ':recording'
+        self._script = None
+        self._record_script = None
+        self._replay = None
+
+    @property
+    def redis(self):
+        return get_redis_connection('default')
+
+    @staticmethod
+    def item(action, instance):
+        """Describe that ``instance`` must be updated or deleted."""
+
+        return {
+            'action': action,
+            'model': instance._meta.label_lower,
+            'pk': instance.pk,
+            'identifier': get_identifier(instance),
+            'time': time.time()
+        }
+
+    def push(self, *items):
+        """Append items made by ``item`` to the queue."""
+
+        if items:
+            self.redis.rpush(self.key, *[json.dumps(item) for item in items])
+
+    def __len__(self):
+        return self.redis.llen(self.key)
+
+    @property
+    def consumer(self):
+        """Name of the current worker process."""
+
+        return '%s:%d' % (socket.gethostname(), os.getpid())
+
+    def processing_key_of(self, consumer):
+        return '%s:processing:%s' % (self.key, consumer)
+
+    def alive_key(self, consumer):
+        return '%s:alive:%s' % (self.key, consumer)
+
+    @property
+    def processing_key(self):
+        """Processing list of the current worker."""
+
+        return self.processing_key_of(self.consumer)
+
+    def pop(self, size):
+        """Move up to ``size`` items to the processing list and return them."""
+
+        consumer = self.consumer
+        pipe = self.redis.pipeline()
+        pipe.sadd(self.consumers_key, consumer)
+        pipe.set(self.alive_key(consumer), 1, ex=settings.SEARCH_QUEUE_CONSUMER_TIMEOUT)
+        pipe.execute()
+        if self._script is None:
+            self._script = self.redis.register_script(POP_SCRIPT)
+        return [json.loads(item.decode('utf-8')) for item in self._script(
+            keys=[self.key, self.processing_key_of(consumer)], args=[size])]
+
+    def ack(self):
+        """Forget the items of the batch processed by the current worker."""
+
+        self.redis.delete(self.processing_key)
+
+    def requeue(self, consumer=None):
+        """Put back items of a batch which was never acknowledged.
+
+        Only the batch of ``consumer``, the current worker by default.
+        """
+
+        processing_key = self.processing_key_of(consumer or self.consumer)
+        while self.redis.rpoplpush(processing_key, self.key) is not None:
+            pass
+
+    def requeue_dead(self):
+        """Put back the batches of workers no longer alive, returns their number."""
+
+        dead = 0
+        for consumer in self.redis.smembers(self.consumers_key):
+            consumer = consumer.decode('utf-8')
+            if consumer == self.consumer or self.redis.exists(self.alive_key(consumer)):
+                continue
+            self.requeue(consumer)
+            self.redis.srem(self.consumers_key, consumer)
+            dead += 1
+        return dead
+
+    @property
+    def replay(self):
+        """Queue of the items processed while recording."""
+
+        if self._replay is None:
+            self._replay = SearchQueue(self.key + ':replay')
+        return self._replay
+
+    def start_recording(self):
+        """Copy processed items to ``replay`` until ``stop_recording``.
+
+        Used while a new index generation is built, the items are replayed
+        on it before it is activated.
+        """
+
+        self.redis.delete(self.replay.key, self.replay.processing_key)
+        self.redis.set(self.recording_key, 1)
+
+    def stop_recording(self):
+        self.redis.delete(self.recording_key)
+
+    def record(self, items):
+        """Copy processed items to ``replay`` while recording."""
+
+        if self._record_script is None:
+            self._record_script = self.redis.register_script(RECORD_SCRIPT)
+        self._record_script(keys=[self.recording_key, self.replay.key],
+                            args=[json.dumps(item) for item in items])
+
+    def process(self, size=None, using='default', backend=None, models=None):
+        """Index one batch, returns the number of queued items it handled.
+
+        Repeated items of the same object are coalesced, the current rows are
+        loaded with one query per model and all changes are written with one
+        index writer, to ``backend`` when given. A batch written to a
+        generation swapped out meanwhile is queued again for the new one.
+        ``models`` counts the handled items by model label.
+        """
+
+        items = self.pop(size or settings.SEARCH_QUEUE_BATCH_SIZE)
+        if not items:
+            return 0
+        if models is not None:
+            models.update(item['model'] for item in items)
+
+        # Keep the last action and the first queued time of each object
+        latest = {}
+        for item in items:
+            key = (item['model'], item['pk'])
+            queued_at = latest[key]['time'] if key in latest else item['time']
+            latest[key] = dict(item, time=queued_at)
+
+        updates = {}
+        removals = set()
+        for item in latest.values():
+            if item['action'] == 'delete':
+                removals.add(item['identifier'])
+            else:
+                updates.setdefault(item['model'], {})[item['pk']] = item['identifier']
+
+        objects = {}
+        for label, identifiers in updates.items():
+            model = apps.get_model(label)
+            index = get_index(model, using)
+            found = list(index.index_queryset(using=using).filter(pk__in=list(identifiers)))
+            objects[model] = found
+            # Rows deleted since they were queued are removed from the index
+            found_pks = set(obj.pk for obj in found)
+            removals.update(identifier for pk, identifier in identifiers.items()
+                            if pk not in found_pks)
+
+        written = backend or haystack_connections[using].get_backend()
+        try:
+            write_batch(objects, removals, using, written)
+        except LockError:
+            # Retried by the next call, acknowledged only once committed
+            self.requeue()
+            metrics.incr('search_queue.locked')
+            return 0
+        # Recorded before checking the generation: once recording stopped
+        # the swap is done and the check sees it
+        self.record(items)
+        if (isinstance(written, GenerationalWhooshSearchBackend) and not written.pinned and
+                written.generation != active_generation(written.root)):
+            self.push(*items)
+        self.ack()
+
+        now = time.time()
+        for item in latest.values():
+            metrics.observe('search_queue.lag', now - item['time'])
+        metrics.incr('search_queue.processed', len(items))
+        metrics.incr('search_queue.coalesced', len(items) - len(latest))
+        return len(items)
+
+
+search_queue = SearchQueue()
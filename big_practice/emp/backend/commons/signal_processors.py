@@ -0,0 +1,94 @@
+"""Haystack signal processors."""
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+
+from haystack.exceptions import NotHandled
+from haystack.signals import BaseSignalProcessor
+
+from .bulk import in_bulk_write
+from .search_cache import search_cache
+from .search_queue import search_queue
+
+
+class QueuedSignalProcessor(BaseSignalProcessor):
+    """Queue index updates instead of writing the index in the request.
+
+    Saved and deleted objects of indexed models are pushed to the search
+    queue once the transaction commits, ``manage.py process_search_queue``
+    writes them to the index in batches. Bulk writes queue their own batch.
+
+    Indexed objects storing fields of another model are queued as well when
+    a row of that model changes, see ``dependents``.
+    """
+
+    # Label of a model whose fields are stored in other indexes: the indexed
+    # model, the relation leading to the saved row and the stored fields
+    dependents = {
+        settings.AUTH_USER_MODEL.lower(): [
+            ('account.employee', 'user', ('email', 'first_name', 'last_name')),
+            ('contact.contact', 'user', ('username',)),
+        ],
+        'department.department': [
+            ('account.employee', 'department', ('name',)),
+        ],
+    }
+
+    def setup(self):
+        models.signals.post_save.connect(self.handle_save)
+        models.signals.post_delete.connect(self.handle_delete)
+
+    def teardown(self):
+        models.signals.post_save.disconnect(self.handle_save)
+        models.signals.post_delete.disconnect(self.handle_delete)
+
+    def is_indexed(self, sender):
+        """Check if the model has a search index."""
+
+        for using in self.connection_router.for_write():
+            try:
+                self.connections[using].get_unified_index().get_index(sender)
+                return True
+            except NotHandled:
+                pass
+        return False
+
+    def handle_save(self, sender, instance, **kwargs):
+        if kwargs.get('raw') or in_bulk_write():
+            return
+        # A new row is stored in no index yet
+        items = [] if kwargs.get('created') else self.dependent_items(
+            instance, kwargs.get('update_fields'))
+        if self.is_indexed(sender):
+            items.append(search_queue.item('update', instance))
+        self.enqueue(*items)
+
+    def dependent_items(self, instance, update_fields):
+        """Items updating the indexed objects which store fields of ``instance``."""
+
+        items = []
+        for label, lookup, fields in self.dependents.get(instance._meta.label_lower, []):
+            # Saves of other fields, like last_login on sign in, change no page
+            if update_fields is not None and not set(fields) & set(update_fields):
+                continue
+            model = apps.get_model(label)
+            related = model._default_manager.filter(**{lookup: instance.pk}).only('pk')
+            items.extend(search_queue.item('update', obj) for obj in related.iterator())
+        return items
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if in_bulk_write() or not self.is_indexed(sender):
+            return
+        # The primary key is cleared once the object is deleted
+        self.enqueue(search_queue.item('delete', instance))
+
+    def enqueue(self, *items):
+        if not items:
+            return
+
+        def push():
+            search_queue.push(*items)
+            # The database backend sees the change as soon as it commits
+            if settings.SEARCH_BACKEND == 'postgres':
+                search_cache.bump(*[item['model'] for item in items])
+        transaction.on_commit(push)
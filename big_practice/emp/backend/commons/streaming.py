@@ -0,0 +1,114 @@
+"""Streaming responses of large lists."""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+
+from .custom_exception import CustomBadRequest
+
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_objects(objects, offset, limit, chunk_size):
+    """Iterate ``limit`` objects from ``offset``, ``chunk_size`` at a time.
+
+    Querysets use a chunked iterator, server side cursors on PostgreSQL,
+    read in a transaction so the cursor is not declared ``WITH HOLD``, which
+    would copy the whole result on the server. Other objects are sliced on chunk boundaries, which the Whoosh backend
+    of haystack needs, from a fresh clone so no result cache grows.
+    """
+
+    if isinstance(objects, QuerySet):
+        with transaction.atomic(using=objects.db):
+            yield from objects[offset:offset + limit].iterator(chunk_size=chunk_size)
+        return
+
+    position = offset - offset % chunk_size
+    sent = 0
+    while sent < limit:
+        source = objects._clone() if hasattr(objects, '_clone') else objects
+        chunk = list(source[position:position + chunk_size])
+        for obj in chunk[max(offset - position, 0):][:limit - sent]:
+            yield obj
+            sent += 1
+        if len(chunk) < chunk_size:
+            return
+        position += chunk_size
+
+
+def stream_response(resource, request, objects, dehydrate):
+    """Stream the objects of a list as JSON or NDJSON without building it.
+
+    ``?stream=json`` writes the usual ``meta`` and ``objects`` keys, without
+    ``total_count``, and ``?stream=ndjson`` one object per line. ``limit``
+    defaults to and is capped by ``STREAM_MAX_ROWS``, objects ``dehydrate``
+    turns into None are skipped.
+    """
+
+    kind = request.GET.get('stream')
+    if kind not in STREAM_CONTENT_TYPES:
+        raise CustomBadRequest(
+            error_type='INVALID_DATA',
+            error_message='stream must be one of %s.' % ', '.join(sorted(STREAM_CONTENT_TYPES)))
+    try:
+        offset = int(request.GET.get('offset', 0))
+        limit = int(request.GET.get('limit', 0))
+    except ValueError:
+        raise CustomBadRequest(
+            error_type='INVALID_DATA',
+            error_message='limit and offset must be integers.')
+    if offset < 0 or limit < 0:
+        raise CustomBadRequest(
+            error_type='INVALID_DATA',
+            error_message='limit and offset must be positive.')
+    limit = min(limit or settings.STREAM_MAX_ROWS, settings.STREAM_MAX_ROWS)
+
+    bundles = (dehydrate(obj) for obj in iter_objects(
+        objects, offset, limit, settings.STREAM_CHUNK_SIZE))
+    rows = (resource.serialize(request, bundle, 'application/json')
+            for bundle in bundles if bundle is not None)
+    if kind == 'ndjson':
+        content = (row + '\n' for row in rows)
+    else:
+        content = json_list(resource, request, rows, {'limit': limit, 'offset': offset})
+    return StreamingHttpResponse(content, content_type=STREAM_CONTENT_TYPES[kind])
+
+
+def json_list(resource, request, rows, meta):
+    """Write a list document around serialized rows as they come."""
+
+    yield '{"meta": %s, "%s": [' % (
+        resource.serialize(request, meta, 'application/json'),
+        resource._meta.collection_name)
+    separator = ''
+    for row in rows:
+        yield separator + row
+        separator = ', '
+    yield ']}'
+
+
+class StreamingListMixin(object):
+    """Serve list endpoints as a stream when ``stream`` is requested."""
+
+    def dispatch_list(self, request, **kwargs):
+        # dispatch turns anything but an HttpResponse into 204 No Content
+        if request.method != 'GET' or 'stream' not in request.GET:
+            return super(StreamingListMixin, self).dispatch_list(request, **kwargs)
+
+        self.method_check(request, allowed=self._meta.list_allowed_methods)
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        response = self.stream_list(request, **kwargs)
+        self.log_throttled_access(request)
+        return response
+
+    def stream_list(self, request, **kwargs):
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        return stream_response(
+            self, request, self.apply_sorting(objects, options=request.GET),
+            lambda obj: self.full_dehydrate(
+                self.build_bundle(obj=obj, request=request), for_list=True))
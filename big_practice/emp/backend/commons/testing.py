@@ -0,0 +1,147 @@
+"""Test helpers shared by apps."""
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from haystack import connections as haystack_connections
+
+
+class QueryBudgetMixin(object):
+    """Check endpoints run the same number of queries whatever their rows.
+
+    Mixed in test cases so a field reading a relation row by row fails as
+    soon as it is added to a resource.
+    """
+
+    budget_sizes = (1, 20, 100)
+
+    def assertQueryCountConstant(self, create_rows, request):
+        """Assert ``request()`` runs as many queries at every budget size.
+
+        ``create_rows(count)`` creates rows until ``count`` of them exist.
+        A first request warms caches such as the verified access tokens,
+        the first queries of the largest size are shown on failure.
+        """
+
+        counts = []
+        for size in self.budget_sizes:
+            create_rows(size)
+            request()
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            self.assertEqual(response.status_code, 200, response.content)
+            counts.append(len(context.captured_queries))
+
+        if len(set(counts)) > 1:
+            self.fail('Queries grow with rows: %s\n%s' % (
+                ', '.join('%d rows: %d queries' % pair for pair in zip(self.budget_sizes, counts)),
+                '\n'.join(query['sql'] for query in context.captured_queries[:10])))
+
+
+def explain(query, using='default'):
+    """Get the plan lines of a captured query.
+
+    PostgreSQL plans with sequential scans disabled, so a ``Seq Scan`` left
+    in the plan means no index can answer the query whatever the table size.
+    """
+
+    db = connections[using]
+    with db.cursor() as cursor:
+        if db.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute('EXPLAIN ' + query)
+                return [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        cursor.execute('EXPLAIN QUERY PLAN ' + query)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_sequential_scan(line):
+    """Check if a plan line reads a whole table instead of an index."""
+
+    if line.lstrip(' ->').startswith('Seq Scan'):
+        return True
+    # SQLite scans name the index they walk, if any. A covering index
+    # walked from end to end is read instead of the table, as a whole.
+    return (line.startswith('SCAN ') and
+            ('USING' not in line or 'USING COVERING INDEX' in line) and
+            'CONSTANT ROW' not in line and 'SUBQUERY' not in line)
+
+
+def is_index_range(line):
+    """Check if a plan line reads an index from a bound rather than whole."""
+
+    bounded = '>' in line or '<' in line
+    if 'Index Cond:' in line:
+        return bounded
+    return line.startswith('SEARCH ') and 'INDEX' in line and bounded
+
+
+def is_merge(line):
+    """Check if a plan line merges OR branches or sorts rows read unordered."""
+
+    return (line.startswith(('MULTI-INDEX OR', 'USE TEMP B-TREE')) or
+            line.lstrip(' ->').startswith(('Sort', 'BitmapOr')))
+
+
+class QueryPlanMixin(object):
+    """Check the queries of an endpoint are answered by indexes."""
+
+    def assertNoSequentialScans(self, run, using='default'):
+        """Assert no ``SELECT`` run by ``run()`` scans a whole table.
+
+        Run it against seeded rows, plans are explained with ``EXPLAIN``
+        and every offending query is shown with its plan on failure.
+        """
+
+        with CaptureQueriesContext(connections[using]) as context:
+            run()
+        failures = []
+        for query in context.captured_queries:
+            if not query['sql'].lstrip().upper().startswith('SELECT'):
+                continue
+            plan = explain(query['sql'], using)
+            if any(is_sequential_scan(line) for line in plan):
+                failures.append('%s\n    %s' % (query['sql'], '\n    '.join(plan)))
+        if failures:
+            self.fail('Sequential scans:\n%s' % '\n'.join(failures))
+
+    def assertIndexRange(self, sql, using='default'):
+        """Assert a query reads one range of an index, already in order."""
+
+        plan = explain(sql, using)
+        if any(is_merge(line) for line in plan) or not any(is_index_range(line) for line in plan):
+            self.fail('Not an index range:\n%s\n    %s' % (sql, '\n    '.join(plan)))
+
+
+class TemporarySearchIndexMixin(object):
+    """Write the search index of each test to a temporary directory.
+
+    Rebuilds and swaps of generations must not touch the index of the
+    configured ``PATH``, which may be the one checked in.
+    """
+
+    def setUp(self):
+        super(TemporarySearchIndexMixin, self).setUp()
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, True)
+        override = override_settings(HAYSTACK_CONNECTIONS=dict(
+            settings.HAYSTACK_CONNECTIONS,
+            default=dict(settings.HAYSTACK_CONNECTIONS['default'], PATH=path)))
+        override.enable()
+        self.addCleanup(self.load_search_connections)
+        self.addCleanup(override.disable)
+        self.load_search_connections()
+
+    @staticmethod
+    def load_search_connections():
+        # Haystack reads its settings once
+        haystack_connections.connections_info = settings.HAYSTACK_CONNECTIONS
+        haystack_connections.reload('default')
@@ -0,0 +1,84 @@
+import time
+import uuid
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from ..tiered_cache import TieredCache
+
+
+class TieredCacheTestCase(SimpleTestCase):
+    """Test suite for the two tier application cache."""
+
+    def setUp(self):
+        self.prefix = 'test_cache_' + uuid.uuid4().hex
+        self.cache = TieredCache(self.prefix)
+        self.cache.start_listener()
+        self.assertTrue(self.cache.subscribed.wait(1))
+
+    def test_serves_stale_value_while_another_worker_recomputes(self):
+        self.assertEqual(self.cache.get_or_set('key', lambda: 1, timeout=60), 1)
+        cache.set(self.cache.shared_key('key'), (1, time.time() - 1, 0.0))
+        self.cache.clear_local()
+
+        self.cache.redis.set(self.cache.lock_key('key'), 'other worker')
+        self.assertEqual(self.cache.get_or_set('key', lambda: 2, timeout=60), 1)
+
+        self.cache.redis.delete(self.cache.lock_key('key'))
+        self.assertEqual(self.cache.get_or_set('key', lambda: 2, timeout=60), 2)
+        self.assertEqual(self.cache.get_or_set('key', lambda: 3, timeout=60), 2)
+
+    def test_refreshes_costly_values_early(self):
+        entry = (1, time.time() + 60, 0.0)
+        self.assertFalse(self.cache.should_refresh(entry))
+        entry = (1, time.time() + 60, 3600.0)
+        self.assertTrue(any(self.cache.should_refresh(entry) for _ in range(10)))
+
+    def test_invalidation_drops_local_entries_of_other_workers(self):
+        other = TieredCache(self.prefix)
+        other.start_listener()
+        self.assertTrue(other.subscribed.wait(1))
+
+        self.assertEqual(self.cache.get_or_set('key', lambda: 1), 1)
+        self.assertEqual(other.get_or_set('key', lambda: 2), 1)
+        self.assertIsNotNone(other.get_local('key'))
+
+        self.cache.invalidate('key')
+        deadline = time.time() + 1
+        while other.get_local('key') is not None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertIsNone(other.get_local('key'))
+        self.assertEqual(other.get_or_set('key', lambda: 3), 3)
+
+    def test_value_read_before_an_invalidation_is_not_kept_locally(self):
+        cache.set(self.cache.shared_key('key'), (1, time.time() + 60, 0.0))
+        get = cache.get
+
+        def read_then_invalidate(key):
+            # The invalidation message arrives between the read and set_local
+            entry = get(key)
+            self.cache.drop_local('key')
+            return entry
+
+        with mock.patch('backend.commons.tiered_cache.cache.get',
+                        side_effect=read_then_invalidate):
+            self.assertEqual(self.cache.get_or_set('key', lambda: 2), 1)
+        self.assertIsNone(self.cache.get_local('key'))
+
+        # Reads started after the drop are kept again
+        self.assertEqual(self.cache.get_or_set('key', lambda: 2), 1)
+        self.assertIsNotNone(self.cache.get_local('key'))
+
+    def test_value_computed_before_an_invalidation_is_not_written_back(self):
+        def compute_then_invalidate():
+            # Another worker invalidates the key while the old value is computed
+            self.cache.invalidate('key')
+            return 1
+
+        self.assertEqual(self.cache.get_or_set('key', compute_then_invalidate), 1)
+        self.assertIsNone(cache.get(self.cache.shared_key('key')))
+        self.assertIsNone(self.cache.get_local('key'))
+
+        self.assertEqual(self.cache.get_or_set('key', lambda: 2), 2)
+        self.assertEqual(cache.get(self.cache.shared_key('key'))[0], 2)
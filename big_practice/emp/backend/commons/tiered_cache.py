@@ -0,0 +1,297 @@
+"""Two tier cache of application values."""
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from . import metrics
+
+# Release a recompute lock only if it is still held by the same worker.
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Store a computed value only if its key was not invalidated since the
+# compute started, which bumps the version in KEYS[2].
+SET_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('SET', KEYS[1], ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+# Seconds between two checks of a value another worker is computing.
+WAIT_INTERVAL = 0.05
+
+DEFAULT_TIMEOUT = object()
+
+
+class TieredCache(object):
+    """Values cached in process memory in front of the shared Redis cache.
+
+    Redis keeps each value with the time it took to compute. Readers refresh
+    it early with a probability growing as it nears expiry, and only the one
+    holding the recompute lock of a key computes it while others serve the
+    previous value, kept ``APP_CACHE_STALE_TTL`` seconds past expiry for
+    that. Invalidations are published so every worker drops its local copy,
+    local entries are trusted ``APP_CACHE_LOCAL_TTL`` seconds at most in
+    case a message is lost.
+
+    Each drop of the local tier takes the next invalidation sequence number.
+    A value read from Redis or computed is kept locally only if its key was
+    not dropped since the read started, as the drop may be for that value.
+    Likewise invalidations bump a version of the key in Redis, and a value
+    is written back to Redis only if the version is the one read before
+    computing it.
+    """
+
+    def __init__(self, prefix='app_cache'):
+        """Initialize."""
+
+        self.prefix = prefix
+        self.channel = prefix + ':invalidate'
+        self.subscribed = threading.Event()
+        self._entries = OrderedDict()
+        # Sequence number of the last drop of recently dropped keys, reads
+        # started before ``_dropped_floor`` are refused for any key
+        self._sequence = 0
+        self._dropped = OrderedDict()
+        self._dropped_floor = 0
+        self._lock = threading.Lock()
+        self._listener_pid = None
+        self._release_script = None
+        self._set_script = None
+
+    @property
+    def redis(self):
+        return get_redis_connection('default')
+
+    def shared_key(self, key):
+        return '%s:%s' % (self.prefix, key)
+
+    def lock_key(self, key):
+        return '%s:lock:%s' % (self.prefix, key)
+
+    def version_key(self, key):
+        return '%s:version:%s' % (self.prefix, key)
+
+    def get_or_set(self, key, compute, timeout=DEFAULT_TIMEOUT):
+        """Get the value of ``key``, calling ``compute`` when it is missing.
+
+        ``timeout`` defaults to ``CACHE_TTL`` seconds, None never expires.
+        """
+
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = settings.CACHE_TTL
+        self.start_listener()
+
+        entry = self.get_local(key)
+        if entry is not None:
+            metrics.incr(self.prefix + '.local_hit')
+            return entry[0]
+
+        sequence = self.sequence()
+        entry = cache.get(self.shared_key(key))
+        if entry is not None and not self.should_refresh(entry):
+            metrics.incr(self.prefix + '.shared_hit')
+            self.set_local(key, entry, sequence)
+            return entry[0]
+        return self.recompute(key, compute, timeout, entry, sequence)
+
+    def should_refresh(self, entry):
+        """Decide if a value should be refreshed before it expires.
+
+        A value which took ``delta`` seconds to compute is refreshed
+        ``delta * beta * -log(u)`` seconds early for a uniform ``u``, so
+        costly values are refreshed sooner and workers rarely agree.
+        """
+
+        _, expires_at, delta = entry
+        if expires_at is None:
+            return False
+        early = -delta * settings.APP_CACHE_EARLY_REFRESH_BETA * math.log(1.0 - random.random())
+        return time.time() + early >= expires_at
+
+    def recompute(self, key, compute, timeout, stale, sequence):
+        """Compute a value under the lock of its key.
+
+        Workers not holding the lock serve ``stale`` when there is one or
+        wait for the value, up to ``APP_CACHE_LOCK_TIMEOUT`` seconds.
+        ``sequence`` is the invalidation sequence number before the read of
+        ``stale``.
+        """
+
+        token = uuid.uuid4().hex
+        lock_key = self.lock_key(key)
+        deadline = time.time() + settings.APP_CACHE_LOCK_TIMEOUT
+        acquired = self.redis.set(lock_key, token, nx=True, ex=settings.APP_CACHE_LOCK_TIMEOUT)
+        while not acquired:
+            if stale is not None:
+                metrics.incr(self.prefix + '.stale')
+                return stale[0]
+            if time.time() >= deadline:
+                # The holder is too slow, compute the value as well
+                break
+            time.sleep(WAIT_INTERVAL)
+            sequence = self.sequence()
+            entry = cache.get(self.shared_key(key))
+            if entry is not None:
+                metrics.incr(self.prefix + '.shared_hit')
+                self.set_local(key, entry, sequence)
+                return entry[0]
+            acquired = self.redis.set(lock_key, token, nx=True, ex=settings.APP_CACHE_LOCK_TIMEOUT)
+
+        try:
+            metrics.incr(self.prefix + ('.miss' if stale is None else '.early_refresh'))
+            version = self.redis.get(self.version_key(key)) or b''
+            started = time.time()
+            value = compute()
+            now = time.time()
+            entry = (value, None if timeout is None else now + timeout, now - started)
+            if self.set_shared(key, entry, timeout, version):
+                self.set_local(key, entry, sequence)
+            else:
+                metrics.incr(self.prefix + '.shared_skipped')
+            return value
+        finally:
+            if acquired:
+                if self._release_script is None:
+                    self._release_script = self.redis.register_script(RELEASE_SCRIPT)
+                self._release_script(keys=[lock_key], args=[token])
+
+    def set_shared(self, key, entry, timeout, version):
+        """Store an entry in Redis unless its key was invalidated since ``version``."""
+
+        if self._set_script is None:
+            self._set_script = self.redis.register_script(SET_SCRIPT)
+        client = cache.client
+        return self._set_script(
+            keys=[str(client.make_key(self.shared_key(key))), self.version_key(key)],
+            args=[version, client.encode(entry),
+                  '' if timeout is None else timeout + settings.APP_CACHE_STALE_TTL])
+
+    def invalidate(self, *keys):
+        """Drop keys from Redis and from the local tier of every worker."""
+
+        if not keys:
+            return
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.incr(self.version_key(key))
+            pipe.expire(self.version_key(key), settings.APP_CACHE_VERSION_TTL)
+        pipe.execute()
+        cache.delete_many([self.shared_key(key) for key in keys])
+        self.drop_local(*keys)
+        self.redis.publish(self.channel, json.dumps(keys))
+
+    def get_local(self, key):
+        """Get an entry from the process memory tier."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def sequence(self):
+        """Get the invalidation sequence number, to take before a read."""
+
+        with self._lock:
+            return self._sequence
+
+    def set_local(self, key, entry, sequence):
+        """Store an entry read at ``sequence`` in the process memory tier.
+
+        The entry is skipped when its key was dropped since ``sequence``.
+        """
+
+        expires_at = time.time() + settings.APP_CACHE_LOCAL_TTL
+        if entry[1] is not None:
+            expires_at = min(expires_at, entry[1])
+        with self._lock:
+            if max(self._dropped.get(key, 0), self._dropped_floor) > sequence:
+                metrics.incr(self.prefix + '.local_skipped')
+                return
+            self._entries[key] = (entry, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.APP_CACHE_LOCAL_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def drop_local(self, *keys):
+        with self._lock:
+            self._sequence += 1
+            for key in keys:
+                self._entries.pop(key, None)
+                self._dropped[key] = self._sequence
+                self._dropped.move_to_end(key)
+            while len(self._dropped) > settings.APP_CACHE_LOCAL_MAX_SIZE:
+                _, sequence = self._dropped.popitem(last=False)
+                self._dropped_floor = max(self._dropped_floor, sequence)
+
+    def clear_local(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._sequence += 1
+        self._entries.clear()
+        self._dropped.clear()
+        self._dropped_floor = self._sequence
+
+    def start_listener(self):
+        """Listen to invalidations in a daemon thread, once per process."""
+
+        pid = os.getpid()
+        if self._listener_pid == pid:
+            return
+        with self._lock:
+            if self._listener_pid == pid:
+                return
+            self._listener_pid = pid
+            # Entries of a forked worker were never invalidated in it
+            self._clear()
+            self.subscribed = threading.Event()
+
+        thread = threading.Thread(target=self.listen, name=self.channel)
+        thread.daemon = True
+        thread.start()
+
+    def listen(self):
+        """Drop local entries of the keys invalidated by any worker."""
+
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Messages published while not subscribed are lost
+                self.clear_local()
+                self.subscribed.set()
+                for message in pubsub.listen():
+                    self.drop_local(*json.loads(message['data'].decode('utf-8')))
+            except RedisError:
+                self.subscribed.clear()
+                time.sleep(1)
+
+
+app_cache = TieredCache()
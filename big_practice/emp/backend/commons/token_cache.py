@@ -0,0 +1,141 @@
+"""Cache of verified access tokens."""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+TOKEN_KEY_PREFIX = 'token_cache:token:'
+VERSION_KEY_PREFIX = 'token_cache:version:'
+
+
+class VerifiedTokenCache(object):
+    """Two tier cache mapping a token digest to the verified ``User``.
+
+    The first tier is a bounded LRU in process memory, the second one is the
+    shared Redis cache so every gunicorn worker can reuse a verification.
+    Entries never outlive the token ``exp``. Each user has a version counter
+    in Redis which is bumped when the user is saved or deleted, so shared
+    entries of the old version are ignored and local entries are re-checked
+    after ``TOKEN_CACHE_LOCAL_TTL`` seconds at most.
+    """
+
+    def __init__(self, max_size=None, local_ttl=None):
+        """Initialize."""
+
+        self.max_size = max_size or settings.TOKEN_CACHE_MAX_SIZE
+        self.local_ttl = local_ttl or settings.TOKEN_CACHE_LOCAL_TTL
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(access_token):
+        """Helper function to get the cache key of a token."""
+
+        if not isinstance(access_token, bytes):
+            access_token = access_token.encode('utf-8')
+        return hashlib.sha256(access_token).hexdigest()
+
+    def get_local(self, digest):
+        """Get user from the process memory tier."""
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+
+        metrics.incr('token_cache.local_hit')
+        return copy.copy(user)
+
+    def get_shared(self, digest, payload):
+        """Get user from the redis tier for a decoded token payload."""
+
+        version_key = VERSION_KEY_PREFIX + str(payload['user_id'])
+        token_key = TOKEN_KEY_PREFIX + digest
+        values = cache.get_many([token_key, version_key])
+        entry = values.get(token_key)
+        if entry is None or entry[1] != values.get(version_key, 0):
+            metrics.incr('token_cache.miss')
+            return None
+
+        metrics.incr('token_cache.shared_hit')
+        self.set_local(digest, entry[0], payload['exp'])
+        return copy.copy(entry[0])
+
+    def version(self, user_id):
+        """Get the version of an user, read it before loading the user."""
+
+        return cache.get(VERSION_KEY_PREFIX + str(user_id), 0)
+
+    def set(self, digest, payload, user, version):
+        """Store the verified user in both tiers until the token expires.
+
+        ``version`` was read before the user was loaded, a save in between
+        bumps it so the entry is ignored instead of pinning the old user.
+        """
+
+        timeout = int(payload['exp'] - time.time())
+        if timeout <= 0:
+            return
+        cache.set(TOKEN_KEY_PREFIX + digest, (user, version), timeout=timeout)
+        self.set_local(digest, user, payload['exp'])
+
+    def set_local(self, digest, user, exp):
+        """Store the user in process memory tier."""
+
+        expires_at = min(exp, time.time() + self.local_ttl)
+        with self._lock:
+            self._entries[digest] = (user, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of an user."""
+
+        key = VERSION_KEY_PREFIX + str(user_id)
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+        with self._lock:
+            for digest, (user, _) in list(self._entries.items()):
+                if user.id == user_id:
+                    del self._entries[digest]
+
+    def clear(self):
+        """Clear the process memory tier."""
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get hit and miss counters of all workers."""
+
+        counters = metrics.snapshot('token_cache.')
+        hits = (counters.get('token_cache.local_hit', 0) +
+                counters.get('token_cache.shared_hit', 0))
+        counters['token_cache.hit_ratio'] = metrics.ratio(
+            hits, counters.get('token_cache.miss', 0))
+        return counters
+
+
+token_cache = VerifiedTokenCache()
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Signal handler drops cached tokens when an user changes."""
+
+    token_cache.invalidate_user(instance.pk)
@@ -0,0 +1,113 @@
+"""Whoosh backend serving blue/green index generations."""
+import os
+import shutil
+import uuid
+from datetime import datetime
+
+from haystack.backends.whoosh_backend import WhooshEngine, WhooshSearchBackend
+
+# File under the index root naming the generation searches are served from.
+ACTIVE_FILE = 'ACTIVE'
+GENERATION_PREFIX = 'gen-'
+
+
+def new_generation():
+    """Name a new generation, names sort by creation time."""
+
+    return '%s%s-%s' % (
+        GENERATION_PREFIX, datetime.utcnow().strftime('%Y%m%d%H%M%S%f'), uuid.uuid4().hex[:6])
+
+
+def generation_path(root, generation):
+    """Directory of a generation, the root itself before the first swap."""
+
+    return os.path.join(root, generation) if generation else root
+
+
+def active_generation(root):
+    """Get the active generation or None when no swap happened yet."""
+
+    try:
+        with open(os.path.join(root, ACTIVE_FILE)) as active:
+            return active.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def activate(root, generation):
+    """Point searches of every worker to a generation atomically."""
+
+    temp_path = os.path.join(root, '.%s.%s' % (ACTIVE_FILE, uuid.uuid4().hex))
+    with open(temp_path, 'w') as active:
+        active.write(generation)
+        active.flush()
+        os.fsync(active.fileno())
+    os.replace(temp_path, os.path.join(root, ACTIVE_FILE))
+
+
+def collect_garbage(root, keep=2):
+    """Remove generations but the active one and the newest ``keep``.
+
+    Only generation directories are removed, files of the index written
+    before the first swap are left as they are. Returns the removed
+    generations.
+    """
+
+    active = active_generation(root)
+    if active is None:
+        return []
+
+    names = sorted(name for name in os.listdir(root) if name.startswith(GENERATION_PREFIX))
+    kept = set(names[-keep:]) if keep else set()
+    kept.add(active)
+    removed = [name for name in names if name not in kept]
+    for name in removed:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return removed
+
+
+class GenerationalWhooshSearchBackend(WhooshSearchBackend):
+    """Whoosh backend reading the generation named by the ``ACTIVE`` file.
+
+    ``PATH`` is the root holding one directory per generation. Workers pick
+    a new active generation up on their next query.
+    """
+
+    def __init__(self, connection_alias, **connection_options):
+        """Initialize."""
+
+        self.generation = None
+        self.pinned = False
+        super(GenerationalWhooshSearchBackend, self).__init__(
+            connection_alias, **connection_options)
+        self.root = self.path
+        self.connection_options = connection_options
+
+    @property
+    def setup_complete(self):
+        # Every backend method reads this before using the index, so a
+        # swap makes the next call open the new generation.
+        if not self.pinned:
+            generation = active_generation(self.root)
+            if generation != self.generation:
+                self.generation = generation
+                self.path = generation_path(self.root, generation)
+                self._setup_complete = False
+        return self._setup_complete
+
+    @setup_complete.setter
+    def setup_complete(self, value):
+        self._setup_complete = value
+
+    def for_generation(self, generation):
+        """Get a backend writing a generation whether it is active or not."""
+
+        backend = type(self)(self.connection_alias, **self.connection_options)
+        backend.pinned = True
+        backend.generation = generation
+        backend.path = generation_path(self.root, generation)
+        return backend
+
+
+class GenerationalWhooshEngine(WhooshEngine):
+    backend = GenerationalWhooshSearchBackend
@@ -6,27 +6,52 @@ from tastypie.resources import ModelResource
 from tastypie.authorization import Authorization
 from tastypie.utils import trailing_slash
 
-from haystack.query import SearchQuerySet
-
 from ..commons.authentication import AccessTokenAuthentication
+from ..commons.bulk import BulkWriteMixin
 from ..commons.custom_exception import CustomBadRequest
+from ..commons.identity_map import identity_map
+from ..commons.conditional import ConditionalGetMixin
+from ..commons.fieldsets import SparseFieldsMixin
+from ..commons.pagination import CursorPaginator
+from ..commons.search import StoredFieldsMixin, TypeaheadMixin, contains, search_queryset
+from ..commons.search_cache import normalize_query
+from ..commons.streaming import StreamingListMixin
 from .models import Contact
 
 
-class ContactResource(ModelResource):
+class ContactResource(BulkWriteMixin, StreamingListMixin, ConditionalGetMixin,
+                      SparseFieldsMixin, StoredFieldsMixin, TypeaheadMixin, ModelResource):
     """Contact model resources"""
 
+    typeahead_field = 'username_auto'
+    typeahead_display = 'username'
+    search_sparse_fields = {'user': ('user_id', 'username')}
+    bulk_fields = ('address', 'user')
+
     class Meta(object):
         """Contact model resource meta data."""
 
         queryset = Contact.objects.all()
         fields = ['address']
-        allowed_methods = ['get', 'post', 'put', 'delete']
+        allowed_methods = ['get', 'post', 'put', 'patch', 'delete']
         resource_name = 'contact'
         authentication = AccessTokenAuthentication()
         authorization = Authorization()
         always_return_data = True
         include_resource_uri = False
+        paginator_class = CursorPaginator
+
+    def search_result_data(self, result):
+        """List representation of a contact from its stored fields."""
+
+        return {
+            'id': int(result.pk),
+            'address': result.address,
+            'user': {
+                'id': result.user_id,
+                'username': result.username
+            }
+        }
 
     def prepend_urls(self):
         """Api urls."""
@@ -34,7 +59,8 @@ class ContactResource(ModelResource):
         return [
             url(r"^(?P<resource_name>%s)/search%s$" %
                 (self._meta.resource_name, trailing_slash()),
-                self.wrap_view('search'), name="api_search_contact")
+                self.wrap_view('search'), name="api_search_contact"),
+            self.typeahead_url(),
         ]
 
     def search(self, request, **kwargs):
@@ -44,11 +70,11 @@ class ContactResource(ModelResource):
         self._meta.authentication.is_authenticated(request)
         self.throttle_check(request)
 
-        q = str(request.GET.get('q', ''))
-        sqs = SearchQuerySet().filter(username__contains=q).models(Contact).load_all()
+        q = normalize_query(request.GET.get('q', ''))
+        sqs = contains(search_queryset(Contact), 'username', q)
 
         self.log_throttled_access(request)
-        return self.paginator(request, sqs)
+        return self.cached_search(request, q, sqs)
 
     def obj_create(self, bundle, **kwargs):
         """Customize api create new."""
@@ -68,9 +94,8 @@ class ContactResource(ModelResource):
                 error_message='Can not get data from request')
 
         try:
-            user_email = bundle.request.user
-            user_assign = User.objects.get(email=user_email)
-            user_target = User.objects.get(pk=user_target_id)
+            user_assign = identity_map.get(User, bundle.request.user.pk)
+            user_target = identity_map.get(User, user_target_id)
         except User.DoesNotExist:
             raise CustomBadRequest(
                 error_type='Database',
@@ -88,26 +113,3 @@ class ContactResource(ModelResource):
                 error_type='Database',
                 error_message='Can not create contact')
         return bundle
-
-    def paginator(self, request, objects, **kwargs):
-        """Helper function to paginator result list."""
-
-        paginator = self._meta.paginator_class(
-            request.GET,
-            objects,
-            resource_uri=self.get_resource_uri(),
-            limit=self._meta.limit,
-            max_limit=self._meta.max_limit,
-            collection_name=self._meta.collection_name)
-        to_be_serialized = paginator.page()
-
-        # Dehydrate the bundles in preparation for serialization.
-        bundles = [self.full_dehydrate(
-            self.build_bundle(obj=obj.object, request=request),
-            for_list=True)
-            for obj in to_be_serialized[self._meta.collection_name]]
-
-        to_be_serialized[self._meta.collection_name] = [
-            self.full_dehydrate(bundle) for bundle in bundles]
-        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
-        return self.create_response(request, to_be_serialized)
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contact',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
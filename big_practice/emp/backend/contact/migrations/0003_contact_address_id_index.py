@@ -0,0 +1,17 @@
+# Generated by Django 2.0 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0002_contact_modified_date_auto_now'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['address', 'id'], name='contact_con_address_422613_idx'),
+        ),
+    ]
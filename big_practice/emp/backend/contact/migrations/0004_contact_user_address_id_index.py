@@ -0,0 +1,17 @@
+# Generated by Django 2.0 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0003_contact_address_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['user', 'address', 'id'], name='contact_con_user_id_2fd0c1_idx'),
+        ),
+    ]
@@ -5,6 +5,12 @@ from django.conf import settings
 class Contact(models.Model):
     class Meta:
         ordering = ['address']
+        indexes = [
+            # Keyset pages of CursorPaginator
+            models.Index(fields=['address', 'id']),
+            # Contacts of a user in their default order
+            models.Index(fields=['user', 'address', 'id']),
+        ]
 
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -20,7 +26,7 @@ class Contact(models.Model):
         null=True
     )
     created_date = models.DateTimeField(auto_now_add=True)
-    modified_date = models.DateTimeField(auto_now_add=True)
+    modified_date = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         models.SET_NULL,
@@ -1,4 +1,6 @@
 from haystack import indexes
+
+from ..commons.database_search import DatabaseIndex, register
 from .models import Contact
 
 
@@ -7,10 +9,31 @@ class ContactIndex(indexes.SearchIndex, indexes.Indexable):
 
     text = indexes.CharField(document=True)
     username = indexes.CharField(model_attr='user__username')
+    # Stored only, search result pages are built from them
+    address = indexes.CharField(model_attr='address', null=True, indexed=False)
+    user_id = indexes.IntegerField(model_attr='user_id', null=True, indexed=False)
+    # Edge n-grams of the username answer typeahead prefixes
+    username_auto = indexes.EdgeNgramField(model_attr='user__username')
+    # N-grams of the username answer substring searches
+    username_ngram = indexes.NgramField(model_attr='user__username')
 
     def get_model(self):
         return Contact
 
     def index_queryset(self, using=None):
         """Used when the entire index for model is updated."""
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('user').only(
+            'address', 'user', 'user__username')
+
+
+@register
+class ContactDatabaseIndex(DatabaseIndex):
+    """ContactIndex served by PostgreSQL."""
+
+    model = Contact
+    fields = {
+        'address': 'address',
+        'username': 'user__username',
+        'user_id': 'user_id'
+    }
+    prefix_fields = ('user__username',)
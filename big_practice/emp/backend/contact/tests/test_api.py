@@ -9,9 +9,11 @@ import jwt
 from ..models import Contact
 from backend.account.models import Employee
 from backend.commons.constants import JWT_AUTH
+from backend.commons.indexing import update_objects
+from backend.commons.testing import QueryBudgetMixin, QueryPlanMixin
 
 
-class ContactResourceTestCase(ResourceTestCaseMixin, TestCase):
+class ContactResourceTestCase(QueryPlanMixin, QueryBudgetMixin, ResourceTestCaseMixin, TestCase):
     """Test suite for the api Contact."""
 
     def setUp(self):
@@ -62,6 +64,18 @@ class ContactResourceTestCase(ResourceTestCaseMixin, TestCase):
             authentication=self.get_credentials()
         ))
 
+    def test_api_search_contact_by_substring(self):
+        """Test the api search contact match the middle of usernames."""
+
+        contact = Contact.objects.create(user=self.user, address='604 Nui Thanh')
+        update_objects(Contact, [contact])
+        response = self.api_client.get(
+            '/api/v1/contact/search?q=ttest@unit',
+            format='json',
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertEqual(len(self.deserialize(response)['objects']), 1)
+
     def test_api_create_new_contact(self):
         """Test the api create new contact."""
 
@@ -76,6 +90,48 @@ class ContactResourceTestCase(ResourceTestCaseMixin, TestCase):
         # Verify a new one has been added.
         self.assertEqual(Contact.objects.count(), 1)
 
+    def test_api_create_contact_reuses_authenticated_user(self):
+        """Test the api create contact read the request user only once."""
+
+        with self.assertLogs('backend.commons.identity_map', 'DEBUG') as logs:
+            self.assertHttpCreated(self.api_client.post(
+                '/api/v1/contact/',
+                format='json',
+                data=self.post_data,
+                authentication=self.get_credentials()))
+        self.assertIn('POST /api/v1/contact/: 2 queries saved', logs.output[0])
+        self.assertEqual(Contact.objects.get().created_by, self.user)
+
+    def create_contacts(self, count):
+        for number in range(Contact.objects.count(), count):
+            Contact.objects.create(
+                user=self.user, created_by=self.user, address='%d Nui Thanh' % number)
+
+    def test_api_contact_query_budget(self):
+        """Test the api contact list and detail cost the same queries at any size."""
+
+        self.create_contacts(1)
+        for uri in ['/api/v1/contact/?limit=100',
+                    '/api/v1/contact/%d/' % Contact.objects.get().pk]:
+            self.assertQueryCountConstant(self.create_contacts, lambda: self.api_client.get(
+                uri, format='json', authentication=self.get_credentials()))
+
+    def test_api_contact_queries_use_indexes(self):
+        """Test the api contact pages and the contacts of a user use indexes."""
+
+        self.create_contacts(30)
+        # SQLite sorts a first page to put null addresses last
+        page = self.deserialize(self.api_client.get(
+            '/api/v1/contact/?cursor=&limit=10', format='json', authentication=self.get_credentials()))
+
+        def run():
+            for uri in [page['meta']['next'], '/api/v1/contact/%d/' % Contact.objects.last().pk]:
+                self.assertHttpOK(self.api_client.get(
+                    uri, format='json', authentication=self.get_credentials()))
+            list(Contact.objects.filter(user=self.user)[:10])
+
+        self.assertNoSequentialScans(run)
+
     def test_api_get_detail_unauthenticated(self):
         """Test the api get detail with unauthenticated."""
 
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from backend.commons.migration_sql import create_extension, vendor_sql
+
+# GIN indexes answering search queries when SEARCH_BACKEND is postgres. The
+# expressions are the ones Django generates for icontains and
+# DatabaseIndex.autocomplete lookups.
+FORWARDS = {'postgresql': [
+    'CREATE INDEX department_department_name_trgm '
+    'ON department_department USING gin (UPPER(name::text) gin_trgm_ops)',
+    'CREATE INDEX department_department_name_tsv ON department_department '
+    "USING gin (to_tsvector('simple'::regconfig, COALESCE(name, '')))",
+]}
+BACKWARDS = {'postgresql': [
+    'DROP INDEX IF EXISTS department_department_name_trgm',
+    'DROP INDEX IF EXISTS department_department_name_tsv',
+]}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('department', '0001_initial'),
+    ]
+
+    operations = [
+        # Trigram operator classes of the indexes, kept on the way back
+        migrations.RunPython(create_extension('pg_trgm'), migrations.RunPython.noop),
+        migrations.RunPython(vendor_sql(FORWARDS), vendor_sql(BACKWARDS)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.0 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('department', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='department',
+            name='modified_date',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.0 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('department', '0003_department_modified_date_auto_now'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['name', 'id'], name='department__name_d20dca_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from haystack import indexes
+
+from ..commons.database_search import DatabaseIndex, register
 from .models import Department
 
 
@@ -7,10 +9,25 @@ class DepartmentIndex(indexes.SearchIndex, indexes.Indexable):
 
     text = indexes.CharField(document=True)
     name = indexes.CharField(model_attr='name')
+    # Edge n-grams of the name answer typeahead prefixes
+    name_auto = indexes.EdgeNgramField(model_attr='name')
+    # N-grams of the name answer substring searches
+    name_ngram = indexes.NgramField(model_attr='name')
 
     def get_model(self):
         return Department
 
     def index_queryset(self, using=None):
         """Used when the entire index for model is updated."""
-        return self.get_model().objects.all()
+        return self.get_model().objects.only('name')
+
+
+@register
+class DepartmentDatabaseIndex(DatabaseIndex):
+    """DepartmentIndex served by PostgreSQL."""
+
+    model = Department
+    fields = {
+        'name': 'name'
+    }
+    vector_fields = ('name',)
@@ -1,16 +1,31 @@
 from datetime import datetime, timedelta
+import json
+import time
+from unittest import mock
 
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
 from django.contrib.auth.models import User
 from tastypie.test import ResourceTestCaseMixin
 
+from haystack import connections as haystack_connections
 import jwt
 
+from ..models import Department
 from backend.account.models import Employee
+from backend.commons import metrics
+from backend.commons.bulk import bulk_update
+from backend.commons.indexing import get_index, update_objects
+from backend.commons.pagination import encode_cursor
+from backend.commons.search_cache import search_cache
+from backend.commons.search_queue import search_queue
+from backend.commons.testing import QueryBudgetMixin, QueryPlanMixin
 from backend.commons.constants import JWT_AUTH
 
 
-class DepartmentResourceTestCase(ResourceTestCaseMixin, TestCase):
+class DepartmentResourceTestCase(QueryPlanMixin, QueryBudgetMixin, ResourceTestCaseMixin, TestCase):
     """Test suite for the api Department."""
 
     def setUp(self):
@@ -69,3 +84,329 @@ class DepartmentResourceTestCase(ResourceTestCaseMixin, TestCase):
             format='json',
             authentication=self.get_credentials()
         ))
+
+    def test_api_typeahead_department_by_prefix(self):
+        """Test the api typeahead answer prefixes from the index only."""
+
+        haystack_connections['default'].get_backend().clear()
+        Department.objects.create(name='Engineering')
+        Department.objects.create(name='Marketing')
+        update_objects(Department, Department.objects.all())
+
+        # Warm the access token cache, typeahead itself never hits the database
+        self.test_api_can_search_department_by_name()
+        with self.assertNumQueries(0):
+            response = self.api_client.get(
+                '/api/v1/department/typeahead/?q=eng',
+                format='json',
+                authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertEqual(
+            [obj['name'] for obj in self.deserialize(response)['objects']],
+            ['Engineering'])
+
+    def test_api_typeahead_ignore_short_prefix(self):
+        """Test the api typeahead return nothing for one letter."""
+
+        response = self.api_client.get(
+            '/api/v1/department/typeahead/?q=e',
+            format='json',
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertEqual(self.deserialize(response)['objects'], [])
+
+    @override_settings(SEARCH_BACKEND='postgres')
+    def test_api_search_department_on_database_backend(self):
+        """Test the api search department query the database when selected."""
+
+        Department.objects.create(name='Engineering')
+        Department.objects.create(name='Marketing')
+
+        response = self.api_client.get(
+            '/api/v1/department/search?q=ineer',
+            format='json',
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertEqual(
+            [obj['name'] for obj in self.deserialize(response)['objects']],
+            ['Engineering'])
+
+    def test_api_search_department_cached_until_index_changes(self):
+        """Test the api search department cache pages until reindexing."""
+
+        def search():
+            response = self.api_client.get(
+                '/api/v1/department/search?q=esear',
+                format='json',
+                authentication=self.get_credentials())
+            self.assertHttpOK(response)
+            return sorted(obj['name'] for obj in self.deserialize(response)['objects'])
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Department, [Department.objects.create(name='Research')])
+        self.assertEqual(search(), ['Research'])
+
+        # Indexed behind the back of the cache, the cached page is served
+        other = Department.objects.create(name='Researchers')
+        haystack_connections['default'].get_backend().update(
+            get_index(Department), [other])
+        self.assertEqual(search(), ['Research'])
+        self.assertGreaterEqual(
+            metrics.snapshot('search_cache.department.search.hit').get(
+                'search_cache.department.search.hit'), 1)
+
+        # Index updates bump the generation of the model
+        update_objects(Department, [other])
+        self.assertEqual(search(), ['Research', 'Researchers'])
+
+    @override_settings(SEARCH_BACKEND='postgres')
+    def test_renamed_department_invalidates_employee_pages(self):
+        """Test renaming a department queues its employees and bumps their pages."""
+
+        department = Department.objects.create(name='Research')
+        self.employee.department = department
+        self.employee.save()
+        search_queue.redis.delete(search_queue.key)
+        self.addCleanup(search_queue.redis.delete, search_queue.key)
+        generation = search_cache.generation('account.employee')
+
+        with mock.patch('backend.commons.signal_processors.transaction.on_commit',
+                        side_effect=lambda push: push()):
+            department.name = 'Development'
+            department.save()
+            # Signing in saves last_login only, stored in no index
+            self.user.save(update_fields=['last_login'])
+
+        queued = [json.loads(item.decode('utf-8'))
+                  for item in search_queue.redis.lrange(search_queue.key, 0, -1)]
+        self.assertEqual(
+            sorted((item['model'], item['pk']) for item in queued),
+            [('account.employee', self.employee.pk), ('department.department', department.pk)])
+        self.assertNotEqual(search_cache.generation('account.employee'), generation)
+
+    def create_departments(self, count):
+        for number in range(Department.objects.count(), count):
+            Department.objects.create(name='Department %d' % number)
+
+    def test_api_department_query_budget(self):
+        """Test the api department list and detail cost the same queries at any size."""
+
+        self.create_departments(1)
+        for uri in ['/api/v1/department/?limit=100',
+                    '/api/v1/department/%d/' % Department.objects.get().pk]:
+            self.assertQueryCountConstant(self.create_departments, lambda: self.api_client.get(
+                uri, format='json', authentication=self.get_credentials()))
+
+    def test_api_department_bulk_update_query_budget(self):
+        """Test the api department bulk rename cost the same queries at any size."""
+
+        def rename():
+            return self.api_client.patch(
+                '/api/v1/department/', format='json', authentication=self.get_credentials(),
+                data={'objects': [{'id': department.pk, 'name': 'Renamed %d' % department.pk}
+                                  for department in Department.objects.all()]})
+
+        self.assertQueryCountConstant(self.create_departments, rename)
+        department = Department.objects.order_by('pk').last()
+        self.assertEqual(department.name, 'Renamed %d' % department.pk)
+        self.assertEqual(department.modified_by, self.user)
+
+    def test_api_department_bulk_write_invalid_payload(self):
+        """Test the api department bulk write report invalid items and write nothing."""
+
+        self.create_departments(2)
+        first, second = Department.objects.order_by('pk')
+        response = self.api_client.patch(
+            '/api/v1/department/', format='json', authentication=self.get_credentials(),
+            data={'objects': [{'id': first.pk, 'name': 'Kept'},
+                              {'name': 'x' * 101},
+                              {'id': first.pk, 'name': 'Twice'},
+                              {'title': 'Unknown'}],
+                  'deleted_objects': [second.pk, 0]})
+        self.assertHttpBadRequest(response)
+        data = self.deserialize(response)
+        self.assertEqual(data['error']['code'], 406)
+        self.assertEqual([item['status'] for item in data['objects']],
+                         ['valid', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('name', data['objects'][1]['errors'])
+        self.assertEqual(data['objects'][2]['errors'], {'id': 'Duplicated in the payload.'})
+        self.assertEqual(data['objects'][3]['errors'], {'title': 'Unknown field.'})
+        self.assertEqual(data['deleted_objects'],
+                         [{'status': 'valid'}, {'status': 'invalid', 'errors': {'id': 'Does not exist.'}}])
+        self.assertEqual(Department.objects.count(), 2)
+        self.assertEqual(Department.objects.get(pk=first.pk).name, first.name)
+
+    def test_api_department_bulk_write_missing_updated_row(self):
+        """Test the api department bulk write reject updates of rows gone meanwhile."""
+
+        self.create_departments(2)
+        first, second = Department.objects.order_by('pk')
+
+        def delete_then_update(model, objs, fields):
+            # The row is deleted after it was validated
+            Department.objects.filter(pk=second.pk).delete()
+            return bulk_update(model, objs, fields)
+
+        with mock.patch('backend.commons.bulk.bulk_update', side_effect=delete_then_update):
+            response = self.api_client.patch(
+                '/api/v1/department/', format='json', authentication=self.get_credentials(),
+                data={'objects': [{'id': first.pk, 'name': 'Renamed'},
+                                  {'id': second.pk, 'name': 'Renamed'}]})
+        self.assertHttpBadRequest(response)
+        self.assertEqual(Department.objects.count(), 2)
+        self.assertEqual(Department.objects.get(pk=first.pk).name, first.name)
+
+    def test_api_department_cursor_pages(self):
+        """Test the api department cursor pages walk every row once in order."""
+
+        for name in ['Sales', None, 'Marketing', 'Sales', None, 'Engineering', 'Sales']:
+            Department.objects.create(name=name)
+
+        uri, names = '/api/v1/department/?limit=2&cursor=', []
+        while uri:
+            response = self.api_client.get(uri, format='json', authentication=self.get_credentials())
+            self.assertHttpOK(response)
+            data = self.deserialize(response)
+            self.assertNotIn('total_count', data['meta'])
+            names.extend(obj['name'] for obj in data['objects'])
+            uri = data['meta']['next']
+        self.assertEqual(names, ['Engineering', 'Marketing', 'Sales', 'Sales', 'Sales', None, None])
+
+        # Offset pages are still served without a cursor
+        response = self.api_client.get(
+            '/api/v1/department/?limit=2&offset=2', format='json',
+            authentication=self.get_credentials())
+        self.assertEqual(self.deserialize(response)['meta']['total_count'], 7)
+
+        for cursor in ['garbage', encode_cursor({'keyset': 1}), encode_cursor({'keyset': ['a']}),
+                       encode_cursor({'keyset': [{'name': 'a'}, 1]}),
+                       encode_cursor({'keyset': ['Sales', 'a']}), encode_cursor([1])]:
+            self.assertHttpBadRequest(self.api_client.get(
+                '/api/v1/department/?cursor=' + cursor, format='json',
+                authentication=self.get_credentials()))
+
+    def test_api_department_deep_cursor_page_is_index_range(self):
+        """Test the api department read deep cursor pages as index ranges."""
+
+        departments = [Department.objects.create(name='Team %03d' % index) for index in range(50)]
+        uri = '/api/v1/department/?limit=5&cursor=' + encode_cursor(
+            {'keyset': [departments[40].name, departments[40].pk]})
+
+        def get():
+            response = self.api_client.get(uri, format='json', authentication=self.get_credentials())
+            self.assertHttpOK(response)
+            self.assertEqual([obj['name'] for obj in self.deserialize(response)['objects']],
+                             [department.name for department in departments[41:46]])
+
+        self.assertNoSequentialScans(get)
+        with CaptureQueriesContext(connection) as context:
+            get()
+        self.assertIndexRange([query['sql'] for query in context.captured_queries
+                               if 'department_department' in query['sql']][-1])
+
+    def test_api_search_department_cursor_pages(self):
+        """Test the api search department pages results with cursors."""
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Department, [
+            Department.objects.create(name='Research %d' % number) for number in range(3)])
+
+        uri, names = '/api/v1/department/search?q=resea&limit=2&cursor=', []
+        while uri:
+            data = self.deserialize(self.api_client.get(
+                uri, format='json', authentication=self.get_credentials()))
+            names.extend(obj['name'] for obj in data['objects'])
+            uri = data['meta']['next']
+        self.assertEqual(sorted(names), ['Research 0', 'Research 1', 'Research 2'])
+
+        for cursor in [encode_cursor({'offset': 'a'}), encode_cursor({'offset': -2})]:
+            self.assertHttpBadRequest(self.api_client.get(
+                '/api/v1/department/search?q=resea&cursor=' + cursor, format='json',
+                authentication=self.get_credentials()))
+
+    @override_settings(STREAM_CHUNK_SIZE=2)
+    def test_api_department_list_streamed(self):
+        """Test the api department stream lists as JSON and NDJSON."""
+
+        for number in range(5):
+            Department.objects.create(name='Department %d' % number)
+
+        response = self.api_client.get(
+            '/api/v1/department/?stream=json&offset=1&limit=3',
+            format='json', authentication=self.get_credentials())
+        self.assertTrue(response.streaming)
+        # Rows are read in a transaction, without holding the cursor
+        with mock.patch('backend.commons.streaming.transaction.atomic',
+                        wraps=transaction.atomic) as atomic:
+            data = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        atomic.assert_called_once_with(using='default')
+        self.assertEqual(data['meta'], {'limit': 3, 'offset': 1})
+        self.assertEqual([obj['name'] for obj in data['objects']],
+                         ['Department 1', 'Department 2', 'Department 3'])
+
+        haystack_connections['default'].get_backend().clear()
+        update_objects(Department, Department.objects.all())
+        response = self.api_client.get(
+            '/api/v1/department/search?q=depa&stream=ndjson&offset=3',
+            format='json', authentication=self.get_credentials())
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2)
+        for line in lines:
+            self.assertTrue(json.loads(line)['name'].startswith('Department '))
+
+        self.assertHttpBadRequest(self.api_client.get(
+            '/api/v1/department/?stream=xml', format='json',
+            authentication=self.get_credentials()))
+
+    def test_api_department_detail_not_modified(self):
+        """Test the api answer 304 for a department not modified since."""
+
+        department = Department.objects.create(name='Engineering')
+        uri = '/api/v1/department/%d/' % department.pk
+        response = self.api_client.get(uri, format='json', authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = self.api_client.get(
+            uri, format='json', authentication=self.get_credentials(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        # Saves update modified_date and so the ETag
+        department.name = 'Research'
+        department.save()
+        response = self.api_client.get(
+            uri, format='json', authentication=self.get_credentials(), HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(response)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.deserialize(response)['name'], 'Research')
+
+    def test_api_department_list_not_modified(self):
+        """Test the api answer 304 for an unchanged page of departments."""
+
+        first = Department.objects.create(name='Engineering')
+
+        def get_list(**headers):
+            return self.api_client.get(
+                '/api/v1/department/?limit=10', format='json',
+                authentication=self.get_credentials(), **headers)
+
+        response = get_list()
+        etag = response['ETag']
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(get_list(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Department.objects.create(name='Marketing')
+        response = get_list(HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(response)
+        self.assertEqual(len(self.deserialize(response)['objects']), 2)
+
+        # Deleting changes the count even when the latest date is the same
+        etag = response['ETag']
+        first.delete()
+        self.assertHttpOK(get_list(HTTP_IF_NONE_MATCH=etag))
+        # Clients revalidating with dates only get the list again
+        self.assertHttpOK(get_list(HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)))
@@ -71,12 +71,14 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'backend.commons.replicas.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'backend.commons.identity_map.IdentityMapMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -114,6 +116,24 @@ DATABASES = {
     }
 }
 
+# Read replicas, see backend.commons.replicas
+# ------------------------------------------------------------
+# Reads of GET requests go to the databases of DATABASE_REPLICA_URLS, named
+# replica1, replica2... Any second database works locally, for instance
+# DATABASE_REPLICA_URLS=postgres://postgres@localhost/python-training-replica
+# after migrate --database replica1.
+DATABASE_ROUTERS = ['backend.commons.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+for index, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    DATABASES['replica%d' % index] = dict(env.db_url_config(url), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append('replica%d' % index)
+# Seconds of lag above which a replica is skipped, and seconds between two
+# measures of the lag of a replica by a worker.
+DATABASE_REPLICA_MAX_LAG = 5
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = 2
+# Seconds the reads of a user go to the primary after they wrote.
+DATABASE_REPLICA_PIN_SECONDS = 10
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -160,12 +180,34 @@ USE_TZ = True
 # HAYSTACK settings
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
+        # PATH holds one index directory per generation, see rebuild_search_index --swap.
+        'ENGINE': 'backend.commons.whoosh_backend.GenerationalWhooshEngine',
         'PATH': os.path.join(os.path.dirname(__file__), 'whoosh_index'),
     },
 }
 
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# Backend answering search, young and typeahead endpoints: 'haystack' or
+# 'postgres' to query the database through its GIN indexes.
+SEARCH_BACKEND = 'haystack'
+# Seconds a serialized search page is cached, entries are invalidated sooner
+# whenever the index of their model changes.
+SEARCH_CACHE_TTL = 300
+
+# Saves are queued and indexed in batches by manage.py process_search_queue.
+HAYSTACK_SIGNAL_PROCESSOR = 'backend.commons.signal_processors.QueuedSignalProcessor'
+SEARCH_QUEUE_BATCH_SIZE = 500
+# Seconds the queue worker waits when the queue is empty.
+SEARCH_QUEUE_POLL_INTERVAL = 1
+# Seconds a queue worker counts as alive after it last polled, the batch of
+# a worker silent for longer is requeued. Longer than a batch takes.
+SEARCH_QUEUE_CONSUMER_TIMEOUT = 60
+# Seconds a batch waits for the Whoosh index lock before it is requeued.
+SEARCH_INDEX_WRITER_TIMEOUT = 10
+# Rows per primary key range and processes of manage.py rebuild_search_index.
+SEARCH_REBUILD_CHUNK_SIZE = 2000
+SEARCH_REBUILD_WORKERS = 4
+# Index generations kept on disk after a swap, the active one included.
+SEARCH_INDEX_GENERATIONS_KEEP = 2
 
 # AWS setting assets
 AWS_ACCESS_KEY_ID = env("AWS_ACCESS_KEY_ID")
@@ -189,6 +231,8 @@ DEFAULT_FILE_STORAGE = 'backend.commons.storage_backends.MediaStorage'
 
 # Caching data
 # ------------------------------------------------------------
+# A single Redis node, not a cluster: Lua scripts like the age buckets move
+# build keys from stored values.
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
@@ -201,5 +245,113 @@ CACHES = {
 # Cache time to live is 2 minutes.
 CACHE_TTL = 60 * 2
 
+# Application cache, see backend.commons.tiered_cache
+# ------------------------------------------------------------
+APP_CACHE_LOCAL_MAX_SIZE = 1024
+# Seconds a worker serves its local entry without asking Redis, the bound
+# on staleness when an invalidation message is lost.
+APP_CACHE_LOCAL_TTL = 5
+# Seconds expired values are kept to be served while one worker recomputes.
+APP_CACHE_STALE_TTL = 30
+# Seconds a worker may hold the recompute lock of a key.
+APP_CACHE_LOCK_TIMEOUT = 10
+# Seconds the invalidation version of a key is kept, longer than any compute.
+APP_CACHE_VERSION_TTL = 60 * 60
+# Above 1 values are refreshed earlier before they expire.
+APP_CACHE_EARLY_REFRESH_BETA = 1.0
+
 # Tastypie settings
 TASTYPIE_ALLOW_MISSING_SLASH = True
+# Rows read at a time and at most by lists requested with ?stream=json|ndjson.
+STREAM_CHUNK_SIZE = 2000
+STREAM_MAX_ROWS = 100000
+# Objects a bulk PATCH, PUT or DELETE of a list may hold, and rows written
+# per INSERT or UPDATE statement.
+BULK_WRITE_MAX_OBJECTS = 5000
+BULK_WRITE_BATCH_SIZE = 500
+
+# Metrics counters are pushed to the cache every 10 seconds.
+METRICS_FLUSH_INTERVAL = 10
+
+# Verified access token cache
+# ------------------------------------------------------------
+TOKEN_CACHE_MAX_SIZE = 1024
+# Seconds a worker trusts its local entry before checking Redis again.
+TOKEN_CACHE_LOCAL_TTL = 5
+
+# Access token revocation list
+# ------------------------------------------------------------
+# Seconds between two pulls of revocations done by other workers.
+TOKEN_REVOCATION_SYNC_INTERVAL = 1
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
+# Revocations a lagging worker can catch up on before a full rebuild.
+TOKEN_REVOCATION_LOG_SIZE = 10000
+# Answer for tokens Redis can not check while it is unreachable. A hit of
+# the local bloom filter always counts as revoked; without a bloom filter
+# False lets signed, unexpired tokens in and True rejects every token.
+TOKEN_REVOCATION_FAIL_CLOSED = False
+
+# Password hashing
+# ------------------------------------------------------------
+# The first hasher is used for new hashes, users signing in with a hash of
+# another hasher or other scrypt parameters are rehashed transparently.
+PASSWORD_HASHERS = [
+    'backend.commons.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PASSWORD_SCRYPT_N = 2 ** 14
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+
+# Processes hashing passwords in each gunicorn worker, 0 hashes inline.
+PASSWORD_HASHING_WORKERS = 2
+# Hashing operations waiting or running before new ones are rejected.
+PASSWORD_HASHING_MAX_QUEUE = 8
+PASSWORD_HASHING_TIMEOUT = 5
+
+# Bulk employee import and export
+# ------------------------------------------------------------
+EMPLOYEE_IMPORT_CHUNK_SIZE = 500
+# Processes hashing the passwords of an import.
+EMPLOYEE_IMPORT_HASHING_WORKERS = 4
+# Rows fetched at a time from the server side cursor of an export, and
+# bytes written at a time to the response or file.
+EMPLOYEE_EXPORT_FETCH_SIZE = 2000
+EMPLOYEE_EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Typeahead endpoints
+# ------------------------------------------------------------
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MIN_LENGTH = 2
+# Calls slower than this are counted in the typeahead.<resource>.over_budget metric.
+TYPEAHEAD_BUDGET_MS = 50
+
+# Logging
+# ------------------------------------------------------------
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'require_debug_true': {
+            '()': 'django.utils.log.RequireDebugTrue',
+        },
+    },
+    'handlers': {
+        'debug_console': {
+            'level': 'DEBUG',
+            'filters': ['require_debug_true'],
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # Queries saved by the identity map for each request.
+        'backend.commons.identity_map': {
+            'handlers': ['debug_console'],
+            'level': 'DEBUG',
+        },
+    },
+}
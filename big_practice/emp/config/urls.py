@@ -17,12 +17,14 @@ from django.contrib import admin
 from django.conf.urls import url, include
 from tastypie.api import Api
 
-from backend.account.api import EmployeeResource, AuthenticationResource
+from backend.account.api import (
+    EmployeeResource, EmployeeAnalyticsResource, AuthenticationResource)
 from backend.contact.api import ContactResource
 from backend.department.api import DepartmentResource
 
 v1_api = Api(api_name='v1')
 v1_api.register(EmployeeResource())
+v1_api.register(EmployeeAnalyticsResource())
 v1_api.register(ContactResource())
 v1_api.register(DepartmentResource())
 v1_api.register(AuthenticationResource())